@@ -0,0 +1,158 @@
+"""
+N chats llamando al LLM a la vez contra un servidor OpenAI falso en local.
+
+    python benchmarks/bench_llm_concurrency.py --chats 8 --delay 1.0
+
+El servidor tarda `--delay` segundos en cada /chat/completions. Con el
+cliente async y max_concurrency >= N, las N llamadas deberían terminar en
+~1 x delay en vez de N x delay. También comprueba el timeout por llamada,
+que cancelar la tarea corta la petición y que to_actions() resuelve N
+líneas con una sola petición (reintentando solo la que llega inválida).
+
+El servidor falso responde como el modo estricto de Structured Outputs:
+exige response_format con json_schema y rellena con null las claves que la
+acción no usa.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram_excel_bot.llm_transformer import ACTION_SCHEMA, LLMTransformer  # noqa: E402
+
+KEYS = ACTION_SCHEMA["schema"]["required"]
+
+
+def strict(action: dict) -> dict:
+    """Acción tal como la devuelve el modo estricto: todas las claves, null si no se usan."""
+    return {k: action.get(k) for k in KEYS}
+
+
+def make_stub(delay: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length", 0))
+            req = json.loads(self.rfile.read(length))
+            time.sleep(delay)
+            server.requests += 1
+            fmt = req.get("response_format") or {}
+            if fmt.get("type") != "json_schema" or not fmt["json_schema"].get("strict"):
+                server.unconstrained += 1
+
+            content = json.dumps(strict({"op": "last", "n": 3}))
+            try:
+                lines = json.loads(req["messages"][-1]["content"])
+            except ValueError:
+                lines = None
+            if isinstance(lines, list):
+                # lote: una acción por línea; la que dice "rota" sale inválida
+                content = json.dumps({"actions": [
+                    strict({"op": "last", "n": "x"} if "rota" in ln else {"op": "last", "n": i})
+                    for i, ln in enumerate(lines)
+                ]})
+
+            body = json.dumps({
+                "id": "stub",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "stub",
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            }).encode()
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # el cliente canceló
+                pass
+
+        def log_message(self, *args) -> None:
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 128
+
+    server = Server(("127.0.0.1", 0), Handler)
+    server.requests = 0
+    server.unconstrained = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def run(args: argparse.Namespace) -> None:
+    server = make_stub(args.delay)
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    llm = LLMTransformer(
+        api_key="stub", model="stub", base_url=base_url,
+        max_concurrency=args.concurrency, timeout=args.delay * 5,
+    )
+
+    t0 = time.perf_counter()
+    await llm.to_action("dame el 1")
+    one = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(llm.to_action(f"dame el {i}") for i in range(args.chats)))
+    many = time.perf_counter() - t0
+    assert all(r == {"op": "last", "n": 3} for r in results)
+
+    print(f"1 llamada:          {one:6.2f} s")
+    print(f"{args.chats} llamadas a la vez: {many:6.2f} s  (serie: ~{one * args.chats:.2f} s)")
+
+    # lote: N líneas, una de ellas inválida
+    lines = [f"línea {i}" for i in range(args.chats)]
+    lines[-1] = "línea rota"
+    server.requests = 0
+    t0 = time.perf_counter()
+    actions = await llm.to_actions(lines)
+    batch = time.perf_counter() - t0
+    assert actions[:-1] == [{"op": "last", "n": i} for i in range(args.chats - 1)]
+    assert actions[-1] == {"op": "last", "n": 3}
+    print(f"lote de {len(lines)} líneas:  {batch:6.2f} s  ({server.requests} peticiones)")
+    assert server.unconstrained == 0, "petición sin response_format json_schema estricto"
+
+    # timeout por llamada
+    short = LLMTransformer(api_key="stub", model="stub", base_url=base_url, timeout=args.delay / 4)
+    try:
+        await short.to_action("dame el 1")
+        print("timeout:      NO saltó")
+    except RuntimeError as e:
+        print(f"timeout:      {e}")
+
+    # cancelación
+    task = asyncio.create_task(llm.to_action("dame el 1"))
+    await asyncio.sleep(args.delay / 4)
+    t0 = time.perf_counter()
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        print(f"cancelación:  tarea cancelada en {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+    server.shutdown()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chats", type=int, default=8)
+    ap.add_argument("--delay", type=float, default=1.0)
+    ap.add_argument("--concurrency", type=int, default=8)
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
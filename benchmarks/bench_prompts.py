@@ -0,0 +1,132 @@
+"""
+Prompt completo frente a prompt por módulos: tokens y latencia.
+
+    python benchmarks/bench_prompts.py
+    python benchmarks/bench_prompts.py --phrases frases.txt
+    OPENAI_API_KEY=... python benchmarks/bench_prompts.py --live --model gpt-4o-mini
+
+Sin --live no llama a nada: clasifica cada frase (classify_intent) y cuenta
+los tokens del prompt de sistema que llevaría con y sin routing. Los tokens
+se cuentan con tiktoken si está instalado; si no, se estiman (~4 caracteres
+por token) y salen con "≈".
+
+Con --live manda todas las frases al LLM dos veces (routing apagado y
+encendido, sin caché) y saca de `LLMTransformer.usage` los prompt_tokens
+que factura el API y la latencia media por módulo. También cuenta cuántas
+frases dan una acción distinta con cada prompt.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram_excel_bot.llm_transformer import SYSTEM, LLMTransformer  # noqa: E402
+from telegram_excel_bot.prompts import build_prompt, classify_intent  # noqa: E402
+
+PHRASES = [
+    "dame el 3756",
+    "consulta el libro 120",
+    "muéstrame los datos del 44",
+    "busca por autor Platón",
+    "busca libros de la editorial Gredos",
+    "encuentra el libro que se titula 1984",
+    "dame todos los de Aristóteles",
+    "últimos 5",
+    "añade el libro La República de Platón, editorial Gredos, año 1988",
+    "registra un libro nuevo: Fedón, Platón, Alianza, fila 3 columna 2",
+    "da de alta El Banquete de Platón, procedencia donación",
+    "pon el 3 a año 2020",
+    "cambia el autor del libro 12 a Plotino",
+    "corrige la editorial del 77, es Cátedra",
+    "pon la columna 4 y fila 2 al libro 9",
+    "marca como revisado el 44",
+    "desmarca el 45 como revisado",
+    "añade un comentario al libro 5: falta la portada",
+    "2A-978-4-19-148410-4",
+    "borra el libro 12",
+    "elimina el de título Fedón",
+    "hola, ¿quién eres?",
+    "gracias por todo",
+    "qué tiempo hace hoy en Alejandría",
+]
+
+
+def token_counter():
+    try:
+        import tiktoken
+    except ImportError:
+        return (lambda text: len(text) // 4), "≈"
+    enc = tiktoken.get_encoding("o200k_base")
+    return (lambda text: len(enc.encode(text))), ""
+
+
+def offline(phrases: list[str]) -> None:
+    count, approx = token_counter()
+    full = count(SYSTEM)
+    intents = [classify_intent(p) for p in phrases]
+
+    print(f"{'frase':52} {'módulo':8} tokens")
+    routed_total = 0
+    for p, intent in zip(phrases, intents):
+        n = count(build_prompt([intent]))
+        routed_total += n
+        print(f"{p[:52]:52} {intent or 'full':8} {approx}{n}")
+
+    print()
+    print("módulos: " + ", ".join(f"{k or 'full'}={v}" for k, v in Counter(intents).most_common()))
+    print(f"prompt completo:   {approx}{full} tokens por frase, {approx}{full * len(phrases)} en total")
+    print(f"prompt por módulo: {approx}{routed_total // len(phrases)} tokens por frase de media, "
+          f"{approx}{routed_total} en total ({100 - 100 * routed_total // (full * len(phrases))}% menos)")
+
+
+async def live(args: argparse.Namespace, phrases: list[str]) -> None:
+    results = {}
+    for routing in (False, True):
+        llm = LLMTransformer(
+            api_key=os.environ["OPENAI_API_KEY"], model=args.model, base_url=args.base_url,
+            max_concurrency=args.concurrency, routing=routing,
+        )
+        actions = await asyncio.gather(*(llm.to_action(p) for p in phrases), return_exceptions=True)
+        results[routing] = actions
+
+        print("con routing" if routing else "sin routing (prompt completo)")
+        total = {"calls": 0, "prompt_tokens": 0, "seconds": 0.0}
+        for route, u in sorted(llm.usage.items()):
+            print(f"  {route:8} {u['calls']:3d} llamadas  {u['prompt_tokens'] / u['calls']:7.0f} prompt tokens  "
+                  f"{u['seconds'] / u['calls'] * 1000:7.0f} ms de media")
+            for k in total:
+                total[k] += u[k]
+        print(f"  total    {total['calls']:3d} llamadas  {total['prompt_tokens']:7d} prompt tokens  "
+              f"{total['seconds'] / max(1, total['calls']) * 1000:7.0f} ms de media")
+
+    differ = [p for p, a, b in zip(phrases, results[False], results[True]) if a != b]
+    print(f"acciones distintas: {len(differ)} de {len(phrases)}")
+    for p in differ:
+        print(f"  {p}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--phrases", help="fichero con una frase por línea")
+    ap.add_argument("--live", action="store_true", help="llamar al LLM de verdad (OPENAI_API_KEY)")
+    ap.add_argument("--model", default=os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
+    ap.add_argument("--base-url", default=None)
+    ap.add_argument("--concurrency", type=int, default=4)
+    args = ap.parse_args()
+
+    phrases = PHRASES
+    if args.phrases:
+        with open(args.phrases, "r", encoding="utf-8") as f:
+            phrases = [ln.strip() for ln in f if ln.strip()]
+
+    offline(phrases)
+    if args.live:
+        print()
+        asyncio.run(live(args, phrases))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Lecturas concurrentes: lock exclusivo para todo vs lock compartido para leer.
+
+    python benchmarks/bench_rwlock.py
+    python benchmarks/bench_rwlock.py --readers 1 2 4 8 --seconds 2 --hold-ms 5 --writer
+
+Cada lector es un proceso con su propio ExcelStore sobre el mismo Excel y
+hace get_by_id en bucle durante `--seconds`. `--hold-ms` alarga cada lectura
+dentro del lock (disco lento, tarjeta SD...) para que la espera por el lock
+se vea aunque la máquina tenga un solo núcleo; con 0 se mide solo la CPU.
+
+- exclusive: session(write=True), como antes (FileLock para todo).
+- shared:    session(write=False), lo que usan ahora las lecturas.
+
+Con `--writer` otro proceso hace un update_fields cada 50 ms, para ver que
+las escrituras siguen entrando con lectores continuos.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_xlsx_load import make_catalog  # noqa: E402
+
+from telegram_excel_bot.excel_store import ExcelStore  # noqa: E402
+
+
+def reader(path: str, sheet: str, write: bool, hold: float, seconds: float, ready: mp.Barrier, out: mp.Queue) -> None:
+    store = ExcelStore(path, sheet)
+    rnd = random.Random(os.getpid())
+    n = len(store.all_rows())
+
+    # todos empiezan a la vez, ya con el catálogo cargado
+    ready.wait()
+    stop = time.time() + seconds
+    ops = 0
+    while time.time() < stop:
+        with store.session(write=write) as s:
+            s.get_by_id(rnd.randint(1, n))
+            if hold:
+                time.sleep(hold)
+        ops += 1
+    out.put(ops)
+    store.close()
+
+
+def writer(path: str, sheet: str, seconds: float, ready: mp.Barrier, out: mp.Queue) -> None:
+    store = ExcelStore(path, sheet)
+    ready.wait()
+    stop = time.time() + seconds
+    waits = []
+    while time.time() < stop:
+        t0 = time.perf_counter()
+        store.update_fields("1", {"fila": random.randint(1, 20)})
+        waits.append(time.perf_counter() - t0)
+        time.sleep(0.05)
+    out.put(waits)
+    store.close()
+
+
+def run(path: str, sheet: str, readers: int, write: bool, args: argparse.Namespace) -> tuple[float, list[float]]:
+    out: mp.Queue = mp.Queue()
+    wout: mp.Queue = mp.Queue()
+    ready = mp.Barrier(readers + (1 if args.writer else 0))
+
+    procs = [
+        mp.Process(target=reader, args=(path, sheet, write, args.hold_ms / 1000, args.seconds, ready, out))
+        for _ in range(readers)
+    ]
+    if args.writer:
+        procs.append(mp.Process(target=writer, args=(path, sheet, args.seconds, ready, wout)))
+    for p in procs:
+        p.start()
+
+    total = sum(out.get() for _ in range(readers))
+    waits = wout.get() if args.writer else []
+    for p in procs:
+        p.join()
+    return total / args.seconds, waits
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=8000)
+    ap.add_argument("--readers", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--seconds", type=float, default=2.0)
+    ap.add_argument("--hold-ms", type=float, default=5.0)
+    ap.add_argument("--writer", action="store_true")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "catalogo.xlsx")
+        sheet = "Catalogo"
+        make_catalog(path, sheet, args.rows)
+
+        print(f"{'lectores':>8}  {'exclusive op/s':>15}  {'shared op/s':>12}  {'x':>5}")
+        for n in args.readers:
+            excl, _ = run(path, sheet, n, True, args)
+            shared, waits = run(path, sheet, n, False, args)
+            line = f"{n:>8}  {excl:>15.0f}  {shared:>12.0f}  {shared / excl:>5.1f}"
+            if waits:
+                line += f"   escritura: media {sum(waits) / len(waits) * 1000:.1f} ms, máx {max(waits) * 1000:.1f} ms"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Modo webhook sin Telegram: latencia y throughput del bot de punta a punta.
+
+    python benchmarks/bench_webhook.py
+    python benchmarks/bench_webhook.py --count 1000 --chats 50 --concurrency 16 --workers 8
+    python benchmarks/bench_webhook.py --updates grabados.jsonl
+
+Levanta el bot real (build_application + el servidor webhook de
+python-telegram-bot) sobre un catálogo de prueba y una Bot API falsa en
+local (TELEGRAM_API_URL), y le hace POST de Updates en JSON como haría
+Telegram, con la cabecera del secreto. Las respuestas del bot (sendMessage)
+llegan a la API falsa, que apunta la hora.
+
+Por defecto los Updates son "dame el N", que resuelve command_parser sin
+LLM. Con --updates se mandan los de un fichero (un Update JSON por línea,
+p. ej. grabados de un getUpdates); la latencia se empareja por chat en
+orden, así que solo es exacta si cada Update produce una respuesta.
+
+Mide:
+- ack: lo que tarda el POST al webhook (lo que ve Telegram).
+- respuesta: desde el POST hasta el sendMessage de ese chat.
+- throughput: Updates respondidos por segundo.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_xlsx_load import make_catalog  # noqa: E402
+
+TOKEN = "123456:STUB"
+SECRET = "bench-secret"
+
+
+def make_bot_api() -> ThreadingHTTPServer:
+    """Bot API falsa: getMe, setWebhook y sendMessage (apunta chat y hora)."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length", 0))
+            raw = self.rfile.read(length)
+            if "json" in (self.headers.get("Content-Type") or ""):
+                params = json.loads(raw or b"{}")
+            else:
+                params = {k: v[0] for k, v in parse_qs(raw.decode()).items()}
+
+            method = self.path.rsplit("/", 1)[-1]
+            if method == "getMe":
+                result = {"id": 1, "is_bot": True, "first_name": "Zeno", "username": "zeno_bench_bot"}
+            elif method == "sendMessage":
+                chat_id = int(params["chat_id"])
+                with server.lock:
+                    server.replies[chat_id].append(time.perf_counter())
+                    server.sent += 1
+                result = {
+                    "message_id": server.sent,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "text": params.get("text", ""),
+                }
+            else:
+                result = True
+
+            body = json.dumps({"ok": True, "result": result}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 256
+
+    server = Server(("127.0.0.1", 0), Handler)
+    server.lock = threading.Lock()
+    server.replies = defaultdict(list)
+    server.sent = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def synthetic_updates(count: int, chats: int, rows: int) -> list[dict]:
+    now = int(time.time())
+    out = []
+    for i in range(count):
+        chat = 1000 + i % chats
+        out.append({
+            "update_id": i + 1,
+            "message": {
+                "message_id": i + 1,
+                "date": now,
+                "chat": {"id": chat, "type": "private"},
+                "from": {"id": chat, "is_bot": False, "first_name": "Bench"},
+                "text": f"dame el {i % rows + 1}",
+            },
+        })
+    return out
+
+
+def load_updates(path: str) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    for i, u in enumerate(updates, start=1):
+        u["update_id"] = i
+    return updates
+
+
+def chat_of(update: dict) -> int:
+    for key in ("message", "edited_message", "callback_query"):
+        if key in update:
+            msg = update[key].get("message", update[key]) if key == "callback_query" else update[key]
+            return msg["chat"]["id"]
+    return 0
+
+
+def post(url: str, update: dict, secret: str) -> tuple[float, float, int]:
+    """(inicio, duración, status) de un POST al webhook."""
+    req = urllib.request.Request(
+        url,
+        data=json.dumps(update).encode(),
+        headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret},
+    )
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return t0, time.perf_counter() - t0, status
+
+
+def pct(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+async def run(args: argparse.Namespace) -> None:
+    api = make_bot_api()
+    port = free_port()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        excel = os.path.join(tmp, "catalogo.xlsx")
+        make_catalog(excel, "Catalogo", args.rows)
+
+        os.environ.update({
+            "TELEGRAM_BOT_TOKEN": TOKEN,
+            "OPENAI_API_KEY": "stub",
+            "EXCEL_PATH": excel,
+            "EXCEL_SHEET": "Catalogo",
+            "DISABLE_AUTH": "true",
+            "ALLOWED_CHAT_IDS": "",
+            "ADMIN_CHAT_IDS": "",
+            "STORE_BACKEND": "excel",
+            "EXPORT_CACHE_DIR": os.path.join(tmp, "exports"),
+            "LLM_CACHE_SIZE": "0",
+            "TELEGRAM_API_URL": f"http://127.0.0.1:{api.server_port}/bot",
+            "BOT_MODE": "webhook",
+            "UPDATE_WORKERS": str(args.workers),
+            "WEBHOOK_URL": f"http://127.0.0.1:{port}",
+            "WEBHOOK_LISTEN": "127.0.0.1",
+            "WEBHOOK_PORT": str(port),
+            "WEBHOOK_PATH": "telegram",
+            "WEBHOOK_SECRET": SECRET,
+        })
+        from telegram_excel_bot.bot import build_application, webhook_options
+        from telegram_excel_bot.config import get_settings
+
+        s = get_settings()
+        app = build_application(s)
+        await app.initialize()
+        await app.updater.start_webhook(**webhook_options(s))
+        await app.start()
+        url = f"http://127.0.0.1:{port}/{s.webhook_path}"
+
+        try:
+            updates = load_updates(args.updates) if args.updates else synthetic_updates(args.count, args.chats, args.rows)
+
+            # secreto: sin la cabecera correcta, 403 y no se procesa
+            _, _, status = await asyncio.to_thread(post, url, updates[0], "otro")
+            print(f"secreto incorrecto: HTTP {status}")
+
+            posted: dict[int, deque] = defaultdict(deque)
+            acks: list[float] = []
+            t_start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                results = await asyncio.gather(*(
+                    asyncio.get_running_loop().run_in_executor(pool, post, url, u, SECRET) for u in updates
+                ))
+            for u, (t0, ack, status) in zip(updates, results):
+                if status != 200:
+                    raise RuntimeError(f"webhook devolvió HTTP {status}")
+                posted[chat_of(u)].append(t0)
+                acks.append(ack)
+
+            deadline = time.monotonic() + args.timeout
+            while api.sent < len(updates) and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            elapsed = time.perf_counter() - t_start
+
+            latencies = []
+            for chat, times in posted.items():
+                sent = sorted(times)
+                latencies += [r - p for p, r in zip(sent, api.replies.get(chat, []))]
+
+            print(f"updates:        {len(updates)}  ({args.chats} chats, {args.concurrency} POST a la vez, "
+                  f"UPDATE_WORKERS={args.workers})")
+            print(f"respondidos:    {api.sent}")
+            print(f"ack webhook:    p50 {pct(acks, 0.5) * 1000:7.1f} ms   p95 {pct(acks, 0.95) * 1000:7.1f} ms")
+            print(f"respuesta:      p50 {pct(latencies, 0.5) * 1000:7.1f} ms   p95 {pct(latencies, 0.95) * 1000:7.1f} ms")
+            print(f"throughput:     {api.sent / elapsed:7.1f} updates/s")
+        finally:
+            await app.updater.stop()
+            await app.stop()
+            await app.shutdown()
+            app.bot_data["store"].close()
+            app.bot_data["llm"].close()
+            api.shutdown()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--updates", help="fichero .jsonl con un Update por línea")
+    ap.add_argument("--count", type=int, default=300)
+    ap.add_argument("--chats", type=int, default=20)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--rows", type=int, default=2000)
+    ap.add_argument("--timeout", type=float, default=60.0)
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Carga de la hoja: modelo completo de openpyxl vs lectura en streaming.
+
+    python benchmarks/bench_xlsx_load.py                 # catálogo sintético de 8000 filas
+    python benchmarks/bench_xlsx_load.py --rows 30000
+    python benchmarks/bench_xlsx_load.py --xlsx catalogo.xlsx --sheet Hoja1
+
+- full:      load_workbook() + ws.cell() por celda (lo que hacía _open()).
+- read_only: openpyxl read_only + iter_rows(values_only=True).
+- streaming: ExcelStore._load_rows() (xlsx_reader con iterparse).
+
+Mide tiempo (mejor de N) y pico de memoria con tracemalloc.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openpyxl import Workbook  # noqa: E402
+
+from telegram_excel_bot.excel_store import HEADERS, ExcelStore  # noqa: E402
+
+
+def make_catalog(path: str, sheet: str, rows: int) -> None:
+    rnd = random.Random(1)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet)
+    ws.append(HEADERS)
+    for i in range(1, rows + 1):
+        ws.append([
+            i,
+            f"Título de prueba número {i}",
+            rnd.choice(["Platón", "Aristóteles", "Epicteto", "Séneca", "Plotino"]),
+            rnd.choice(["Donación", "Compra", "Legado", None]),
+            rnd.choice(["Filosofía", "Historia", "Religión", None]),
+            rnd.choice(["Gredos", "Nueva Acrópolis", "Alianza", "edasa"]),
+            rnd.randint(1900, 2024),
+            rnd.randint(1, 20),
+            rnd.randint(1, 10),
+            f"978-84-{rnd.randint(1000, 9999)}-{rnd.randint(100, 999)}-{rnd.randint(0, 9)}",
+            "18/12/2025",
+            None,
+        ])
+    wb.save(path)
+
+
+def load_full(store: ExcelStore) -> list:
+    wb, ws = store._open()
+    idx = store._header_index(ws)
+    return [{h: ws.cell(r, idx[h]).value for h in HEADERS} for r in range(2, ws.max_row + 1)]
+
+
+def load_read_only(store: ExcelStore) -> list:
+    rows = store._read_sheet_openpyxl()
+    idx = store._map_headers(rows[0])
+    return [{h: v[idx[h] - 1] if idx[h] <= len(v) else None for h in HEADERS} for v in rows[1:]]
+
+
+def load_streaming(store: ExcelStore) -> list:
+    return store._load_rows()
+
+
+def measure(fn, store: ExcelStore, repeat: int) -> tuple[float, float, int]:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        rows = fn(store)
+        best = min(best, time.perf_counter() - t0)
+
+    tracemalloc.start()
+    rows = fn(store)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 2**20, len(rows)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--xlsx", help="Excel existente (si no, se genera uno)")
+    ap.add_argument("--sheet", default="Catalogo")
+    ap.add_argument("--rows", type=int, default=8000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.xlsx
+        if not path:
+            path = os.path.join(tmp, "catalogo.xlsx")
+            make_catalog(path, args.sheet, args.rows)
+
+        store = ExcelStore(path, args.sheet)
+        store.close()
+
+        results = {}
+        for name, fn in (("full", load_full), ("read_only", load_read_only), ("streaming", load_streaming)):
+            results[name] = measure(fn, store, args.repeat)
+            t, mem, n = results[name]
+            print(f"{name:<10} {n:>7} filas  {t * 1000:9.1f} ms  pico {mem:8.1f} MiB")
+
+        assert load_full(store) == load_streaming(store), "las lecturas no coinciden"
+
+        (tf, mf, _), (ts, ms, _) = results["full"], results["streaming"]
+        print(f"speedup x{tf / ts:.1f}, memoria x{mf / ms:.1f} menos")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import copy
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+# Operaciones que se pueden cachear y las claves que necesitan
+CACHEABLE_OPS = {
+    "get": (),
+    "find": ("query",),
+    "last": ("n",),
+    "set_pos": ("ref",),
+    "set_isbn": ("ref", "isbn"),
+    "update": ("ref", "changes"),
+    "delete": ("ref",),
+}
+
+# Campos de texto libre en changes: su valor depende de las mayúsculas del
+# mensaje, y la clave de caché no las distingue
+FREE_TEXT_FIELDS = ("titulo", "autor", "editorial", "procedencia", "categoria", "comentarios")
+
+REF_TYPES = ("id", "ano", "titulo", "autor", "editorial", "isbn")
+
+_SPACES_RE = re.compile(r"\s+")
+_TRAILING_RE = re.compile(r"[\s.!¡?¿]+$")
+
+
+def normalize_text(text: str) -> str:
+    """'  Dame  el 3756. ' -> 'dame el 3756'"""
+    t = unicodedata.normalize("NFC", text).casefold()
+    t = _SPACES_RE.sub(" ", t).strip()
+    return _TRAILING_RE.sub("", t)
+
+
+def _valid_ref(ref: Any) -> bool:
+    return (
+        isinstance(ref, dict)
+        and ref.get("type") in REF_TYPES
+        and isinstance(ref.get("value"), str)
+        and bool(ref["value"].strip())
+    )
+
+
+def cacheable(action: Any) -> bool:
+    """
+    True si la acción es determinista respecto al texto normalizado y tiene
+    la forma que espera el bot. Nunca: chat, add ni cambios de texto libre.
+    """
+    if not isinstance(action, dict):
+        return False
+    op = action.get("op")
+    if op not in CACHEABLE_OPS:
+        return False
+    if any(k not in action for k in CACHEABLE_OPS[op]):
+        return False
+    if "ref" in action and not _valid_ref(action["ref"]):
+        return False
+
+    if op == "get":
+        book_id = action.get("id")
+        has_id = isinstance(book_id, str) and bool(book_id.strip())
+        return has_id or _valid_ref(action.get("ref"))
+    if op == "find":
+        q = action["query"]
+        return isinstance(q, dict) and bool(q) and all(isinstance(v, str) for v in q.values())
+    if op == "last":
+        return isinstance(action["n"], int) and not isinstance(action["n"], bool)
+    if op == "set_pos":
+        pos = action.get("pos") if isinstance(action.get("pos"), dict) else action
+        return all(isinstance(pos.get(k), int) for k in ("fila", "columna"))
+    if op == "set_isbn":
+        return isinstance(action["isbn"], str) and bool(action["isbn"].strip())
+    if op == "update":
+        ch = action["changes"]
+        if not isinstance(ch, dict) or not ch:
+            return False
+        return not any(ch.get(k) for k in FREE_TEXT_FIELDS)
+    return True
+
+
+class ActionCache:
+    """
+    Caché texto -> acción del LLM, LRU con caducidad y persistida en JSON.
+
+    - Clave: texto normalizado + modelo + versión del prompt (cambiar el
+      SYSTEM o el schema invalida todo lo anterior).
+    - Solo guarda acciones que pasan cacheable().
+    - put() no toca el disco: con due(), quien la usa desde el bucle de
+      eventos saca una copia (dump()) y la escribe (write()) en otro hilo,
+      como mucho cada `save_every` segundos. save() hace las dos cosas
+      seguidas, para el cierre. Escritura atómica (.tmp + replace); si se
+      pierde, solo se pierde caché.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 2000,
+        ttl: float = 7 * 24 * 3600,
+        save_every: float = 5.0,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.save_every = save_every
+        self.hits = 0
+        self.misses = 0
+        # clave -> (caduca_en, acción); el final es lo más reciente
+        self._items: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._dirty = False
+        self._saved_at = 0.0
+        # una sola escritura a la vez (hilo de fondo y close())
+        self._write_lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def key(text: str, model: str, prompt_version: str) -> str:
+        return f"{model}|{prompt_version}|{normalize_text(text)}"
+
+    # ---------- consulta ----------
+
+    def get(self, key: str) -> Optional[dict[str, Any]]:
+        item = self._items.get(key)
+        if item is None or item[0] <= time.time():
+            if item is not None:
+                del self._items[key]
+                self._dirty = True
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        # copia: el bot modifica la acción (p. ej. f_revision)
+        return copy.deepcopy(item[1])
+
+    def put(self, key: str, action: dict[str, Any]) -> bool:
+        if not cacheable(action):
+            return False
+        self._items[key] = (time.time() + self.ttl, copy.deepcopy(action))
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+        self._dirty = True
+        return True
+
+    def stats(self) -> dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    # ---------- disco ----------
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            # caché corrupta: se empieza de cero
+            return
+
+        now = time.time()
+        for entry in data.get("entries", []) if isinstance(data, dict) else []:
+            try:
+                key, expires, action = entry
+            except (TypeError, ValueError):
+                continue
+            if isinstance(key, str) and isinstance(expires, (int, float)) and expires > now and cacheable(action):
+                self._items[key] = (float(expires), action)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+    def due(self) -> bool:
+        """Hay cambios sin guardar y ya pasaron `save_every` segundos."""
+        return self._dirty and time.monotonic() - self._saved_at >= self.save_every
+
+    def dump(self) -> Optional[list[list[Any]]]:
+        """
+        Copia de las entradas para write(), o None si no hay cambios. Va en
+        el hilo que usa la caché: las acciones guardadas no se modifican
+        nunca (put() y get() copian), así que basta una lista nueva.
+        """
+        if not self._dirty:
+            return None
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        return [[k, exp, action] for k, (exp, action) in self._items.items()]
+
+    def write(self, entries: list[list[Any]]) -> None:
+        """Escribe en disco lo que devolvió dump(); se puede llamar desde otro hilo."""
+        with self._write_lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "entries": entries}, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+
+    def save(self) -> None:
+        entries = self.dump()
+        if entries is not None:
+            self.write(entries)
@@ -0,0 +1,214 @@
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+from telegram_excel_bot.tracing import add_span
+
+
+# Colas de los hilos del store
+READ = 0
+WRITE = 1
+
+# Aging: una escritura encolada sale la siguiente si ya esperó esto (s) o
+# si le han adelantado tantas lecturas
+WRITE_MAX_WAIT = 0.5
+WRITE_MAX_OVERTAKEN = 16
+
+
+class AsyncExcelStore:
+    """
+    Fachada async sobre ExcelStore (o SQLiteStore, misma API) para que los
+    handlers nunca bloqueen el event loop esperando al FileLock, al disco o
+    a un save.
+
+    - Las llamadas se ejecutan en `workers` hilos propios. El store decide
+      quién espera a quién: las lecturas de ExcelStore van con lock
+      compartido y pueden ir a la vez; las escrituras, de una en una.
+    - Las lecturas pasan delante: hay una cola de lecturas y otra de
+      escrituras, y una consulta no espera detrás de guardados, altas en
+      bloque o exportaciones ya encolados. Dentro de cada cola, orden de
+      llegada.
+    - Sin inanición de escrituras: la más antigua sale la siguiente en
+      cuanto lleva `write_max_wait` segundos en cola o le han adelantado
+      `write_max_overtaken` lecturas. Con tráfico de lecturas constante,
+      una escritura espera como mucho eso más lo que tarden las
+      operaciones ya en curso y las escrituras encoladas antes que ella.
+    - Cola acotada: como mucho `max_pending` operaciones en espera o en
+      curso; el resto espera su turno en el loop sin ocupar el executor.
+    - Cancelación: si se cancela la tarea que espera (p. ej. se abandona el
+      update), la operación se descarta si aún no había empezado. Una que ya
+      está en marcha termina, para no dejar el catálogo a medias.
+    - Cada operación corre en el contexto de quien la encoló, así que queda
+      en su traza como span "store.<op>" con lo que esperó en la cola.
+    """
+
+    def __init__(
+        self,
+        store: Any,
+        workers: int = 1,
+        max_pending: int = 64,
+        write_max_wait: float = WRITE_MAX_WAIT,
+        write_max_overtaken: int = WRITE_MAX_OVERTAKEN,
+    ):
+        self.store = store
+        self.path = store.path
+        self.write_max_wait = write_max_wait
+        self.write_max_overtaken = write_max_overtaken
+        self._pending = asyncio.Semaphore(max_pending)
+        # READ / WRITE -> cola de (future, fn, contexto, nombre, hora de encolado)
+        self._queues: dict[int, deque] = {READ: deque(), WRITE: deque()}
+        self._cond = threading.Condition()
+        # lecturas servidas mientras había escrituras esperando
+        self._overtaken = 0
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"store-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def _next_job(self) -> Optional[tuple]:
+        """Siguiente operación (lecturas primero, con aging de escrituras); None al cerrar."""
+        reads, writes = self._queues[READ], self._queues[WRITE]
+        with self._cond:
+            while not (self._closed or reads or writes):
+                self._cond.wait()
+            if self._closed:
+                return None
+            if writes and (
+                not reads
+                or self._overtaken >= self.write_max_overtaken
+                or time.perf_counter() - writes[0][4] >= self.write_max_wait
+            ):
+                self._overtaken = 0
+                return writes.popleft()
+            if writes:
+                self._overtaken += 1
+            return reads.popleft()
+
+    def _worker(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            fut, fn, ctx, name, queued_at = job
+            # cancelada mientras esperaba: ni se empieza
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                # en el contexto de quien encoló: sus spans van a su traza
+                fut.set_result(ctx.run(self._run, fn, name, queued_at))
+            except BaseException as e:
+                fut.set_exception(e)
+
+    @staticmethod
+    def _run(fn: Callable[[], Any], name: str, queued_at: float) -> Any:
+        start = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            add_span(f"store.{name}", start, time.perf_counter() - start,
+                     queued_ms=round((start - queued_at) * 1000, 2))
+
+    async def _submit(self, kind: int, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        async with self._pending:
+            fut: Future = Future()
+            name = getattr(fn, "__name__", "op")
+            job = (fut, functools.partial(fn, *args, **kwargs), contextvars.copy_context(), name, time.perf_counter())
+            with self._cond:
+                self._queues[kind].append(job)
+                self._cond.notify()
+            return await asyncio.wrap_future(fut)
+
+    async def _read(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await self._submit(READ, fn, *args, **kwargs)
+
+    async def _write(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await self._submit(WRITE, fn, *args, **kwargs)
+
+    async def run_session(self, fn: Callable[[Any], Any], write: bool = True) -> Any:
+        """
+        fn(sesión) con un solo lock / transacción en el hilo del store, para
+        resolver -> modificar -> releer de una vez (ver ExcelStore.session).
+        fn es síncrona y no debe llamar al store, solo a la sesión. Con
+        write=False la sesión es de solo lectura (lock compartido).
+        """
+        def work() -> Any:
+            with self.store.session(write=write) as s:
+                return fn(s)
+
+        work.__name__ = "session_write" if write else "session_read"
+        return await self._submit(WRITE if write else READ, work)
+
+    # ---------- lecturas ----------
+
+    async def get_by_id(self, book_id: str) -> Optional[dict[str, Any]]:
+        return await self._read(self.store.get_by_id, book_id)
+
+    async def find(self, criteria: dict[str, str], limit: int = 20, fuzzy: bool = True) -> list[dict[str, Any]]:
+        return await self._read(self.store.find, criteria, limit=limit, fuzzy=fuzzy)
+
+    async def find_ids(self, criteria: dict[str, str], fuzzy: bool = True) -> list[Any]:
+        return await self._read(self.store.find_ids, criteria, fuzzy=fuzzy)
+
+    async def get_many(self, ids: list[Any]) -> list[dict[str, Any]]:
+        return await self._read(self.store.get_many, ids)
+
+    async def find_by_isbn(self, isbn: str) -> list[dict[str, Any]]:
+        return await self._read(self.store.find_by_isbn, isbn)
+
+    async def last(self, n: int = 10) -> list[dict[str, Any]]:
+        return await self._read(self.store.last, n)
+
+    async def all_rows(self) -> list[dict[str, Any]]:
+        return await self._read(self.store.all_rows)
+
+    # version() y las exportaciones vuelcan el diario: van con prioridad de escritura
+    async def version(self) -> str:
+        return await self._write(self.store.version)
+
+    async def export(self, dest: str, fmt: str = "xlsx") -> str:
+        return await self._write(self.store.export, dest, fmt)
+
+    async def export_xlsx(self, dest: str) -> None:
+        await self._write(self.store.export_xlsx, dest)
+
+    # ---------- escrituras ----------
+
+    async def add(self, book: dict[str, Any]) -> Any:
+        return await self._write(self.store.add, book)
+
+    async def add_many(self, books: list[dict[str, Any]]) -> list[int]:
+        return await self._write(self.store.add_many, books)
+
+    async def update_fields(self, book_id: str, changes: dict[str, Any]) -> Optional[dict[str, Any]]:
+        return await self._write(self.store.update_fields, book_id, changes)
+
+    async def delete(self, book_id: Any) -> bool:
+        return await self._write(self.store.delete, book_id)
+
+    async def compact_ids(self) -> int:
+        return await self._write(self.store.compact_ids)
+
+    async def delete_and_compact(self, book_id: int) -> bool:
+        return await self._write(self.store.delete_and_compact, book_id)
+
+    # ---------- cierre ----------
+
+    def close(self) -> None:
+        """Descarta lo encolado, espera a lo que esté en curso y cierra el store (vuelca el diario)."""
+        with self._cond:
+            self._closed = True
+            for q in self._queues.values():
+                while q:
+                    q.popleft()[0].cancel()
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join()
+        self.store.close()
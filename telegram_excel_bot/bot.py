@@ -1,24 +1,46 @@
+import asyncio
 import logging
 import json
 import os
 import tempfile
+import time
 
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 from datetime import datetime
-from telegram import Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.constants import ParseMode
-from telegram.ext import Application, CommandHandler, MessageHandler, ContextTypes, filters
+from telegram.error import BadRequest
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, ContextTypes, filters
+from telegram.request import HTTPXRequest
 
+from telegram_excel_bot.action_cache import ActionCache
+from telegram_excel_bot.command_parser import parse_command
 from telegram_excel_bot.config import get_settings
+from telegram_excel_bot.async_store import AsyncExcelStore
+from telegram_excel_bot.bulk_import import SUPPORTED_EXTENSIONS, ImportFormatError, load_books
 from telegram_excel_bot.excel_store import ExcelStore
+from telegram_excel_bot.exports import FORMATS, ExportCache
 from telegram_excel_bot.llm_transformer import LLMTransformer
+from telegram_excel_bot.metrics import REGISTRY, start_http_server, summary
+from telegram_excel_bot.scheduler import FairUpdateProcessor
+from telegram_excel_bot.pagination import CALLBACK_PREFIX, Cursor, ResultPages, callback_data, parse_callback
+from telegram_excel_bot.sqlite_store import SQLiteStore
 from telegram_excel_bot.speech2text import Speech2Text
+from telegram_excel_bot import tracing
 
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("catalogo-bot")
 
+class TracedRequest(HTTPXRequest):
+    """Cada llamada a la Bot API (sendMessage, sendDocument...) como span "reply" de su traza."""
+
+    async def do_request(self, url: str, method: str, *args: Any, **kwargs: Any) -> tuple[int, bytes]:
+        with tracing.span("reply", method=url.rsplit("/", 1)[-1]):
+            return await super().do_request(url, method, *args, **kwargs)
+
+
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     log.exception("Unhandled exception", exc_info=context.error)
 
@@ -51,6 +73,70 @@ def fmt_row(r: dict) -> str:
     return "\n".join(lines)
 
 
+def fmt_line(r: dict) -> str:
+    return f"• <code>{r['id']}</code> — {r.get('Título','')} ({r.get('Autor','')})"
+
+
+# ---------- resultados paginados ----------
+
+def results_page(pages: ResultPages, cursor: Cursor, page: int, rows: list[dict]) -> tuple[str, Optional[InlineKeyboardMarkup]]:
+    total = pages.pages(cursor)
+    lines = [f"{cursor.title} (página {page + 1}/{total}):\n"]
+    lines += [fmt_line(r) for r in rows]
+
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️ Anterior", callback_data=callback_data(cursor.token, page - 1)))
+    if page < total - 1:
+        buttons.append(InlineKeyboardButton("Siguiente ▶️", callback_data=callback_data(cursor.token, page + 1)))
+    return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+async def reply_results(update: Update, context: ContextTypes.DEFAULT_TYPE, ids: list, title: str) -> None:
+    """
+    Lista de resultados: si caben en una página, tal cual; si no, primera
+    página con botones y la lista de ids guardada para las siguientes.
+    """
+    store: AsyncExcelStore = context.application.bot_data["store"]
+    pages: ResultPages = context.application.bot_data["pages"]
+
+    if len(ids) <= pages.page_size:
+        rows = await store.get_many(ids)
+        lines = [f"{title}:\n"] + [fmt_line(r) for r in rows]
+        await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+        return
+
+    cursor = pages.put(update.effective_chat.id, ids, title)
+    rows = await store.get_many(pages.page_ids(cursor, 0))
+    text, markup = results_page(pages, cursor, 0, rows)
+    await update.message.reply_text(text, parse_mode=ParseMode.HTML, reply_markup=markup)
+
+
+async def page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Botones ◀️ / ▶️: la página sale de la lista guardada, sin volver a buscar."""
+    settings = context.application.bot_data["settings"]
+    store: AsyncExcelStore = context.application.bot_data["store"]
+    pages: ResultPages = context.application.bot_data["pages"]
+    query = update.callback_query
+
+    if not allowed(update, settings):
+        await query.answer("No autorizado.")
+        return
+
+    parsed = parse_callback(query.data)
+    cursor = pages.get(update.effective_chat.id, parsed[0]) if parsed else None
+    if cursor is None:
+        await query.answer("Esta búsqueda ha caducado; vuelve a buscar.")
+        await query.edit_message_reply_markup(reply_markup=None)
+        return
+
+    page = min(parsed[1], pages.pages(cursor) - 1)
+    rows = await store.get_many(pages.page_ids(cursor, page))
+    text, markup = results_page(pages, cursor, page, rows)
+    await query.answer()
+    await query.edit_message_text(text, parse_mode=ParseMode.HTML, reply_markup=markup)
+
+
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat = update.effective_chat
@@ -136,6 +222,41 @@ async def authorize(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 
+async def compact_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Quita las filas borradas y renumera los ids, en segundo plano."""
+    settings = context.application.bot_data["settings"]
+    store: AsyncExcelStore = context.application.bot_data["store"]
+
+    admin_id = settings.admin_chat_id
+    if admin_id is None or update.effective_chat.id != admin_id:
+        await update.message.reply_text("❌ No autorizado (solo admin).")
+        return
+
+    tasks: set = context.application.bot_data.setdefault("compact_tasks", set())
+    if tasks:
+        await update.message.reply_text("⏳ Ya hay una compactación en marcha.")
+        return
+
+    async def run() -> None:
+        try:
+            n = await store.compact_ids()
+            if n:
+                # los ids cambiaron: las búsquedas paginadas apuntan a otros libros
+                context.application.bot_data["pages"].clear()
+                text = f"✅ Compactado: {n} libros borrados quitados y ids renumerados."
+            else:
+                text = "ℹ️ No había libros borrados; los ids no cambian."
+        except Exception as e:
+            log.exception("Error compactando")
+            text = f"❌ Error compactando: {e}"
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+    task = asyncio.create_task(run())
+    tasks.add(task)
+    task.add_done_callback(tasks.discard)
+    await update.message.reply_text("🧹 Compactando el catálogo en segundo plano; te aviso al terminar.")
+
+
 async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text(
         "🤖 <b>ZenoBot – Ayuda rápida</b>\n\n"
@@ -175,66 +296,135 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "• busca por año 1950\n\n"
 
         "🗑️ <b>Eliminar</b>\n"
-        "• borra el libro número 12\n\n"
+        "• borra el libro número 12\n"
+        "• /compact → (admin) quita los borrados y renumera los ids\n\n"
 
         "📤 <b>Utilidades</b>\n"
-        "• /export → envía el Excel actual\n\n"
+        "• /export → envía el Excel actual (/export csv o /export jsonl → comprimido)\n"
+        "• envía un .csv o .xlsx con cabecera (Título, Autor, Editorial, Año...) → alta en bloque\n"
+        "• /stats → (admin) llamadas y tiempos del LLM, la transcripción y el catálogo\n\n"
 
         "ℹ️ <i> Si separas por frases las instrucciones, las ejecutaré una a una secuencialmente.</i>",
         parse_mode="HTML"
     )
 
 
+async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Resumen de métricas del proceso (ver metrics.py), solo admin."""
+    settings = context.application.bot_data["settings"]
+    llm: LLMTransformer = context.application.bot_data["llm"]
+
+    admin_id = settings.admin_chat_id
+    if admin_id is None or update.effective_chat.id != admin_id:
+        await update.message.reply_text("❌ No autorizado (solo admin).")
+        return
+
+    cache_stats = llm.cache.stats() if llm.cache is not None else None
+    await update.message.reply_text("📈 Estadísticas desde el arranque\n\n" + summary(REGISTRY, cache_stats))
+
+
 async def export_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/export [xlsx|csv|jsonl]: una generación y una subida por versión del catálogo."""
     settings = context.application.bot_data["settings"]
-    store: ExcelStore = context.application.bot_data["store"]
+    store: AsyncExcelStore = context.application.bot_data["store"]
+    exports: ExportCache = context.application.bot_data["exports"]
     if not allowed(update, settings):
         await update.message.reply_text("No autorizado.")
         return
-    await update.message.reply_document(document=open(store.path, "rb"), filename=get_settings().excel_path)
-
-
-def resolve_ref_to_id(store: ExcelStore, ref: dict[str, Any]) -> str | None:
-    if not isinstance(ref, dict):
-        return None
-
-    rtype = (ref.get("type") or "").strip().lower()
-    if not rtype:
-        return None
-
-    # value puede venir como "value", o mal como "id" cuando type=="id"
-    raw_value = ref.get("value")
-    if raw_value is None and rtype == "id":
-        raw_value = ref.get("id")
-
-    if raw_value is None:
-        return None
-
-    value = str(raw_value).strip()
-    if not value:
-        return None
-
-    # --- resolver por id directamente ---
-    if rtype == "id":
-        return int(value)
-
-    # --- resolver por búsqueda y exigir único ---
-    if rtype == "isbn":
-        res = store.find({"isbn": value}, limit=10)
-    elif rtype == "ano":
-        res = store.find({"ano": value}, limit=10)
-    elif rtype == "titulo":
-        res = store.find({"titulo": value}, limit=10)
-    elif rtype == "autor":
-        res = store.find({"autor": value}, limit=10)
-    else:
-        return None, []
 
-    if len(res) == 1:
-        rid = res[0].get("id")
-        return str(rid).strip() if rid is not None else None
+    fmt = context.args[0].lower().lstrip(".") if context.args else "xlsx"
+    if fmt not in FORMATS:
+        await update.message.reply_text("Uso: /export [xlsx|csv|jsonl]")
+        return
+
+    version = await store.version()
+    entry = exports.get(fmt, version)
+
+    # sin cambios desde la última subida: se reenvía el mismo fichero de Telegram
+    if entry and entry["file_id"]:
+        try:
+            await update.message.reply_document(document=entry["file_id"])
+            return
+        except BadRequest:
+            exports.forget_file_id(fmt)
+
+    if entry is None:
+        # copia coherente del catálogo (diario volcado / exportado desde SQLite)
+        tmp_path = exports.temp_path(fmt)
+        try:
+            version = await store.export(tmp_path, fmt)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        entry = exports.add(fmt, version, tmp_path)
+
+    with open(exports.path(entry), "rb") as f:
+        msg = await update.message.reply_document(document=f, filename=exports.filename(fmt))
+    if msg.document:
+        exports.set_file_id(fmt, entry["version"], msg.document.file_id)
+
+
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Alta en bloque desde un .csv/.xlsx con cabecera."""
+    settings = context.application.bot_data["settings"]
+    store: AsyncExcelStore = context.application.bot_data["store"]
+
+    if not update.message or not update.message.document:
+        return
+    if not allowed(update, settings):
+        await update.message.reply_text("No autorizado. Pásame tu chat_id para allowlist.")
+        return
+
+    doc = update.message.document
+    ext = os.path.splitext(doc.file_name or "")[1].lower()
+    if ext not in SUPPORTED_EXTENSIONS:
+        await update.message.reply_text("Para importar libros envía un .csv o un .xlsx con cabecera.")
+        return
 
-    return None
+    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
+        tmp_path = tmp.name
+    try:
+        tg_file = await doc.get_file()
+        await tg_file.download_to_drive(custom_path=tmp_path)
+
+        try:
+            books, errors = await asyncio.to_thread(load_books, tmp_path)
+        except ImportFormatError as e:
+            await update.message.reply_text(f"❌ {e}")
+            return
+
+        ids = await store.add_many(books)
+
+        lines = [f"📥 Importación de {doc.file_name}", f"✅ Aceptados: {len(ids)}", f"❌ Rechazados: {len(errors)}"]
+        if ids:
+            lines.append(f"Ids asignados: {ids[0]}–{ids[-1]}" if len(ids) > 1 else f"Id asignado: {ids[0]}")
+        if errors:
+            lines.append("")
+            lines.extend(f"• {e}" for e in errors[:30])
+            if len(errors) > 30:
+                lines.append(f"… y {len(errors) - 30} errores más")
+        await update.message.reply_text("\n".join(lines))
+    finally:
+        try:
+            os.remove(tmp_path)
+        except Exception:
+            pass
+
+
+async def with_ref(store: AsyncExcelStore, ref: dict[str, Any], fn, write: bool = True) -> tuple[Any, Any]:
+    """
+    Resuelve `ref` y ejecuta fn(sesión, book_id) en la misma sesión del store
+    (un lock, un snapshot). Devuelve (book_id, resultado de fn); book_id es
+    None si la referencia no identifica un único libro. write=False para
+    lecturas (lock compartido).
+    """
+    def work(s):
+        book_id = s.resolve_ref(ref)
+        if not book_id:
+            return None, None
+        return book_id, fn(s, book_id)
+
+    return await store.run_session(work, write=write)
 
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -244,11 +434,34 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     raw = update.message.text.strip()
     lines = [ln.strip() for ln in raw.splitlines() if ln.strip()]
 
-    # Si hay varias líneas, ejecuta una a una
+    # Si hay varias líneas: atajos locales y el resto al LLM en una sola
+    # petición; luego se ejecutan una a una, en orden
     if len(lines) > 1:
-        for i, ln in enumerate(lines, start=1):
+        settings = context.application.bot_data["settings"]
+        llm: LLMTransformer = context.application.bot_data["llm"]
+        if not allowed(update, settings):
+            await update.message.reply_text("No autorizado. Pásame tu chat_id para allowlist.")
+            return
+
+        actions: list[Any] = [parse_command(ln) for ln in lines]
+        pending = [i for i, a in enumerate(actions) if a is None]
+        sources = ["lote" if a is None else "parser" for a in actions]
+        if pending:
+            try:
+                batch = await llm.to_actions([lines[i] for i in pending])
+            except Exception as e:
+                # sin lote, cada línea pendiente responde con el error abajo
+                log.exception("Error traduciendo el lote")
+                batch = [e] * len(pending)
+            for i, a in zip(pending, batch):
+                actions[i] = a
+
+        for i, (ln, action) in enumerate(zip(lines, actions), start=1):
             await update.message.reply_text(f"➡️ ({i}/{len(lines)}) {ln}")
-            await process_natural_language(update, context, ln)
+            if isinstance(action, Exception):
+                await update.message.reply_text(f"❌ Error: {action}")
+                continue
+            await process_natural_language(update, context, ln, action=action, source=sources[i - 1])
         return
 
     # Caso normal: una sola línea
@@ -285,8 +498,10 @@ async def handle_audio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         tmp_path = tmp.name
 
     try:
-        await tg_file.download_to_drive(custom_path=tmp_path)  # PTB v21+ :contentReference[oaicite:3]{index=3}
-        transcript = stt.transcribe_file(tmp_path, language="es")
+        with tracing.span("download"):
+            await tg_file.download_to_drive(custom_path=tmp_path)  # PTB v21+ :contentReference[oaicite:3]{index=3}
+        with tracing.span("transcription"):
+            transcript = await asyncio.to_thread(stt.transcribe_file, tmp_path, language="es")
         transcript = (transcript or "").strip()
 
         if not transcript:
@@ -310,10 +525,20 @@ async def handle_audio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
 
 
-async def process_natural_language(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str) -> None:
+async def process_natural_language(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    text: str,
+    action: dict[str, Any] | None = None,
+    source: str = "lote",
+) -> None:
+    """
+    Ejecuta `text`; si ya viene `action` (de handle_text), no se vuelve a
+    traducir y `source` dice de dónde salió ("parser" o "lote").
+    """
     print("🔍 Procesando NL:", text)
     settings = context.application.bot_data["settings"]
-    store: ExcelStore = context.application.bot_data["store"]
+    store: AsyncExcelStore = context.application.bot_data["store"]
     llm: LLMTransformer = context.application.bot_data["llm"]
 
     if not text or not text.strip():
@@ -324,11 +549,22 @@ async def process_natural_language(update: Update, context: ContextTypes.DEFAULT
         await update.message.reply_text("No autorizado. Pásame tu chat_id para allowlist.")
         return
     
+    op = "?"
+    t0 = time.perf_counter()
     try:
-        action = llm.to_action(text)
+        # órdenes conocidas sin pasar por el LLM
+        if action is None:
+            source = "parser"
+            action = parse_command(text)
+        if action is not None:
+            log.info("⚡ ACTION:\n%s", json.dumps(action, indent=2, ensure_ascii=False))
+        else:
+            source = "llm"
+            action = await llm.to_action(text)
+            log.info("🧠 LLM ACTION:\n%s", json.dumps(action, indent=2, ensure_ascii=False))
         op = action["op"]
-
-        log.info("🧠 LLM ACTION:\n%s", json.dumps(action, indent=2, ensure_ascii=False))
+        REGISTRY.inc("nl_actions_total", op=op, source=source)
+        tracing.annotate(op=op, source=source)
 
         if op == "chat":
             await update.message.reply_text(action["message"])
@@ -401,10 +637,9 @@ async def process_natural_language(update: Update, context: ContextTypes.DEFAULT
                 "comentarios": str(book.get("comentarios") or "").strip(),
             }
 
-            new_id = store.add(book_norm)
-            saved = store.get_by_id(new_id)
+            saved = await store.run_session(lambda s: s.add(book_norm))
             await update.message.reply_text(
-                "✅📝 Añadido\n\n" + fmt_row(saved or {"id": new_id}),
+                "✅📝 Añadido\n\n" + fmt_row(saved),
                 parse_mode=ParseMode.HTML
             )
             return
@@ -412,6 +647,16 @@ async def process_natural_language(update: Update, context: ContextTypes.DEFAULT
 
 
         if op == "get":
+            # 1) Si viene id directo => un libro
+            book_id = str(action.get("id") or "").strip()
+            if book_id:
+                row = await store.get_by_id(book_id)
+                if not row:
+                    await update.message.reply_text("No encontrado.")
+                else:
+                    await update.message.reply_text(fmt_row(row), parse_mode=ParseMode.HTML)
+                return
+
             ref = action.get("ref")
             if not ref:
                 await update.message.reply_text(
@@ -419,7 +664,27 @@ async def process_natural_language(update: Update, context: ContextTypes.DEFAULT
                 )
                 return
 
-            book_id = resolve_ref_to_id(store, ref)
+            rtype = (ref.get("type") or "").strip().lower()
+            value = str(ref.get("value") or "").strip()
+
+            # Si la referencia NO es id/isbn, es una consulta tipo búsqueda => lista resultados
+            if rtype in {"autor", "titulo", "editorial", "ano"} and value:
+                ids = await store.find_ids({rtype: value})
+                if not ids:
+                    await update.message.reply_text("No hay resultados.")
+                    return
+
+                # Si hay 1 solo, ficha completa
+                if len(ids) == 1:
+                    row = await store.get_by_id(ids[0])
+                    await update.message.reply_text(fmt_row(row), parse_mode=ParseMode.HTML)
+                    return
+
+                # Si hay varios, lista paginada (ya ordenada por relevancia)
+                await reply_results(update, context, ids, f"Encontré {len(ids)} resultados")
+                return
+
+            book_id, row = await with_ref(store, ref, lambda s, i: s.get_by_id(i), write=False)
             if not book_id:
                 await update.message.reply_text(
                     "No pude identificar un único libro con esa referencia.\n"
@@ -427,7 +692,6 @@ async def process_natural_language(update: Update, context: ContextTypes.DEFAULT
                 )
                 return
 
-            row = store.get_by_id(book_id)
             if not row:
                 await update.message.reply_text("No encontrado.")
             else:
@@ -447,22 +711,20 @@ async def process_natural_language(update: Update, context: ContextTypes.DEFAULT
                 "isbn": (q.get("isbn") or "").strip(),
             }
             criteria = {k: v for k, v in criteria.items() if v}
-            res = store.find(criteria, limit=20)
-            if not res:
+            ids = await store.find_ids(criteria)
+            if not ids:
                 await update.message.reply_text("Sin resultados.")
                 return
-            lines = [f"• <code>{r['id']}</code> — {r.get('Título','')} ({r.get('Autor','')})" for r in res]
-            await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+            await reply_results(update, context, ids, f"Encontré {len(ids)} resultados")
             return
 
         if op == "last":
             n = int(action["n"])
-            res = store.last(n)
+            res = await store.last(n)
             if not res:
                 await update.message.reply_text("Sin registros.")
                 return
-            lines = [f"• <code>{r['id']}</code> — {r.get('Título','')} ({r.get('Autor','')})" for r in res]
-            await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+            await reply_results(update, context, [r["id"] for r in res], f"Últimos {len(res)} libros")
             return
 
         if op == "set_pos":
@@ -483,21 +745,19 @@ async def process_natural_language(update: Update, context: ContextTypes.DEFAULT
                 await update.message.reply_text("Me falta fila y/o columna. Ej: 'pon la fila 3 y columna 4 del libro 2'")
                 return
 
-            book_id = resolve_ref_to_id(store, ref)
+            new_pos = {"fila": int(pos["fila"]), "columna": int(pos["columna"])}
+            book_id, row = await with_ref(store, ref, lambda s, i: s.update_fields(i, new_pos))
             if not book_id:
                 await update.message.reply_text(
                     "No pude identificar un único libro con esa referencia.\n"
                     "Dame el id o más precisión."
                 )
                 return
-
-            ok = store.set_pos(book_id, fila=int(pos["fila"]), columna=int(pos["columna"]))
-            if not ok:
+            if not row:
                 await update.message.reply_text("No encontrado para actualizar posición.")
                 return
 
-            row = store.get_by_id(book_id)
-            await update.message.reply_text("✅ Posición actualizada\n\n" + fmt_row(row or {"id": book_id}), parse_mode=ParseMode.HTML)
+            await update.message.reply_text("✅ Posición actualizada\n\n" + fmt_row(row), parse_mode=ParseMode.HTML)
             return
 
 
@@ -507,19 +767,17 @@ async def process_natural_language(update: Update, context: ContextTypes.DEFAULT
             if not isbn:
                 await update.message.reply_text("ISBN vacío.")
                 return
-            book_id = resolve_ref_to_id(store, ref)
+            book_id, row = await with_ref(store, ref, lambda s, i: s.update_fields(i, {"isbn": isbn}))
             if not book_id:
                 await update.message.reply_text(
                     "No pude identificar un único libro con esa referencia.\n"
                     "Dame el id (ej: 1453) o más precisión."
                 )
                 return
-            ok = store.set_isbn(book_id, isbn=isbn)
-            if not ok:
+            if not row:
                 await update.message.reply_text("No encontrado para actualizar ISBN.")
                 return
-            row = store.get_by_id(book_id)
-            await update.message.reply_text("✅ ISBN actualizado\n\n" + fmt_row(row or {"id": book_id}), parse_mode=ParseMode.HTML)
+            await update.message.reply_text("✅ ISBN actualizado\n\n" + fmt_row(row), parse_mode=ParseMode.HTML)
             return
         
         if op == "update":
@@ -533,14 +791,6 @@ async def process_natural_language(update: Update, context: ContextTypes.DEFAULT
                 await update.message.reply_text("No veo cambios a aplicar. Dime qué campo quieres actualizar.")
                 return
 
-            book_id = resolve_ref_to_id(store, ref)
-            if not book_id:
-                await update.message.reply_text(
-                    "No pude identificar un único libro con esa referencia.\n"
-                    "Dame el id (ej: 1452) o más precisión."
-                )
-                return
-            
             if "f_revision" in changes:
                 v = changes["f_revision"]
 
@@ -560,104 +810,35 @@ async def process_natural_language(update: Update, context: ContextTypes.DEFAULT
                     else:
                         changes["f_revision"] = v
 
-            ok = store.update_fields(book_id, changes)
-            if not ok:
-                await update.message.reply_text("No encontrado para actualizar.")
-                return
-
-            row = store.get_by_id(book_id)
-            await update.message.reply_text("✅ Actualizado\n\n" + fmt_row(row or {"id": book_id}), parse_mode=ParseMode.HTML)
-            return
-
-        if op == "get":
-            # 1) Si viene id directo => un libro
-            book_id = (action.get("id") or "").strip()
-            if book_id:
-                row = store.get_by_id(book_id)
-                if not row:
-                    await update.message.reply_text("No encontrado.")
-                else:
-                    await update.message.reply_text(fmt_row(row), parse_mode=ParseMode.HTML)
-                return
-
-            ref = action.get("ref")
-            if not ref:
-                await update.message.reply_text("No entiendo qué libro consultar. Prueba con id, ISBN, título o autor.")
-                return
-
-            rtype = ref.get("type")
-            value = (ref.get("value") or "").strip()
-
-            # Si la referencia NO es id/isbn, entonces es una consulta tipo búsqueda => lista resultados
-            if rtype in {"autor", "titulo", "editorial", "ano"}:
-                # Mapea ref -> criteria interna del store
-                criteria = {}
-                if rtype == "autor":
-                    criteria["autor"] = value
-                elif rtype == "titulo":
-                    criteria["titulo"] = value
-                elif rtype == "editorial":
-                    criteria["editorial"] = value
-                elif rtype == "ano":
-                    criteria["ano"] = value
-
-                res = store.find(criteria, limit=20)
-                if not res:
-                    await update.message.reply_text("No hay resultados.")
-                    return
-
-                # Si hay 1 solo, puedes mostrar ficha completa
-                if len(res) == 1:
-                    await update.message.reply_text(fmt_row(res[0]), parse_mode=ParseMode.HTML)
-                    return
-
-                # Si hay varios, lista
-                lines = [f"Encontré {len(res)} resultados:\n"]
-                for r in res[:20]:
-                    lines.append(f"• <code>{r['id']}</code> — {r.get('Título','')} ({r.get('Autor','')})")
-                await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
-                return
-
-            # Si ref es id/isbn => intentar resolver a único y mostrar ficha
-            resolved_id, candidates = resolve_ref_to_id(store, ref)
-            if resolved_id:
-                row = store.get_by_id(resolved_id)
-                if not row:
-                    await update.message.reply_text("No encontrado.")
-                else:
-                    await update.message.reply_text(fmt_row(row), parse_mode=ParseMode.HTML)
+            book_id, row = await with_ref(store, ref, lambda s, i: s.update_fields(i, changes))
+            if not book_id:
+                await update.message.reply_text(
+                    "No pude identificar un único libro con esa referencia.\n"
+                    "Dame el id (ej: 1452) o más precisión."
+                )
                 return
-
-            # ISBN duplicado o id no encontrado
-            if not candidates:
-                await update.message.reply_text("No hay resultados.")
+            if not row:
+                await update.message.reply_text("No encontrado para actualizar.")
                 return
 
-            lines = ["Encontré varios. Indícame el id exacto, por ejemplo: 723\n"]
-            for r in candidates[:10]:
-                lines.append(f"• <code>{r['id']}</code> — {r.get('Título','')} ({r.get('Autor','')})")
-            await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+            await update.message.reply_text("✅ Actualizado\n\n" + fmt_row(row), parse_mode=ParseMode.HTML)
             return
 
-
-        
         if op == "delete":
             ref = action.get("ref")
             if not ref:
                 await update.message.reply_text("Dime qué libro borrar (por id).")
                 return
 
-            book_id = resolve_ref_to_id(store, ref)
+            book_id, ok = await with_ref(store, ref, lambda s, i: s.delete(i))
             if book_id is None:
                 await update.message.reply_text("No pude identificar ese libro para borrarlo.")
                 return
-
-            ok = store.delete_and_compact(book_id)
             if not ok:
                 await update.message.reply_text("No encontrado para borrar.")
                 return
 
-            await update.message.reply_text(f"🗑️ Borrado el libro {book_id} y compactado el catálogo.")
+            await update.message.reply_text(f"🗑️ Borrado el libro {book_id}. Los demás ids no cambian.")
             return
 
 
@@ -666,7 +847,11 @@ async def process_natural_language(update: Update, context: ContextTypes.DEFAULT
 
     except Exception as e:
         log.exception("Error")
-        await update.message.reply_text(f"❌ Error: {e}")
+        trace_id = tracing.current_id()
+        await update.message.reply_text(f"❌ Error: {e}" + (f"\n(traza {trace_id})" if trace_id else ""))
+
+    finally:
+        REGISTRY.observe("nl_seconds", time.perf_counter() - t0, op=op)
 
 
 
@@ -674,18 +859,76 @@ async def process_natural_language(update: Update, context: ContextTypes.DEFAULT
 ####################################### MAIN  ####################################################
 ##################################################################################################   
 
-def main() -> None:
-    s = get_settings()
+def llm_cost(update: object) -> float:
+    """
+    Fichas del cubo por chat que gasta un update: las líneas que irán al
+    LLM. Comandos y atajos de command_parser no gastan; un audio, una.
+    """
+    if not isinstance(update, Update) or update.message is None:
+        return 0.0
+    msg = update.message
+    if msg.voice or msg.audio:
+        return 1.0
+    text = msg.text or ""
+    if text.startswith("/"):
+        return 0.0
+    lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
+    return float(sum(1 for ln in lines if parse_command(ln) is None))
+
+
+def build_application(s) -> Application:
+    """Store, LLM, handlers y Application a partir de Settings (sin arrancar)."""
     print("📄 Excel en uso:", s.excel_path)
     print("📑 Hoja en uso:", s.excel_sheet)
 
-    store = ExcelStore(s.excel_path, s.excel_sheet)
-    llm = LLMTransformer(api_key=s.openai_api_key, model=s.openai_model)
+    if s.store_backend == "sqlite":
+        print("🗄️ SQLite en uso:", s.sqlite_path)
+        store = SQLiteStore(s.sqlite_path, s.excel_sheet)
+        # primera vez: importación única desde el Excel
+        if store.count() == 0 and os.path.exists(s.excel_path):
+            n = store.import_xlsx(s.excel_path, s.excel_sheet)
+            print(f"📥 Importados {n} libros desde el Excel")
+    else:
+        store = ExcelStore(s.excel_path, s.excel_sheet)
+
+    # los handlers usan la fachada async: el disco y el lock van en su propio hilo
+    store = AsyncExcelStore(store, workers=s.store_workers)
+
+    cache = None
+    if s.llm_cache_size > 0:
+        cache = ActionCache(s.llm_cache_path, max_entries=s.llm_cache_size, ttl=s.llm_cache_ttl)
+        print(f"🧠 Caché del LLM: {s.llm_cache_path} ({len(cache)} frases)")
+    llm = LLMTransformer(
+        api_key=s.openai_api_key,
+        model=s.openai_model,
+        max_concurrency=s.llm_max_concurrency,
+        timeout=s.llm_timeout,
+        cache=cache,
+        routing=s.llm_prompt_routing,
+    )
 
-    app = Application.builder().token(s.telegram_token).build()
+    builder = Application.builder().token(s.telegram_token)
+    if s.telegram_api_url:
+        builder = builder.base_url(s.telegram_api_url)
+    # mismo pool que el request por defecto de PTB, midiendo cada respuesta
+    builder = builder.request(TracedRequest(connection_pool_size=256))
+    # chats en paralelo, cada uno en orden, por turnos y con límite de LLM
+    builder = builder.concurrent_updates(FairUpdateProcessor(
+        workers=s.update_workers,
+        rate=s.chat_llm_rate / 60,
+        burst=s.chat_llm_burst,
+        cost=llm_cost,
+    ))
+    app = builder.build()
+    if s.trace_slow_ms >= 0:
+        tracing.configure(s.trace_path, s.trace_slow_ms, max_bytes=s.trace_max_bytes, backups=s.trace_backups)
+        print(f"⏱️ Trazas de más de {s.trace_slow_ms:g} ms en {s.trace_path}")
     app.bot_data["settings"] = s
     app.bot_data["store"] = store
     app.bot_data["llm"] = llm
+    basename = os.path.splitext(os.path.basename(s.excel_path))[0]
+    app.bot_data["exports"] = ExportCache(s.export_cache_dir, basename=basename)
+    app.bot_data["pages"] = ResultPages(page_size=s.results_page_size, ttl=s.results_page_ttl)
 
     stt = Speech2Text(api_key=s.openai_api_key, model="gpt-4o-mini-transcribe")
     app.bot_data["stt"] = stt
@@ -695,12 +938,55 @@ def main() -> None:
     app.add_handler(CommandHandler("help", help_cmd))
     app.add_handler(CommandHandler("export", export_cmd))
     app.add_handler(CommandHandler("authorize", authorize))
+    app.add_handler(CommandHandler("compact", compact_cmd))
+    app.add_handler(CommandHandler("stats", stats_cmd))
     app.add_handler(MessageHandler(filters.TEXT, handle_text))
     app.add_handler(MessageHandler(filters.VOICE | filters.AUDIO, handle_audio))
+    app.add_handler(MessageHandler(filters.Document.ALL, handle_document))
+    app.add_handler(CallbackQueryHandler(page_callback, pattern=f"^{CALLBACK_PREFIX}"))
     app.add_error_handler(error_handler)
+    return app
+
+
+def webhook_options(s) -> dict[str, Any]:
+    """
+    Parámetros de run_webhook / Updater.start_webhook: servidor HTTP local
+    de python-telegram-bot en WEBHOOK_LISTEN:WEBHOOK_PORT/WEBHOOK_PATH, que
+    rechaza (403) las peticiones sin la cabecera con WEBHOOK_SECRET.
+    """
+    return {
+        "listen": s.webhook_listen,
+        "port": s.webhook_port,
+        "url_path": s.webhook_path,
+        "webhook_url": f"{s.webhook_url.rstrip('/')}/{s.webhook_path}",
+        "secret_token": s.webhook_secret,
+        "max_connections": s.webhook_max_connections,
+        "allowed_updates": Update.ALL_TYPES,
+    }
+
+
+def main() -> None:
+    s = get_settings()
+    app = build_application(s)
 
+    metrics_server = None
+    if s.metrics_port:
+        # texto de Prometheus en local; no exponerlo fuera sin proxy
+        metrics_server = start_http_server(s.metrics_listen, s.metrics_port)
+        print(f"📈 Métricas en http://{s.metrics_listen}:{s.metrics_port}/metrics")
 
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    try:
+        if s.bot_mode == "webhook":
+            print(f"🌐 Webhook en {s.webhook_listen}:{s.webhook_port}/{s.webhook_path}")
+            app.run_webhook(**webhook_options(s))
+        else:
+            app.run_polling(allowed_updates=Update.ALL_TYPES)
+    finally:
+        # vuelca al Excel lo que quede en el diario / cierra SQLite
+        app.bot_data["store"].close()
+        app.bot_data["llm"].close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
 
 
 if __name__ == "__main__":
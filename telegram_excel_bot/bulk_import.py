@@ -0,0 +1,181 @@
+"""
+Lectura y validación de un CSV/.xlsx subido al bot para altas en bloque.
+
+Las columnas se reconocen con HEADER_MAP (las mismas variantes de
+cabecera que acepta el Excel del catálogo); las desconocidas y la columna
+id se ignoran, porque los ids los asigna el store. Cada fila válida sale
+como un `book` con claves internas (las de add); cada fila rechazada, como
+un error "fila N: motivo" con N la fila del fichero.
+"""
+import csv
+import io
+import os
+from datetime import date, datetime
+from typing import Any, Iterable, Optional
+
+from openpyxl import load_workbook
+
+from telegram_excel_bot.excel_store import FIELD_TO_HEADER, HEADER_MAP, _isbn_key
+
+
+SUPPORTED_EXTENSIONS = (".csv", ".xlsx")
+
+# Filas de datos como máximo por fichero
+MAX_ROWS = 5000
+
+HEADER_TO_FIELD = {h: k for k, h in FIELD_TO_HEADER.items()}
+
+
+class ImportFormatError(Exception):
+    """El fichero no se puede leer como catálogo (formato, cabecera...)."""
+
+
+# ---------- lectura ----------
+
+def _read_csv(path: str) -> list[list[Any]]:
+    with open(path, "rb") as f:
+        data = f.read()
+    for encoding in ("utf-8-sig", "cp1252"):
+        try:
+            text = data.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise ImportFormatError("No se reconoce la codificación del CSV (usa UTF-8).")
+
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    return [row for row in csv.reader(io.StringIO(text), dialect)]
+
+
+def _read_xlsx(path: str) -> list[list[Any]]:
+    try:
+        wb = load_workbook(path, read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFormatError(f"No se puede abrir el .xlsx: {e}") from e
+    try:
+        return [list(r) for r in wb.active.iter_rows(values_only=True)]
+    finally:
+        wb.close()
+
+
+def read_rows(path: str) -> list[list[Any]]:
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return _read_csv(path)
+    if ext == ".xlsx":
+        return _read_xlsx(path)
+    raise ImportFormatError(f"Formato no soportado: {ext or '?'} (usa .csv o .xlsx)")
+
+
+# ---------- cabecera ----------
+
+def map_header(values: Iterable[Any]) -> dict[str, int]:
+    """Cabecera del fichero -> {clave interna: índice de columna (0-based)}."""
+    idx: dict[str, int] = {}
+    for i, value in enumerate(values):
+        if value is None:
+            continue
+        raw = str(value).strip()
+        header = HEADER_MAP.get(raw.lower()) or HEADER_MAP.get(raw)
+        field = HEADER_TO_FIELD.get(header) if header else None
+        if field and field not in idx:
+            idx[field] = i
+    return idx
+
+
+# ---------- validación ----------
+
+def _text(v: Any) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    return str(v).strip()
+
+
+def _int(v: Any, name: str, lo: int, hi: int) -> Optional[int]:
+    s = _text(v)
+    if not s:
+        return None
+    try:
+        n = int(float(s)) if "." in s else int(s)
+    except ValueError:
+        raise ValueError(f"{name} '{s}' no es un número")
+    if not lo <= n <= hi:
+        raise ValueError(f"{name} {n} fuera de rango ({lo}-{hi})")
+    return n
+
+
+def _isbn(v: Any) -> str:
+    s = _text(v)
+    if not s:
+        return ""
+    k = _isbn_key(s) or ""
+    ok13 = len(k) == 13 and k.isdigit() and k[:3] in ("978", "979")
+    ok10 = len(k) == 10 and k[:9].isdigit() and (k[9].isdigit() or k[9] == "X")
+    if not (ok13 or ok10):
+        raise ValueError(f"ISBN '{s}' no válido")
+    return s
+
+
+def _revision(v: Any) -> str:
+    if isinstance(v, (datetime, date)):
+        return v.strftime("%d/%m/%Y")
+    return _text(v)
+
+
+def parse_book(values: list[Any], idx: dict[str, int]) -> dict[str, Any]:
+    """Fila del fichero -> book con claves internas. ValueError si no vale."""
+    def cell(field: str) -> Any:
+        i = idx.get(field)
+        return values[i] if i is not None and i < len(values) else None
+
+    book = {
+        "titulo": _text(cell("titulo")),
+        "autor": _text(cell("autor")),
+        "procedencia": _text(cell("procedencia")),
+        "categoria": _text(cell("categoria")),
+        "editorial": _text(cell("editorial")),
+        "ano": _int(cell("ano"), "Año", 1, date.today().year + 1),
+        "columna": _int(cell("columna"), "Columna", 0, 9999),
+        "fila": _int(cell("fila"), "Fila", 0, 9999),
+        "isbn": _isbn(cell("isbn")),
+        "f_revision": _revision(cell("f_revision")),
+        "comentarios": _text(cell("comentarios")),
+    }
+    if not book["titulo"]:
+        raise ValueError("falta Título")
+    return book
+
+
+def load_books(path: str) -> tuple[list[dict[str, Any]], list[str]]:
+    """
+    Libros válidos y errores por fila del fichero en `path`.
+    Las filas vacías no cuentan ni como aceptadas ni como rechazadas.
+    """
+    rows = read_rows(path)
+    if not rows:
+        raise ImportFormatError("El fichero está vacío.")
+
+    idx = map_header(rows[0])
+    if "titulo" not in idx:
+        raise ImportFormatError("La primera fila debe ser la cabecera y tener al menos la columna Título.")
+
+    data = rows[1:]
+    if len(data) > MAX_ROWS:
+        raise ImportFormatError(f"Demasiadas filas ({len(data)}); como mucho {MAX_ROWS} por fichero.")
+
+    books: list[dict[str, Any]] = []
+    errors: list[str] = []
+    for n, values in enumerate(data, start=2):
+        if not any(_text(v) for v in values):
+            continue
+        try:
+            books.append(parse_book(values, idx))
+        except ValueError as e:
+            errors.append(f"fila {n}: {e}")
+    return books, errors
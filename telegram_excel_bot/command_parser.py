@@ -0,0 +1,160 @@
+"""
+Atajos sin LLM para las órdenes más repetidas.
+
+parse_command() reconoce con expresiones precompiladas un puñado de frases
+que el SYSTEM del LLM ya describe con reglas fijas y devuelve la misma
+acción que devolvería el LLM. Si la frase no encaja del todo, devuelve None
+y decide el LLM: ante la duda, no se adivina.
+
+    dame el 3756                        -> get id
+    borra el libro 12                   -> delete ref id
+    busca por autor Platón              -> find query.autor
+    últimos 5                           -> last
+    pon la fila 3 y columna 4 al libro 2 -> set_pos (en el orden dicho)
+    pon el isbn 978-84-... al libro 7   -> set_isbn
+    marca como revisado el libro 6      -> update f_revision ""
+    978-84-376-0494-7                   -> get ref isbn
+"""
+import re
+from typing import Any, Optional
+
+
+_SPACES_RE = re.compile(r"\s+")
+_TRAILING_RE = re.compile(r"[\s.!¡?¿]+$")
+
+# ---------- piezas ----------
+
+# id interno: número corto (un ISBN nunca lo es)
+_ID = r"(?P<id>\d{1,6})"
+_ID_WORD = r"(?:(?:con )?(?:id|n[uú]mero|n[º°o]\.?) )?"
+# "el 12", "el libro 12", "libro con id 12", "12"
+_BOOK = r"(?:el )?(?:libro )?" + _ID_WORD
+# "al libro 12", "del 12", "en el libro 12", "para el 12"
+_TO_BOOK = r"(?:(?:a|en|de|para) (?:el )?|al |del )(?:libro )?" + _ID_WORD
+_ISBN_VALUE = r"(?P<isbn>[0-9][0-9\- ]{8,20}[0-9Xx])"
+
+_FIND_FIELDS = {
+    "autor": "autor",
+    "titulo": "titulo",
+    "título": "titulo",
+    "editorial": "editorial",
+    "año": "ano",
+    "ano": "ano",
+    "isbn": "isbn",
+}
+_FIELD = r"autor|t[íi]tulo|editorial|a[ñn]o|isbn"
+# otro criterio dentro del valor ("por título X y autor Y"): mejor el LLM
+_MORE_FIELDS_RE = re.compile(r"(?:^|[\s,])(?:" + _FIELD + r")\b", re.IGNORECASE)
+
+
+def _compile(pattern: str) -> re.Pattern:
+    return re.compile(r"^" + pattern + r"$", re.IGNORECASE)
+
+
+_GET_RE = _compile(
+    r"(?:dame|d[ée]jame ver|mu[ée]strame|ens[ée][ñn]ame|consulta|dime)"
+    r"(?: los datos| la ficha)? (?:de |del )?" + _BOOK + _ID
+)
+_DELETE_RE = _compile(r"(?:borra|elimina|quita) " + _BOOK + _ID)
+_FIND_RE = _compile(
+    r"(?:busca|buscar|encuentra|lista|mu[ée]strame todos|dame todos)"
+    r"(?: (?:los )?libros)? (?:por|de|del|con)(?: el| la)? "
+    r"(?P<field>" + _FIELD + r"):? (?P<value>.+)"
+)
+_LAST_RE = _compile(r"(?:(?:dame|mu[ée]strame) )?(?:los )?[úu]ltimos (?P<n>\d{1,3})(?: libros)?")
+_POS_RE = _compile(
+    r"(?:pon|cambia|mueve|coloca|establece|actualiza) (?:la )?"
+    r"(?P<k1>fila|columna) (?P<v1>\d{1,4}),? y (?:la )?(?P<k2>fila|columna) (?P<v2>\d{1,4}) "
+    + _TO_BOOK + _ID
+)
+_SET_ISBN_RE = _compile(
+    r"(?:pon|cambia|establece|actualiza|a[ñn]ade) (?:el )?isbn:? " + _ISBN_VALUE + " " + _TO_BOOK + _ID
+)
+_REVISED_RE = _compile(r"marca(?:r)? (?:como )?revisado " + _BOOK + _ID)
+_REVISED_AFTER_RE = _compile(r"marca(?:r)? " + _BOOK + _ID + r" como revisado")
+_BARE_ISBN_RE = _compile(
+    r"(?:(?:dame|consulta|mu[ée]strame) )?(?:el )?(?:isbn:? )?" + _ISBN_VALUE
+)
+
+
+def _normalize(text: str) -> str:
+    t = _SPACES_RE.sub(" ", text).strip()
+    return _TRAILING_RE.sub("", t)
+
+
+def _isbn(raw: str) -> Optional[str]:
+    """ISBN tal cual lo escribió el usuario si parece uno (10 dígitos o 13 con 978/979)."""
+    value = raw.strip()
+    compact = re.sub(r"[\- ]", "", value).upper()
+    if len(compact) == 13 and compact.isdigit() and compact[:3] in ("978", "979"):
+        return value
+    if len(compact) == 10 and compact[:9].isdigit() and (compact[9].isdigit() or compact[9] == "X"):
+        return value
+    return None
+
+
+def _ref_id(book_id: str) -> dict[str, str]:
+    return {"type": "id", "value": str(int(book_id))}
+
+
+def _strip_quotes(value: str) -> str:
+    return value.strip().strip("\"'«»“”").strip()
+
+
+# ---------- entrada ----------
+
+def parse_command(text: str) -> Optional[dict[str, Any]]:
+    """Acción para `text` si es una orden de las conocidas; si no, None (al LLM)."""
+    t = _normalize(text or "")
+    if not t or len(t) > 200:
+        return None
+
+    m = _GET_RE.match(t)
+    if m:
+        return {"op": "get", "id": str(int(m["id"]))}
+
+    m = _DELETE_RE.match(t)
+    if m:
+        return {"op": "delete", "ref": _ref_id(m["id"])}
+
+    m = _FIND_RE.match(t)
+    if m:
+        field = _FIND_FIELDS[m["field"].lower()]
+        value = _strip_quotes(m["value"])
+        if not value or _MORE_FIELDS_RE.search(value):
+            return None
+        if field == "isbn" and _isbn(value) is None:
+            return None
+        return {"op": "find", "query": {field: value}}
+
+    m = _LAST_RE.match(t)
+    if m:
+        n = int(m["n"])
+        return {"op": "last", "n": n} if n > 0 else None
+
+    m = _POS_RE.match(t)
+    if m:
+        k1, k2 = m["k1"].lower(), m["k2"].lower()
+        if k1 == k2:
+            return None
+        pos = {k1: int(m["v1"]), k2: int(m["v2"])}
+        return {"op": "set_pos", "ref": _ref_id(m["id"]), "pos": {"fila": pos["fila"], "columna": pos["columna"]}}
+
+    m = _SET_ISBN_RE.match(t)
+    if m:
+        isbn = _isbn(m["isbn"])
+        if isbn is None:
+            return None
+        return {"op": "set_isbn", "ref": _ref_id(m["id"]), "isbn": isbn}
+
+    m = _REVISED_RE.match(t) or _REVISED_AFTER_RE.match(t)
+    if m:
+        return {"op": "update", "ref": _ref_id(m["id"]), "changes": {"f_revision": ""}}
+
+    m = _BARE_ISBN_RE.match(t)
+    if m:
+        isbn = _isbn(m["isbn"])
+        if isbn is not None:
+            return {"op": "get", "ref": {"type": "isbn", "value": isbn}}
+
+    return None
@@ -31,8 +31,37 @@ class Settings:
     disable_auth: bool
     openai_api_key: str
     openai_model: str
+    llm_max_concurrency: int
+    llm_timeout: float
+    llm_cache_path: str
+    llm_cache_size: int
+    llm_cache_ttl: float
+    llm_prompt_routing: bool
     env_path: str
     admin_chat_id: int | None
+    store_backend: str
+    sqlite_path: str
+    store_workers: int
+    export_cache_dir: str
+    results_page_size: int
+    results_page_ttl: float
+    telegram_api_url: str
+    bot_mode: str
+    update_workers: int
+    chat_llm_rate: float
+    chat_llm_burst: float
+    webhook_url: str
+    webhook_listen: str
+    webhook_port: int
+    webhook_path: str
+    webhook_secret: str
+    webhook_max_connections: int
+    metrics_listen: str
+    metrics_port: int
+    trace_path: str
+    trace_slow_ms: float
+    trace_max_bytes: int
+    trace_backups: int
 
 
 def get_settings() -> Settings:
@@ -51,12 +80,69 @@ def get_settings() -> Settings:
         raise RuntimeError("Falta OPENAI_API_KEY en .env")
 
     openai_model = os.getenv("OPENAI_MODEL", "gpt-5.2-mini").strip()
+    llm_max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+    llm_timeout = float(os.getenv("LLM_TIMEOUT", "30"))
+
+    # caché texto -> acción; LLM_CACHE_SIZE=0 la desactiva
+    llm_cache_path = os.getenv("LLM_CACHE_PATH", "").strip() or os.path.splitext(excel_path)[0] + ".llm_cache.json"
+    llm_cache_size = int(os.getenv("LLM_CACHE_SIZE", "2000"))
+    llm_cache_ttl = float(os.getenv("LLM_CACHE_TTL_DAYS", "7")) * 24 * 3600
+    # solo el módulo del prompt de la intención del mensaje (false = siempre completo)
+    llm_prompt_routing = _parse_bool(os.getenv("LLM_PROMPT_ROUTING", "true"), default=True)
 
     admin_chat_ids_raw = os.getenv("ADMIN_CHAT_IDS", "").strip()
     admin_chat_ids = int(admin_chat_ids_raw) if admin_chat_ids_raw else None
 
     env_path = os.getenv("ENV_PATH", ".env")
 
+    # "excel" (por defecto) o "sqlite"
+    store_backend = os.getenv("STORE_BACKEND", "excel").strip().lower()
+    if store_backend not in {"excel", "sqlite"}:
+        raise RuntimeError(f"STORE_BACKEND no válido: {store_backend} (usa excel o sqlite)")
+    sqlite_path = os.getenv("SQLITE_PATH", "").strip() or os.path.splitext(excel_path)[0] + ".sqlite3"
+    # hilos del store: las lecturas van a la vez, las escrituras de una en una
+    store_workers = int(os.getenv("STORE_WORKERS", "4"))
+    # ficheros de /export ya generados (uno por formato y versión del catálogo)
+    export_cache_dir = os.getenv("EXPORT_CACHE_DIR", "").strip() or os.path.splitext(excel_path)[0] + ".exports"
+    # resultados por página y minutos que se recuerda una búsqueda para paginarla
+    results_page_size = int(os.getenv("RESULTS_PAGE_SIZE", "10"))
+    results_page_ttl = float(os.getenv("RESULTS_PAGE_TTL_MIN", "30")) * 60
+
+    # servidor de la Bot API (vacío = el de Telegram; p. ej. uno local)
+    telegram_api_url = os.getenv("TELEGRAM_API_URL", "").strip()
+
+    # recepción de updates: "polling" (por defecto) o "webhook"
+    bot_mode = os.getenv("BOT_MODE", "polling").strip().lower()
+    if bot_mode not in {"polling", "webhook"}:
+        raise RuntimeError(f"BOT_MODE no válido: {bot_mode} (usa polling o webhook)")
+    # updates procesados a la vez (de chats distintos; cada chat va en orden)
+    update_workers = max(1, int(os.getenv("UPDATE_WORKERS", "4")))
+    # cubo de fichas por chat para lo que va al LLM: recarga por minuto y máximo
+    chat_llm_rate = float(os.getenv("CHAT_LLM_RATE_PER_MIN", "30"))
+    chat_llm_burst = float(os.getenv("CHAT_LLM_BURST", "10"))
+
+    webhook_url = os.getenv("WEBHOOK_URL", "").strip()
+    webhook_listen = os.getenv("WEBHOOK_LISTEN", "0.0.0.0").strip()
+    webhook_port = int(os.getenv("WEBHOOK_PORT", "8443"))
+    webhook_path = os.getenv("WEBHOOK_PATH", "telegram").strip().strip("/")
+    webhook_secret = os.getenv("WEBHOOK_SECRET", "").strip()
+    webhook_max_connections = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+    # endpoint de métricas para Prometheus (0 = apagado)
+    metrics_listen = os.getenv("METRICS_LISTEN", "127.0.0.1").strip()
+    metrics_port = int(os.getenv("METRICS_PORT", "0") or 0)
+
+    # trazas por update: las de más de TRACE_SLOW_MS van a un JSONL rotativo (negativo = apagado)
+    trace_path = os.getenv("TRACE_PATH", "").strip() or os.path.splitext(excel_path)[0] + ".traces.jsonl"
+    trace_slow_ms = float(os.getenv("TRACE_SLOW_MS", "3000") or 3000)
+    trace_max_bytes = int(float(os.getenv("TRACE_MAX_MB", "5")) * 1024 * 1024)
+    trace_backups = int(os.getenv("TRACE_BACKUPS", "3"))
+
+    if bot_mode == "webhook":
+        if not webhook_url:
+            raise RuntimeError("Falta WEBHOOK_URL en .env (URL pública https que ve Telegram)")
+        if not webhook_secret:
+            raise RuntimeError("Falta WEBHOOK_SECRET en .env (1-256 caracteres A-Z a-z 0-9 _ -)")
+
     return Settings(
         telegram_token=telegram_token,
         excel_path=excel_path,
@@ -65,6 +151,35 @@ def get_settings() -> Settings:
         disable_auth=disable_auth,
         openai_api_key=openai_api_key,
         openai_model=openai_model,
+        llm_max_concurrency=llm_max_concurrency,
+        llm_timeout=llm_timeout,
+        llm_cache_path=llm_cache_path,
+        llm_cache_size=llm_cache_size,
+        llm_cache_ttl=llm_cache_ttl,
+        llm_prompt_routing=llm_prompt_routing,
         admin_chat_id=admin_chat_ids,
         env_path=env_path,
+        store_backend=store_backend,
+        sqlite_path=sqlite_path,
+        store_workers=store_workers,
+        export_cache_dir=export_cache_dir,
+        results_page_size=results_page_size,
+        results_page_ttl=results_page_ttl,
+        telegram_api_url=telegram_api_url,
+        bot_mode=bot_mode,
+        update_workers=update_workers,
+        chat_llm_rate=chat_llm_rate,
+        chat_llm_burst=chat_llm_burst,
+        webhook_url=webhook_url,
+        webhook_listen=webhook_listen,
+        webhook_port=webhook_port,
+        webhook_path=webhook_path,
+        webhook_secret=webhook_secret,
+        webhook_max_connections=webhook_max_connections,
+        metrics_listen=metrics_listen,
+        metrics_port=metrics_port,
+        trace_path=trace_path,
+        trace_slow_ms=trace_slow_ms,
+        trace_max_bytes=trace_max_bytes,
+        trace_backups=trace_backups,
     )
@@ -1,10 +1,32 @@
+import bisect
+import hashlib
+import heapq
+import json
+import logging
 import os
-from typing import Any, Optional
+import re
+import shutil
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from contextlib import contextmanager
+from datetime import date
+from typing import Any, Iterable, Iterator, Optional
 
-from filelock import FileLock
 from openpyxl import Workbook, load_workbook
+from openpyxl.workbook.defined_name import DefinedName
 from openpyxl.worksheet.worksheet import Worksheet
 
+from telegram_excel_bot.exports import write_rows
+from telegram_excel_bot.metrics import measure_store_op, store_op
+from telegram_excel_bot.rwlock import RWFileLock
+from telegram_excel_bot.tracing import span
+from telegram_excel_bot.xlsx_reader import UnsupportedSheet, defined_name, read_sheet
+
+log = logging.getLogger("catalogo-bot")
+
 
 # Cabeceras canónicas (humanas)
 HEADERS = [
@@ -14,6 +36,15 @@ HEADERS = [
 ]
 
 
+# Columna opcional de borrado lógico: fecha del borrado, vacía en las filas
+# vivas. Si la hoja no la tiene, se añade al final con el primer borrado.
+TOMBSTONE_HEADER = "Borrado"
+
+# Nombre definido del libro con el último registro del diario ya volcado al
+# .xlsx: al reaplicar el diario se saltan los de seq <= ese número.
+JOURNAL_SEQ_NAME = "ZenoJournalSeq"
+
+
 # Mapa de normalización: Excel → clave canónica
 HEADER_MAP = {
     "id": "id",
@@ -48,20 +79,487 @@ HEADER_MAP = {
     "fecha revisión": "F_revision",
     "frevision": "F_revision",
     "f_revisión": "F_revision",
+
+    "borrado": TOMBSTONE_HEADER,
+}
+
+
+def _id_key(v: Any) -> Optional[str]:
+    """Clave canónica de un id: 3, "3", " 3 " y "003" son el mismo libro."""
+    if v is None:
+        return None
+    s = str(v).strip()
+    if not s:
+        return None
+    try:
+        return str(int(s))
+    except ValueError:
+        return s
+
+
+_ISBN_STRIP_RE = re.compile(r"[^0-9A-Za-z]")
+
+
+def _isbn_key(v: Any) -> Optional[str]:
+    """ISBN sin guiones ni espacios y en mayúsculas (la X final del ISBN-10)."""
+    if v is None:
+        return None
+    s = _ISBN_STRIP_RE.sub("", str(v)).upper()
+    return s or None
+
+
+# Claves internas de update_fields -> cabecera canónica
+FIELD_TO_HEADER = {
+    "titulo": "Título",
+    "autor": "Autor",
+    "procedencia": "Procedencia",
+    "categoria": "Categoría",
+    "editorial": "Editorial",
+    "ano": "Año",
+    "columna": "Columna",
+    "fila": "Fila",
+    "isbn": "ISBN",
+    "f_revision": "F_revision",
+    "comentarios": "Comentarios",
 }
 
+INT_FIELDS = ("fila", "columna", "ano")
+
+
+def _coerce_changes(changes: dict[str, Any]) -> dict[str, Any]:
+    """
+    changes con claves internas -> {cabecera: valor} listo para escribir.
+    Enteros para fila/columna/año (None o "" vacían), texto para el resto ("" vacía).
+    Claves desconocidas se ignoran.
+    """
+    out: dict[str, Any] = {}
+    for k, v in changes.items():
+        header = FIELD_TO_HEADER.get(k)
+        if not header:
+            continue
+
+        if k in INT_FIELDS:
+            out[header] = None if v is None or v == "" else int(v)
+        else:
+            out[header] = "" if v is None else str(v)
+    return out
+
+
+# Columnas de texto con índice invertido de trigramas (búsquedas por subcadena)
+TEXT_HEADERS = ("Título", "Autor", "Editorial")
+
+# Columnas por las que se puede filtrar en find(); su texto normalizado se
+# precalcula una vez por fila
+SEARCH_HEADERS = TEXT_HEADERS + ("Año", "ISBN", "Fila", "Columna", "id")
+
+# Fracción mínima de trigramas de la consulta que debe tener una fila para
+# entrar como resultado aproximado
+FUZZY_MIN_SCORE = 0.5
+
+# Tope de find() (filas completas) y de find_ids() (solo ids, para paginar)
+FIND_MAX_ROWS = 50
+FIND_MAX_IDS = 2000
+
+
+def _fold(v: Any) -> str:
+    """Minúsculas y sin tildes: "Platón" -> "platon"."""
+    if v is None:
+        return ""
+    s = unicodedata.normalize("NFKD", str(v))
+    return "".join(c for c in s if not unicodedata.combining(c)).casefold()
+
+
+def _trigrams(s: str) -> set[str]:
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+# Columnas enteras: se guardan en array("q"), 8 bytes por fila
+INT_HEADERS = ("id", "Año", "Columna", "Fila")
+
+# Columnas con muchos valores repetidos: cadenas internadas (una copia por valor)
+INTERNED_HEADERS = ("Autor", "Procedencia", "Categoría", "Editorial", "F_revision")
+
+# Marcas en las columnas enteras: celda vacía / valor no entero (va en `boxed`)
+_NULL = -(2 ** 63)
+_BOXED = -(2 ** 63) + 1
+
+
+class _Catalog:
+    """
+    Hoja en memoria con índices hash, guardada por columnas.
+
+    Cada fila vive en un "slot" estable que no cambia aunque se borren filas
+    anteriores, así los índices no hay que reescribirlos al desplazar filas.
+    Los slots se reparten crecientes en orden de hoja, de modo que la lista
+    ordenada de slots vivos es justo el orden del Excel.
+
+    Los valores no se guardan como un dict por fila sino en una columna por
+    cabecera indexada por slot: array("q") para id/Año/Columna/Fila (los
+    valores que no son enteros, p. ej. un Año "1950?", van aparte en
+    `boxed`) y listas para el texto, con las cadenas repetidas internadas.
+    Los dicts solo se construyen (row()) para las filas que se devuelven.
+
+    De cada fila se guarda el texto ya normalizado (_fold) de las columnas
+    buscables y, para Título, Autor y Editorial, un índice invertido
+    trigrama -> slots sobre " texto " (con espacios de borde para que las
+    palabras cortas también tengan trigramas). Una subcadena de 3 o más
+    caracteres solo puede estar en filas que contengan todos sus trigramas.
+
+    Las filas borradas (tombstones, en `deleted`) siguen en `order` para
+    que los ids no se muevan (id = fila - 1), pero salen de todos los
+    índices y su texto queda vacío: ninguna consulta las ve.
+    """
+
+    def __init__(self, rows: list[dict[str, Any]]):
+        self.order: list[int] = []
+        self.ints: dict[str, array] = {h: array("q") for h in INT_HEADERS}
+        self.boxed: dict[str, dict[int, Any]] = {h: {} for h in INT_HEADERS}
+        self.strs: dict[str, list[Any]] = {h: [] for h in HEADERS if h not in INT_HEADERS}
+        self.by_id: dict[str, int] = {}
+        self.by_isbn: dict[str, set[int]] = {}
+        self.text: dict[str, list[str]] = {h: [] for h in SEARCH_HEADERS}
+        self.grams: dict[str, dict[str, set[int]]] = {h: {} for h in TEXT_HEADERS}
+        self.deleted: set[int] = set()
+        for rowd in rows:
+            self.append(rowd)
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    # ---------- celdas ----------
+
+    def get(self, slot: int, header: str) -> Any:
+        col = self.ints.get(header)
+        if col is None:
+            return self.strs[header][slot]
+        v = col[slot]
+        if v == _NULL:
+            return None
+        if v == _BOXED:
+            return self.boxed[header][slot]
+        return v
+
+    def _set(self, slot: int, header: str, v: Any) -> None:
+        col = self.ints.get(header)
+        if col is None:
+            if header in INTERNED_HEADERS and type(v) is str:
+                v = sys.intern(v)
+            self.strs[header][slot] = v
+            return
+
+        boxed = self.boxed[header]
+        boxed.pop(slot, None)
+        if v is None:
+            col[slot] = _NULL
+        elif type(v) is int and _BOXED < v < 2 ** 63:
+            col[slot] = v
+        else:
+            col[slot] = _BOXED
+            boxed[slot] = v
+
+    def row(self, slot: int) -> dict[str, Any]:
+        """Vista dict (cabeceras canónicas) de una fila; es una copia."""
+        return {h: self.get(slot, h) for h in HEADERS}
+
+    # ---------- índices ----------
+
+    def _index(self, slot: int) -> None:
+        k = _id_key(self.get(slot, "id"))
+        if k is not None:
+            # ids duplicados: gana la primera fila, como hacía el recorrido lineal
+            self.by_id.setdefault(k, slot)
+        k = _isbn_key(self.get(slot, "ISBN"))
+        if k is not None:
+            self.by_isbn.setdefault(k, set()).add(slot)
+        for h in SEARCH_HEADERS:
+            self.text[h][slot] = _fold(self.get(slot, h))
+        for h in TEXT_HEADERS:
+            postings = self.grams[h]
+            for g in _trigrams(f" {self.text[h][slot]} "):
+                postings.setdefault(g, set()).add(slot)
+
+    def _unindex(self, slot: int) -> None:
+        k = _id_key(self.get(slot, "id"))
+        if k is not None and self.by_id.get(k) == slot:
+            del self.by_id[k]
+        k = _isbn_key(self.get(slot, "ISBN"))
+        if k is not None:
+            slots = self.by_isbn.get(k)
+            if slots is not None:
+                slots.discard(slot)
+                if not slots:
+                    del self.by_isbn[k]
+        for h in TEXT_HEADERS:
+            postings = self.grams[h]
+            for g in _trigrams(f" {self.text[h][slot]} "):
+                slots = postings.get(g)
+                if slots is not None:
+                    slots.discard(slot)
+                    if not slots:
+                        del postings[g]
+
+    # ---------- mutaciones ----------
+
+    def append(self, rowd: dict[str, Any]) -> int:
+        slot = len(self.ints["id"])
+        for col in self.ints.values():
+            col.append(_NULL)
+        for col in self.strs.values():
+            col.append(None)
+        for col in self.text.values():
+            col.append("")
+
+        for h in HEADERS:
+            self._set(slot, h, rowd.get(h))
+        self.order.append(slot)
+        if rowd.get(TOMBSTONE_HEADER):
+            self.deleted.add(slot)
+        else:
+            self._index(slot)
+        return slot
+
+    def update(self, slot: int, values: dict[str, Any]) -> None:
+        """values: {cabecera: valor} a sobrescribir."""
+        self._unindex(slot)
+        for h, v in values.items():
+            self._set(slot, h, v)
+        self._index(slot)
+
+    def remove(self, slot: int) -> None:
+        self._unindex(slot)
+        # el slot queda como hueco (no se reutiliza) hasta la próxima recarga
+        for h in HEADERS:
+            self._set(slot, h, None)
+        for col in self.text.values():
+            col[slot] = ""
+        del self.order[bisect.bisect_left(self.order, slot)]
+
+    def tombstone(self, slot: int) -> None:
+        """Borrado lógico: la fila conserva su sitio (y su id) pero deja de verse."""
+        self._unindex(slot)
+        for col in self.text.values():
+            col[slot] = ""
+        self.deleted.add(slot)
+
+    def renumber(self) -> None:
+        """id = posición + 1 (fila - 1); solo se reindexa lo que cambia."""
+        for pos, s in enumerate(self.order):
+            if self.get(s, "id") != pos + 1:
+                self.set_id(s, pos + 1)
+
+    def purge(self) -> None:
+        """Quita de verdad las filas borradas y renumera."""
+        for slot in self.deleted:
+            self.remove(slot)
+        self.deleted.clear()
+        self.renumber()
+
+    def set_id(self, slot: int, new_id: Any) -> None:
+        if slot in self.deleted:
+            self._set(slot, "id", new_id)
+            return
+        k = _id_key(self.get(slot, "id"))
+        if k is not None and self.by_id.get(k) == slot:
+            del self.by_id[k]
+        self._set(slot, "id", new_id)
+        self.text["id"][slot] = _fold(new_id)
+        k = _id_key(new_id)
+        if k is not None:
+            self.by_id[k] = slot
+
+    # ---------- consultas ----------
+
+    def slot_of(self, book_id: Any) -> Optional[int]:
+        k = _id_key(book_id)
+        return None if k is None else self.by_id.get(k)
+
+    def slots_by_isbn(self, isbn: Any) -> list[int]:
+        k = _isbn_key(isbn)
+        return sorted(self.by_isbn.get(k, ())) if k is not None else []
+
+    def candidates(self, header: str, needle: str) -> Optional[set[int]]:
+        """
+        Superconjunto de las filas cuyo `header` contiene `needle` (ya pasado
+        por _fold), o None si el índice no ayuda (columna sin índice o
+        subcadena de menos de 3 caracteres) y hay que recorrer todo.
+        """
+        postings = self.grams.get(header)
+        if postings is None or len(needle) < 3:
+            return None
+
+        lists = []
+        for g in _trigrams(needle):
+            slots = postings.get(g)
+            if not slots:
+                return set()
+            lists.append(slots)
+
+        lists.sort(key=len)
+        return lists[0].intersection(*lists[1:])
+
+    def _fuzzy_scores(self, header: str, needle: str) -> dict[int, float]:
+        """Fracción de trigramas de " needle " presentes en cada fila candidata."""
+        grams = _trigrams(f" {needle} ")
+        if not grams:
+            return {}
+
+        postings = self.grams[header]
+        hits: dict[int, int] = {}
+        for g in grams:
+            for slot in postings.get(g, ()):
+                hits[slot] = hits.get(slot, 0) + 1
+
+        total = len(grams)
+        return {
+            slot: n / total
+            for slot, n in hits.items()
+            if n / total >= FUZZY_MIN_SCORE
+        }
+
+    def search(self, crit: dict[str, str], limit: int, fuzzy: bool = True) -> list[int]:
+        """
+        crit: cabecera -> consulta ya normalizada con _fold.
+        Devuelve como mucho `limit` slots ordenados por relevancia:
+
+        1) Filas que contienen todas las consultas como subcadena. Puntúan
+           más cuanto más ajustado es el campo a la consulta ("Platon" gana
+           a "Platón y la Academia"); a igualdad, orden de hoja.
+        2) Si no hay ninguna y `fuzzy`, filas parecidas por trigramas en las
+           columnas de texto (erratas: "Platn", "Aristoteles"), exigiendo
+           coincidencia exacta en el resto de criterios (año, ISBN...).
+
+        La selección es un heap acotado a `limit`, no se ordena todo.
+        """
+        text = self.text
+
+        cand: Optional[set[int]] = None
+        for h, needle in crit.items():
+            c = self.candidates(h, needle)
+            if c is not None:
+                cand = c if cand is None else cand & c
+
+        pool = self.order if cand is None else cand
+        hits = (
+            slot for slot in pool
+            if all(needle in text[h][slot] for h, needle in crit.items())
+        )
+        text_crit = {h: needle for h, needle in crit.items() if h in self.grams}
+
+        def tightness(slot: int) -> tuple[float, int]:
+            score = sum(len(needle) / max(len(text[h][slot]), 1) for h, needle in text_crit.items())
+            return score, -slot
+
+        top = heapq.nlargest(limit, hits, key=tightness)
+        if top or not fuzzy or not text_crit:
+            return top
+
+        scores: Optional[dict[int, float]] = None
+        for h, needle in text_crit.items():
+            sc = self._fuzzy_scores(h, needle)
+            scores = sc if scores is None else {s: v + scores[s] for s, v in sc.items() if s in scores}
+            if not scores:
+                return []
+
+        filters = {h: needle for h, needle in crit.items() if h not in text_crit}
+        pool = (
+            slot for slot in scores
+            if all(needle in text[h][slot] for h, needle in filters.items())
+        )
+        return heapq.nlargest(limit, pool, key=lambda slot: (scores[slot], -slot))
+
+    def tail(self, n: int) -> list[int]:
+        """Los últimos `n` slots vivos, en orden de hoja."""
+        out: list[int] = []
+        for slot in reversed(self.order):
+            if len(out) >= n:
+                break
+            if slot not in self.deleted:
+                out.append(slot)
+        out.reverse()
+        return out
+
+    def excel_row(self, slot: int) -> int:
+        return bisect.bisect_left(self.order, slot) + 2
+
+    def in_order(self) -> list[dict[str, Any]]:
+        return [self.row(slot) for slot in self.order if slot not in self.deleted]
+
+    def deleted_ids(self) -> list[Any]:
+        return [self.get(slot, "id") for slot in self.order if slot in self.deleted]
+
+
+def _fsync_dir(path: str) -> None:
+    """Que el rename quede en disco (no hay fsync de directorios en Windows)."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
 
 class ExcelStore:
-    def __init__(self, path: str, sheet: str):
+    """
+    Catálogo en Excel con escritura diferida.
+
+    Las lecturas se sirven del snapshot en memoria. Cada alta, cambio o
+    borrado se escribe como una línea JSON en un diario (`<excel>.journal`)
+    con fsync antes de aplicarse en memoria, y un hilo compactador vuelca el
+    diario al .xlsx cuando es viejo o grande (y al cerrar). Al arrancar, o si
+    otro proceso ha escrito en el diario, se reaplica lo pendiente encima del
+    Excel, así que ningún cambio confirmado se pierde.
+
+    Cada registro lleva un número de secuencia y el .xlsx guarda el último
+    volcado (JOURNAL_SEQ_NAME). El .xlsx se reemplaza entero (temporal +
+    os.replace) y el diario se vacía después: si el proceso cae entre medias,
+    al reaplicar se saltan los registros que el Excel ya tiene.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        sheet: str,
+        compact_interval: float = 30.0,
+        compact_max_bytes: int = 256 * 1024,
+    ):
         self.path = path
         self.sheet = sheet
         self.lock_path = path + ".lock"
+        self.journal_path = path + ".journal"
+        # lecturas con lock compartido, escrituras con exclusivo (entre procesos)
+        self._lock = RWFileLock(self.lock_path)
+        # varios lectores del mismo proceso: solo uno refresca el snapshot
+        self._refresh = threading.Lock()
+
+        # snapshot residente: filas ya parseadas + firma del fichero del que salieron
+        self._cat: Optional[_Catalog] = None
+        self._stat: Optional[tuple[int, int]] = None
+        self._digest: Optional[str] = None
+        # bytes del diario ya aplicados sobre el snapshot
+        self._journal_offset = 0
+        # secuencia ya volcada al .xlsx y última asignada en el diario
+        self._book_seq = 0
+        self._seq = 0
+
+        # compactación: cada cuánto (s) y a partir de qué tamaño (bytes)
+        self.compact_interval = compact_interval
+        self.compact_max_bytes = compact_max_bytes
+        self._stop = threading.Event()
 
         os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
         if not os.path.exists(path):
             self._init_book()
 
+        # arranque: Excel + diario pendiente
+        with self._lock.exclusive():
+            self._snapshot()
+
+        self._compactor = threading.Thread(
+            target=self._compact_loop, name="excel-compactor", daemon=True
+        )
+        self._compactor.start()
+
     # ---------- inicialización ----------
 
     def _init_book(self) -> None:
@@ -88,13 +586,16 @@ class ExcelStore:
     # ---------- cabeceras ----------
 
     def _header_index(self, ws: Worksheet) -> dict[str, int]:
+        return self._map_headers(cell.value for cell in ws[1])
+
+    def _map_headers(self, values: Iterable[Any]) -> dict[str, int]:
         idx: dict[str, int] = {}
 
-        for i, cell in enumerate(ws[1], start=1):
-            if cell.value is None:
+        for i, value in enumerate(values, start=1):
+            if value is None:
                 continue
 
-            raw = str(cell.value).strip().lower()
+            raw = str(value).strip().lower()
             key = HEADER_MAP.get(raw)
             if key:
                 idx[key] = i
@@ -125,13 +626,345 @@ class ExcelStore:
 
         return f"B{last + 1:06d}"
 
-    def _row_to_dict(self, ws: Worksheet, r: int, idx: dict[str, int]) -> dict[str, Any]:
-        return {h: ws.cell(r, idx[h]).value for h in HEADERS}
+    def _load_rows(self) -> list[dict[str, Any]]:
+        """
+        Lectura rápida de la hoja para el snapshot: valores en tuplas, sin
+        objetos Cell (xlsx_reader, o openpyxl read_only si el fichero trae
+        algo que ese lector no reproduce). Misma normalización de cabeceras
+        (HEADER_MAP) y misma validación que _open().
+        """
+        try:
+            rows = read_sheet(self.path, self.sheet)
+        except UnsupportedSheet:
+            rows = self._read_sheet_openpyxl()
+
+        if not rows:
+            # hoja inexistente o vacía: _open() la crearía con cabeceras al escribir
+            return []
+
+        idx = self._map_headers(rows[0])
+        self._validate_headers(idx)
+
+        cols = [(h, idx[h] - 1) for h in HEADERS]
+        if TOMBSTONE_HEADER in idx:
+            cols.append((TOMBSTONE_HEADER, idx[TOMBSTONE_HEADER] - 1))
+        out: list[dict[str, Any]] = []
+        for values in rows[1:]:
+            n = len(values)
+            out.append({h: values[c] if c < n else None for h, c in cols})
+        return out
+
+    def _read_sheet_openpyxl(self) -> Optional[list[tuple]]:
+        wb = load_workbook(self.path, read_only=True)
+        try:
+            if self.sheet not in wb.sheetnames:
+                return None
+            return list(wb[self.sheet].iter_rows(values_only=True))
+        finally:
+            wb.close()
+
+
+
+    # ---------- snapshot en memoria ----------
+
+    def _stat_key(self) -> tuple[int, int]:
+        st = os.stat(self.path)
+        return st.st_mtime_ns, st.st_size
+
+    def _content_hash(self) -> str:
+        h = hashlib.sha1()
+        with open(self.path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _journal_size(self) -> int:
+        try:
+            return os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            return 0
+
+    def _snapshot(self) -> _Catalog:
+        """
+        Filas de la hoja ya parseadas, con sus índices y el diario aplicado.
+        Solo se vuelve a leer el Excel si alguien lo ha tocado fuera del bot:
+        mtime/tamaño distintos y, además, contenido distinto.
+        Llamar siempre con el lock cogido; con el compartido basta, porque
+        nadie puede escribir mientras, y _refresh evita que dos lectores del
+        mismo proceso recarguen a la vez.
+        """
+        with self._refresh, span("store_open"):
+            return self._snapshot_locked()
+
+    def _snapshot_locked(self) -> _Catalog:
+        stat_key = self._stat_key()
+        # un diario más corto de lo ya aplicado = alguien lo ha vaciado
+        stale = self._cat is None or self._journal_size() < self._journal_offset
+
+        if not stale and stat_key != self._stat:
+            digest = self._content_hash()
+            if digest == self._digest:
+                # touch / copia idéntica: basta con refrescar la firma
+                self._stat = stat_key
+            else:
+                stale = True
+
+        if stale:
+            self._cat = _Catalog(self._load_rows())
+            self._stat, self._digest = stat_key, self._content_hash()
+            self._journal_offset = 0
+            self._book_seq = self._read_book_seq()
+            self._seq = self._book_seq
+
+        self._replay_journal(self._cat)
+        return self._cat
+
+    def _read_book_seq(self) -> int:
+        value = defined_name(self.path, JOURNAL_SEQ_NAME)
+        try:
+            return int(value) if value else 0
+        except ValueError:
+            return 0
+
+    def _save(self, wb: Any) -> None:
+        """Guarda en un temporal y lo cambia por el .xlsx: nunca queda a medias."""
+        tmp = self.path + ".tmp"
+        with span("save"):
+            wb.save(tmp)
+            with open(tmp, "rb") as f:
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            _fsync_dir(os.path.dirname(self.path) or ".")
+        self._stat = self._stat_key()
+        self._digest = self._content_hash()
+
+
+
+    # ---------- diario de mutaciones ----------
+
+    def _read_journal(self, offset: int = 0) -> tuple[list[dict[str, Any]], int]:
+        """
+        Registros completos desde `offset` y el offset tras el último.
+        Una última línea sin "\n" es una escritura a medias (caída): se ignora.
+        """
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], offset
+
+        end = data.rfind(b"\n") + 1
+        records = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+        return records, offset + end
+
+    def _replay_journal(self, cat: _Catalog) -> None:
+        if self._journal_size() == self._journal_offset:
+            return
+        records, self._journal_offset = self._read_journal(self._journal_offset)
+        for rec in self._pending(records):
+            self._apply(cat, rec)
+
+    def _pending(self, records: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Registros que el .xlsx aún no tiene (seq mayor que la volcada; los
+        de diarios anteriores a la secuencia no la llevan y se aplican).
+        Actualiza la última secuencia vista.
+        """
+        out = []
+        for rec in records:
+            seq = rec.get("seq")
+            if seq is None:
+                out.append(rec)
+                continue
+            self._seq = max(self._seq, seq)
+            if seq > self._book_seq:
+                out.append(rec)
+        return out
+
+    def _journal_append(self, rec: dict[str, Any]) -> None:
+        line = (json.dumps(rec, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        with open(self.journal_path, "ab") as f:
+            # si quedó una línea a medias de una caída, se corta antes de seguir
+            if self._journal_offset < f.tell():
+                f.truncate(self._journal_offset)
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_offset += len(line)
+
+    def _commit(self, rec: dict[str, Any]) -> None:
+        """Diario primero (durable), memoria después."""
+        with span("mutation", op=rec["op"]):
+            rec["seq"] = self._seq + 1
+            self._journal_append(rec)
+            self._seq = rec["seq"]
+            self._apply(self._cat, rec)
+
+    def _apply(self, cat: _Catalog, rec: dict[str, Any]) -> None:
+        op = rec["op"]
+
+        if op == "add":
+            cat.append(rec["row"])
+
+        elif op == "add_many":
+            for row in rec["rows"]:
+                cat.append(row)
+
+        elif op == "update":
+            slot = cat.slot_of(rec["id"])
+            if slot is not None:
+                cat.update(slot, rec["set"])
+
+        elif op == "tombstone":
+            slot = cat.slot_of(rec["id"])
+            if slot is not None:
+                cat.tombstone(slot)
+
+        elif op == "delete":
+            slot = cat.slot_of(rec["id"])
+            if slot is not None:
+                cat.remove(slot)
+                # compactar ids: id = fila - 1
+                cat.renumber()
+
+        elif op == "purge":
+            cat.purge()
+
+    def _apply_ws(self, ws: Worksheet, idx: dict[str, int], rows_by_id: dict[str, int], rec: dict[str, Any]) -> None:
+        """Lo mismo que _apply, pero sobre las celdas de la hoja."""
+        op = rec["op"]
+        col_id = idx["id"]
+
+        if op in ("add", "add_many"):
+            width = max(len(HEADERS), *idx.values())
+            for rowd in rec["rows"] if op == "add_many" else [rec["row"]]:
+                row = [""] * width
+                for h, v in rowd.items():
+                    row[idx[h] - 1] = v
+                ws.append(row)
+                k = _id_key(rowd.get("id"))
+                if k is not None:
+                    rows_by_id.setdefault(k, ws.max_row)
+
+        elif op == "update":
+            r = rows_by_id.get(_id_key(rec["id"]))
+            if r is not None:
+                for h, v in rec["set"].items():
+                    ws.cell(r, idx[h]).value = v
+
+        elif op == "tombstone":
+            r = rows_by_id.get(_id_key(rec["id"]))
+            if r is not None:
+                col = idx.get(TOMBSTONE_HEADER)
+                if col is None:
+                    col = idx[TOMBSTONE_HEADER] = ws.max_column + 1
+                    ws.cell(1, col).value = TOMBSTONE_HEADER
+                ws.cell(r, col).value = rec["fecha"]
+
+        elif op in ("delete", "purge"):
+            if op == "delete":
+                r = rows_by_id.get(_id_key(rec["id"]))
+                if r is None:
+                    return
+                ws.delete_rows(r, 1)
+            else:
+                col = idx.get(TOMBSTONE_HEADER)
+                if col is None:
+                    return
+                # de abajo arriba para no desplazar las filas que faltan por mirar
+                for r in range(ws.max_row, 1, -1):
+                    if ws.cell(r, col).value not in (None, ""):
+                        ws.delete_rows(r, 1)
+
+            rows_by_id.clear()
+            for r in range(2, ws.max_row + 1):
+                ws.cell(r, col_id).value = r - 1
+                rows_by_id[str(r - 1)] = r
+
+    # ---------- compactación ----------
+
+    @store_op
+    def compact_journal(self) -> bool:
+        """Vuelca el diario al .xlsx (una carga y un save) y lo vacía."""
+        with self._lock.exclusive():
+            return self._compact_locked()
+
+    def _compact_locked(self) -> bool:
+        self._snapshot()
+        records, _ = self._read_journal()
+        if not records:
+            return False
+        records = self._pending(records)
+
+        wb, ws = self._open()
+        idx = self._header_index(ws)
+        col_id = idx["id"]
+
+        rows_by_id: dict[str, int] = {}
+        for r in range(2, ws.max_row + 1):
+            k = _id_key(ws.cell(r, col_id).value)
+            if k is not None:
+                rows_by_id.setdefault(k, r)
+
+        for rec in records:
+            self._apply_ws(ws, idx, rows_by_id, rec)
+
+        wb.defined_names[JOURNAL_SEQ_NAME] = DefinedName(JOURNAL_SEQ_NAME, attr_text=str(self._seq))
+        self._save(wb)
+        self._book_seq = self._seq
+        # si se cae aquí, el diario se reaplica al arrancar pero sin efecto (seq <= _book_seq)
+        with open(self.journal_path, "wb") as f:
+            os.fsync(f.fileno())
+        self._journal_offset = 0
+        return True
+
+    def _compact_loop(self) -> None:
+        pending_since: Optional[float] = None
+        while not self._stop.wait(1.0):
+            size = self._journal_size()
+            if size == 0:
+                pending_since = None
+                continue
+            if pending_since is None:
+                pending_since = time.monotonic()
+            if size >= self.compact_max_bytes or time.monotonic() - pending_since >= self.compact_interval:
+                try:
+                    self.compact_journal()
+                    pending_since = None
+                except Exception:
+                    # el diario sigue siendo la fuente de verdad; se reintenta luego
+                    log.exception("No se pudo volcar el diario a %s (%d bytes pendientes)", self.path, size)
+
+    def close(self) -> None:
+        """Para el compactador y vuelca lo pendiente."""
+        self._stop.set()
+        self._compactor.join(timeout=10)
+        self.compact_journal()
 
 
 
     # ---------- operaciones públicas ----------
 
+    @contextmanager
+    def session(self, write: bool = True) -> Iterator["ExcelSession"]:
+        """
+        Unidad de trabajo: un lock y un snapshot para resolver, modificar y
+        releer. Dentro, usa solo la sesión (no los métodos del store, que
+        volverían a pedir el lock). Cada mutación queda en el diario al
+        volver: una excepción posterior no la deshace (en SQLite, sí).
+        Con write=False el lock es compartido (otras lecturas siguen
+        entrando) y la sesión no admite mutaciones.
+
+            with store.session() as s:
+                book_id = s.resolve_ref(ref)
+                row = s.update_fields(book_id, changes) if book_id else None
+        """
+        with measure_store_op("session_write" if write else "session_read"):
+            with self._lock.exclusive() if write else self._lock.shared():
+                yield ExcelSession(self, self._snapshot(), writable=write)
+
+    @store_op
     def add(self, book: dict[str, Any]) -> str:
         """
         Append puro:
@@ -139,192 +972,326 @@ class ExcelStore:
         - id = (fila_excel - 1) porque fila 1 es cabecera
         book keys (internos): titulo, autor, editorial, ano, columna, fila, isbn
         """
-        with FileLock(self.lock_path):
-            wb, ws = self._open()
-            idx = self._header_index(ws)
+        with self.session() as s:
+            return s.add(book)["id"]
 
-            # siguiente fila real donde se va a escribir (append)
-            excel_row = ws.max_row + 1
-            new_id = int(excel_row - 1)
+    @store_op
+    def add_many(self, books: list[dict[str, Any]]) -> list[int]:
+        """
+        Alta en bloque (importaciones): todas las filas con un solo lock y un
+        solo registro en el diario, así que entran todas o ninguna.
+        Claves internas como add, más procedencia, categoria, f_revision y
+        comentarios. Devuelve los ids asignados, en orden.
+        """
+        if not books:
+            return []
 
-            row = [""] * len(HEADERS)
-            row[idx["id"] - 1] = new_id
-            row[idx["Título"] - 1] = book.get("titulo", "") or ""
-            row[idx["Autor"] - 1] = book.get("autor", "") or ""
-            row[idx["Editorial"] - 1] = book.get("editorial", "") or ""
-            row[idx["Año"] - 1] = book.get("ano", None)
-            row[idx["Columna"] - 1] = book.get("columna", None)
-            row[idx["Fila"] - 1] = book.get("fila", None)
-            row[idx["ISBN"] - 1] = book.get("isbn", "") or ""
+        with self._lock.exclusive():
+            cat = self._snapshot()
+            first_id = len(cat) + 1
 
-            ws.append(row)
-            wb.save(self.path)
-            return new_id
+            rows = []
+            for i, book in enumerate(books):
+                row = {h: "" for h in HEADERS}
+                row["id"] = first_id + i
+                for k, h in FIELD_TO_HEADER.items():
+                    v = book.get(k)
+                    row[h] = v if k in INT_FIELDS else (v or "")
+                rows.append(row)
 
+            self._commit({"op": "add_many", "rows": rows})
+            return [first_id + i for i in range(len(rows))]
 
+    @store_op
     def get_by_id(self, book_id: str) -> Optional[dict[str, Any]]:
         if not book_id:
             return None
 
-        with FileLock(self.lock_path):
-            wb, ws = self._open()
-            idx = self._header_index(ws)
-            col_id = idx["id"]
-
-            for r in range(2, ws.max_row + 1):
-                v = ws.cell(r, col_id).value
-                if v and str(v).strip() == str(book_id).strip():
-                    return self._row_to_dict(ws, r, idx)
-
-            return None
-
-    def find(self, criteria: dict[str, str], limit: int = 20) -> list[dict[str, Any]]:
-        limit = max(1, min(int(limit), 50))
-        crit = {k: v.strip().lower() for k, v in criteria.items() if v and v.strip()}
-        if not crit:
-            return []
+        with self.session(write=False) as s:
+            return s.get_by_id(book_id)
 
-        key_to_header = {
-            "titulo": "Título",
-            "autor": "Autor",
-            "editorial": "Editorial",
-            "ano": "Año",
-            "isbn": "ISBN",
-            "fila": "Fila",
-            "columna": "Columna",
-            "id": "id",
-        }
+    @store_op
+    def all_rows(self) -> list[dict[str, Any]]:
+        """Todas las filas no borradas, en orden de hoja."""
+        with self._lock.shared():
+            return self._snapshot().in_order()
 
-        with FileLock(self.lock_path):
-            wb, ws = self._open()
-            idx = self._header_index(ws)
-
-            out: list[dict[str, Any]] = []
-            for r in range(2, ws.max_row + 1):
-                rowd = self._row_to_dict(ws, r, idx)
-                ok = True
-
-                for k, needle in crit.items():
-                    h = key_to_header.get(k)
-                    if not h:
-                        ok = False
-                        break
-                    hay = "" if rowd.get(h) is None else str(rowd.get(h)).lower()
-                    if needle not in hay:
-                        ok = False
-                        break
-
-                if ok:
-                    out.append(rowd)
-                    if len(out) >= limit:
-                        break
-
-            return out
+    @store_op
+    def deleted_ids(self) -> list[Any]:
+        """Ids de las filas borradas con delete() y aún no compactadas."""
+        with self._lock.shared():
+            return self._snapshot().deleted_ids()
 
+    @store_op
+    def version(self) -> str:
+        """
+        Versión del catálogo para cachear exportaciones: la huella del .xlsx
+        con el diario ya volcado, así que cambia con cada escritura.
+        """
+        with self._lock.shared():
+            self._snapshot()
+            if self._journal_offset == 0:
+                return self._digest
+        with self._lock.exclusive():
+            self._compact_locked()
+            return self._digest
+
+    @store_op
+    def export(self, dest: str, fmt: str = "xlsx") -> str:
+        """
+        Escribe en `dest` las filas no borradas, con el diario ya volcado,
+        en "xlsx" o en "csv"/"jsonl" comprimidos (ver exports.py).
+        Devuelve la versión (version()) de lo escrito.
+        """
+        with self._lock.exclusive():
+            self._compact_locked()
+            write_rows(dest, fmt, self._snapshot().in_order(), HEADERS, self.sheet)
+            return self._digest
+
+    @store_op
+    def export_xlsx(self, dest: str) -> None:
+        """Copia el Excel a `dest` con el diario ya volcado (borrados incluidos)."""
+        with self._lock.exclusive():
+            self._compact_locked()
+            shutil.copyfile(self.path, dest)
+
+    @store_op
+    def find_by_isbn(self, isbn: str) -> list[dict[str, Any]]:
+        """Coincidencia exacta de ISBN ignorando guiones, espacios y mayúsculas."""
+        with self.session(write=False) as s:
+            return s.find_by_isbn(isbn)
+
+    @store_op
+    def find(self, criteria: dict[str, str], limit: int = 20, fuzzy: bool = True) -> list[dict[str, Any]]:
+        """
+        Búsqueda sin tildes ni mayúsculas, ordenada por relevancia
+        (ver _Catalog.search). Con fuzzy=False solo devuelve coincidencias
+        por subcadena, sin aproximadas.
+        """
+        with self.session(write=False) as s:
+            return s.find(criteria, limit=limit, fuzzy=fuzzy)
+
+    @store_op
+    def find_ids(self, criteria: dict[str, str], limit: int = FIND_MAX_IDS, fuzzy: bool = True) -> list[Any]:
+        """Ids de find() en el mismo orden, sin el tope de 50 (para paginar)."""
+        with self.session(write=False) as s:
+            return s.find_ids(criteria, limit=limit, fuzzy=fuzzy)
+
+    @store_op
+    def get_many(self, ids: list[Any]) -> list[dict[str, Any]]:
+        """Filas de `ids` en ese orden; las que ya no existen se saltan."""
+        with self.session(write=False) as s:
+            return s.get_many(ids)
+
+    @store_op
     def last(self, n: int = 10) -> list[dict[str, Any]]:
-        n = max(1, min(int(n), 200))
-
-        with FileLock(self.lock_path):
-            wb, ws = self._open()
-            idx = self._header_index(ws)
+        with self.session(write=False) as s:
+            return s.last(n)
 
-            start = max(2, ws.max_row - n + 1)
-            return [self._row_to_dict(ws, r, idx) for r in range(start, ws.max_row + 1)]
-
-        
-    def update_fields(self, book_id: str, changes: dict[str, Any]) -> bool:
+    @store_op
+    def update_fields(self, book_id: str, changes: dict[str, Any]) -> Optional[dict[str, Any]]:
         """
         changes usa keys internas: titulo, autor, editorial, ano, fila, columna, isbn
         - strings: "" para vaciar
         - ints: null para vaciar
+        Devuelve la fila ya actualizada, o None si no existe el libro.
         """
-        key_to_headers = {
-            "titulo": ["Título", "Titulo"],
-            "autor": ["Autor"],
-            "procedencia": ["Procedencia"],
-            "categoria": ["Categoría", "Categoria"],
-            "editorial": ["Editorial"],
-            "ano": ["Año", "Ano"],
-            "columna": ["Columna"],
-            "fila": ["Fila"],
-            "isbn": ["ISBN"],
-            "f_revision": ["F_revisión", "F_revision", "F_revision _", "F_revision->"],
-            "comentarios": ["Comentarios"],
-        }
+        with self.session() as s:
+            return s.update_fields(book_id, changes)
+
+    @store_op
+    def delete(self, book_id: Any) -> bool:
+        """
+        Borrado lógico: marca la fila (columna Borrado) y los demás ids no
+        cambian. Una línea en el diario, sin tocar el resto de filas; la
+        fila desaparece de verdad con compact_ids().
+        """
+        with self.session() as s:
+            return s.delete(book_id)
 
+    @store_op
+    def compact_ids(self) -> int:
+        """
+        Quita del Excel las filas borradas con delete() y renumera todos los
+        ids (id = fila_excel - 1). Recorre la hoja entera y la guarda: es
+        para lanzarlo a mano (/compact), no en cada borrado. Devuelve
+        cuántas filas quitó.
+        """
+        with self._lock.exclusive():
+            cat = self._snapshot()
+            n = len(cat.deleted)
+            if n:
+                self._commit({"op": "purge"})
+                self._compact_locked()
+            return n
+
+    @store_op
+    def delete_and_compact(self, book_id: int) -> bool:
+        """
+        Borra la fila del libro con id=book_id y luego recalcula todos los ids para que:
+        id = (fila_excel - 1)
+        """
+        with self.session() as s:
+            return s.delete_and_compact(book_id)
 
-        with FileLock(self.lock_path):
-            wb, ws = self._open()
-            idx = self._header_index(ws)
 
-            col_id = idx["id"]
+# Claves de find() -> cabecera canónica
+FIND_KEY_TO_HEADER = {
+    "titulo": "Título",
+    "autor": "Autor",
+    "editorial": "Editorial",
+    "ano": "Año",
+    "isbn": "ISBN",
+    "fila": "Fila",
+    "columna": "Columna",
+    "id": "id",
+}
 
-            # localizar fila por id
-            target_row = None
-            for r in range(2, ws.max_row + 1):
-                v = ws.cell(r, col_id).value
-                if v and str(v).strip() == str(book_id).strip():
-                    target_row = r
-                    break
 
-            if target_row is None:
-                return False
+def resolve_ref(view: Any, ref: Any) -> Optional[Any]:
+    """
+    Referencia del LLM ({"type": ..., "value": ...}) -> id de un único libro,
+    o None si no hay ninguno o hay varios. `view` es cualquier cosa con
+    find_by_isbn() y find() (una sesión de ExcelStore o de SQLiteStore).
+    """
+    if not isinstance(ref, dict):
+        return None
 
-            # aplicar cambios
-            for k, v in changes.items():
-                if k not in key_to_headers:
-                    continue
+    rtype = (ref.get("type") or "").strip().lower()
+    if not rtype:
+        return None
 
-                # elige la primera cabecera que exista en el Excel
-                header = next((h for h in key_to_headers[k] if h in idx), None)
-                if not header:
-                    continue
+    # value puede venir como "value", o mal como "id" cuando type=="id"
+    raw_value = ref.get("value")
+    if raw_value is None and rtype == "id":
+        raw_value = ref.get("id")
 
-                c = idx[header]
+    if raw_value is None:
+        return None
 
-                if k in ("fila", "columna", "ano"):
-                    ws.cell(target_row, c).value = None if v is None else int(v)
-                else:
-                    ws.cell(target_row, c).value = "" if v is None else str(v)
+    value = str(raw_value).strip()
+    if not value:
+        return None
 
+    # --- resolver por id directamente ---
+    if rtype == "id":
+        return int(value)
 
-            wb.save(self.path)
-            return True
+    # --- resolver por búsqueda y exigir único ---
+    # sin aproximadas: para modificar/borrar no vale "el que más se parece"
+    if rtype == "isbn":
+        # índice exacto; si no hay, se admite un fragmento de ISBN
+        res = view.find_by_isbn(value) or view.find({"isbn": value}, limit=10, fuzzy=False)
+    elif rtype in ("ano", "titulo", "autor", "editorial"):
+        res = view.find({rtype: value}, limit=10, fuzzy=False)
+    else:
+        return None
 
-    def delete_and_compact(self, book_id: int) -> bool:
-        """
-        Borra la fila del libro con id=book_id y luego recalcula todos los ids para que:
-        id = (fila_excel - 1)
-        """
-        def _same_id(cell_value: Any, book_id: Any) -> bool:
-            try:
-                return int(cell_value) == int(book_id)
-            except (TypeError, ValueError):
-                return False
+    if len(res) == 1:
+        rid = res[0].get("id")
+        return str(rid).strip() if rid is not None else None
 
-        with FileLock(self.lock_path):
-            wb, ws = self._open()
-            idx = self._header_index(ws)
+    return None
 
-            col_id = idx["id"]
 
-            # 1) localizar fila a borrar
-            delete_row = None
-            for r in range(2, ws.max_row + 1):
-                v = ws.cell(r, col_id).value
-                if _same_id(v, book_id):
-                    delete_row = r
-                    break
+class ExcelSession:
+    """
+    Operaciones sobre el snapshot de un ExcelStore con el lock ya tomado
+    (ver ExcelStore.session). Las mutaciones devuelven la fila resultante.
+    """
 
-            if delete_row is None:
-                return False
+    def __init__(self, store: ExcelStore, cat: _Catalog, writable: bool = True):
+        self._store = store
+        self._cat = cat
+        self.writable = writable
 
-            # 2) borrar fila (desplaza hacia arriba)
-            ws.delete_rows(delete_row, 1)
+    def _commit(self, rec: dict[str, Any]) -> None:
+        if not self.writable:
+            raise RuntimeError("Sesión de solo lectura")
+        self._store._commit(rec)
 
-            # 3) compactar ids: id = fila - 1
-            for r in range(2, ws.max_row + 1):
-                ws.cell(r, col_id).value = r - 1
+    # ---------- lecturas ----------
+
+    def get_by_id(self, book_id: Any) -> Optional[dict[str, Any]]:
+        slot = self._cat.slot_of(book_id)
+        return None if slot is None else self._cat.row(slot)
+
+    def find_by_isbn(self, isbn: str) -> list[dict[str, Any]]:
+        return [self._cat.row(slot) for slot in self._cat.slots_by_isbn(isbn)]
+
+    def get_many(self, ids: list[Any]) -> list[dict[str, Any]]:
+        slots = (self._cat.slot_of(book_id) for book_id in ids)
+        return [self._cat.row(slot) for slot in slots if slot is not None]
+
+    def _search(self, criteria: dict[str, str], limit: int, fuzzy: bool) -> list[int]:
+        crit = {k: _fold(v.strip()) for k, v in criteria.items() if v and v.strip()}
+        if not crit:
+            return []
+        if any(k not in FIND_KEY_TO_HEADER for k in crit):
+            return []
+        by_header = {FIND_KEY_TO_HEADER[k]: needle for k, needle in crit.items()}
+        return self._cat.search(by_header, limit, fuzzy=fuzzy)
+
+    def find(self, criteria: dict[str, str], limit: int = 20, fuzzy: bool = True) -> list[dict[str, Any]]:
+        limit = max(1, min(int(limit), FIND_MAX_ROWS))
+        return [self._cat.row(slot) for slot in self._search(criteria, limit, fuzzy)]
+
+    def find_ids(self, criteria: dict[str, str], limit: int = FIND_MAX_IDS, fuzzy: bool = True) -> list[Any]:
+        limit = max(1, min(int(limit), FIND_MAX_IDS))
+        return [self._cat.get(slot, "id") for slot in self._search(criteria, limit, fuzzy)]
+
+    def last(self, n: int = 10) -> list[dict[str, Any]]:
+        n = max(1, min(int(n), 200))
+        return [self._cat.row(slot) for slot in self._cat.tail(n)]
+
+    def resolve_ref(self, ref: Any) -> Optional[Any]:
+        with span("ref"):
+            return resolve_ref(self, ref)
+
+    # ---------- escrituras ----------
+
+    def add(self, book: dict[str, Any]) -> dict[str, Any]:
+        # siguiente fila real donde se va a escribir (append)
+        new_id = len(self._cat) + 1
+
+        row = {h: "" for h in HEADERS}
+        row["id"] = new_id
+        row["Título"] = book.get("titulo", "") or ""
+        row["Autor"] = book.get("autor", "") or ""
+        row["Editorial"] = book.get("editorial", "") or ""
+        row["Año"] = book.get("ano", None)
+        row["Columna"] = book.get("columna", None)
+        row["Fila"] = book.get("fila", None)
+        row["ISBN"] = book.get("isbn", "") or ""
+
+        self._commit({"op": "add", "row": row})
+        return self.get_by_id(new_id)
+
+    def update_fields(self, book_id: Any, changes: dict[str, Any]) -> Optional[dict[str, Any]]:
+        # aplicar cambios (se convierten antes de escribir nada en el diario)
+        new_values = _coerce_changes(changes)
+
+        # localizar fila por id (índice hash)
+        slot = self._cat.slot_of(book_id)
+        if slot is None:
+            return None
+
+        self._commit({"op": "update", "id": self._cat.get(slot, "id"), "set": new_values})
+        return self._cat.row(slot)
+
+    def delete(self, book_id: Any) -> bool:
+        slot = self._cat.slot_of(book_id)
+        if slot is None:
+            return False
+
+        fecha = date.today().strftime("%d/%m/%Y")
+        self._commit({"op": "tombstone", "id": self._cat.get(slot, "id"), "fecha": fecha})
+        return True
+
+    def delete_and_compact(self, book_id: Any) -> bool:
+        slot = self._cat.slot_of(book_id)
+        if slot is None:
+            return False
 
-            wb.save(self.path)
-            return True
+        self._commit({"op": "delete", "id": self._cat.get(slot, "id")})
+        return True
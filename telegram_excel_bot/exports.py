@@ -0,0 +1,149 @@
+"""
+/export con caché por versión del catálogo.
+
+Cada formato se genera una sola vez por versión (version() de los stores
+cambia con cada escritura), con el lock del store cogido, en un fichero
+del directorio de caché:
+
+    xlsx   .xlsx nuevo con las cabeceras del catálogo
+    csv    CSV UTF-8 con las cabeceras del catálogo, comprimido con gzip
+    jsonl  un objeto JSON por libro y línea, comprimido con gzip
+
+Los tres llevan solo los libros no borrados, con cualquiera de los dos
+stores. Al subirlo a Telegram se guarda el file_id; mientras la versión no cambie,
+/export reenvía ese file_id y no se vuelve a subir nada.
+"""
+import csv
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Iterable, Optional
+
+from openpyxl import Workbook
+
+
+# formato -> extensión del fichero
+FORMATS = {
+    "xlsx": ".xlsx",
+    "csv": ".csv.gz",
+    "jsonl": ".jsonl.gz",
+}
+
+
+# ---------- escritura ----------
+
+def write_rows(dest: str, fmt: str, rows: Iterable[dict[str, Any]], headers: list[str],
+               sheet: str = "Catalogo") -> None:
+    """Filas (dicts con `headers`) -> `dest` en xlsx (hoja `sheet`) o csv/jsonl comprimidos."""
+    if fmt == "xlsx":
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(sheet)
+        ws.append(headers)
+        for row in rows:
+            ws.append([row.get(h) for h in headers])
+        wb.save(dest)
+    elif fmt == "csv":
+        with gzip.open(dest, "wt", encoding="utf-8", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(headers)
+            for row in rows:
+                w.writerow(["" if row.get(h) is None else row.get(h) for h in headers])
+    elif fmt == "jsonl":
+        with gzip.open(dest, "wt", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps({h: row.get(h) for h in headers}, ensure_ascii=False, default=str) + "\n")
+    else:
+        raise ValueError(f"Formato de exportación no soportado: {fmt}")
+
+
+# ---------- caché ----------
+
+class ExportCache:
+    """
+    Último fichero generado por formato, con su versión y el file_id de
+    Telegram si ya se subió. El índice va en `index.json` dentro del
+    directorio; al generar una versión nueva se borra el fichero anterior.
+    """
+
+    def __init__(self, directory: str, basename: str = "catalogo"):
+        self.directory = directory
+        self.basename = basename
+        self.index_path = os.path.join(directory, "index.json")
+        os.makedirs(directory, exist_ok=True)
+        # formato -> {"version", "file", "file_id"}
+        self._index: dict[str, dict[str, Any]] = self._load()
+
+    def filename(self, fmt: str) -> str:
+        """Nombre con el que se envía el fichero."""
+        return self.basename + FORMATS[fmt]
+
+    def get(self, fmt: str, version: str) -> Optional[dict[str, Any]]:
+        """Entrada de `fmt` si es de esta versión y su fichero sigue ahí."""
+        entry = self._index.get(fmt)
+        if not entry or entry.get("version") != version:
+            return None
+        if not os.path.exists(self.path(entry)):
+            return None
+        return dict(entry)
+
+    def path(self, entry: dict[str, Any]) -> str:
+        return os.path.join(self.directory, entry["file"])
+
+    def temp_path(self, fmt: str) -> str:
+        """Fichero nuevo (vacío) donde el store escribe antes de add()."""
+        fd, path = tempfile.mkstemp(prefix=".tmp-", suffix=FORMATS[fmt], dir=self.directory)
+        os.close(fd)
+        return path
+
+    def add(self, fmt: str, version: str, tmp_path: str) -> dict[str, Any]:
+        """Guarda el fichero recién generado como el de `fmt` para `version`."""
+        name = hashlib.sha1(version.encode("utf-8")).hexdigest()[:16] + FORMATS[fmt]
+        os.replace(tmp_path, os.path.join(self.directory, name))
+
+        old = self._index.get(fmt)
+        if old and old.get("file") != name:
+            try:
+                os.remove(self.path(old))
+            except FileNotFoundError:
+                pass
+
+        entry = {"version": version, "file": name, "file_id": None}
+        self._index[fmt] = entry
+        self._save()
+        return dict(entry)
+
+    def set_file_id(self, fmt: str, version: str, file_id: str) -> None:
+        entry = self._index.get(fmt)
+        if entry and entry.get("version") == version:
+            entry["file_id"] = file_id
+            self._save()
+
+    def forget_file_id(self, fmt: str) -> None:
+        """file_id que Telegram ya no acepta: la próxima vez se sube el fichero."""
+        entry = self._index.get(fmt)
+        if entry and entry.get("file_id"):
+            entry["file_id"] = None
+            self._save()
+
+    # ---------- disco ----------
+
+    def _load(self) -> dict[str, dict[str, Any]]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        return {
+            fmt: entry for fmt, entry in data.items()
+            if fmt in FORMATS and isinstance(entry, dict) and "version" in entry and "file" in entry
+        }
+
+    def _save(self) -> None:
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmp, self.index_path)
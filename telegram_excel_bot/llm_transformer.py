@@ -1,9 +1,36 @@
+import asyncio
+import hashlib
 import json
-from typing import Any, Dict
+import logging
+import time
+from typing import Any, Dict, Optional
 
-from openai import OpenAI
+from openai import AsyncOpenAI
 
+from telegram_excel_bot.action_cache import ActionCache
+from telegram_excel_bot.metrics import REGISTRY
+from telegram_excel_bot.prompts import FULL_PROMPT, MODULES, build_prompt, classify_intent
+from telegram_excel_bot.tracing import add_span, span
 
+log = logging.getLogger(__name__)
+
+
+class LLMRefusal(RuntimeError):
+    """El modelo rechazó la petición (campo refusal de la respuesta)."""
+
+
+# fila/columna en changes: entero para ponerla, "" para vaciarla (null = no se toca)
+_CLEARABLE_INT: Dict[str, Any] = {
+    "anyOf": [{"type": "integer"}, {"type": "string", "enum": [""]}, {"type": "null"}]
+}
+
+
+# Schema en modo estricto de Structured Outputs: el API solo deja que el
+# modelo devuelva JSON que lo cumpla. El modo estricto exige objetos con
+# additionalProperties=false y todas las claves en required, así que lo
+# opcional es nullable y el modelo pone null en lo que no usa (se quita con
+# drop_nulls). Qué claves necesita cada op lo comprueba validate_action
+# con OP_REQUIRED, porque el modo estricto no admite oneOf.
 ACTION_SCHEMA: Dict[str, Any] = {
     "name": "excel_action",
     "strict": True,
@@ -23,269 +50,491 @@ ACTION_SCHEMA: Dict[str, Any] = {
                     "find",
                     "last",
                     "update",
-                    "delete"
-                    "chat"
+                    "delete",
+                    "chat",
                 ]
             },
 
             # ---------- add ----------
             "book": {
-                "type": "object",
-                "additionalProperties": False,
-                "properties": {
-                    "titulo": {"type": "string"},
-                    "autor": {"type": "string"},
-                    "editorial": {"type": "string"},
-                    "ano": {"type": ["string", "null"]},
-                    "columna": {"type": ["integer", "null"]},
-                    "fila": {"type": ["integer", "null"]},
-                    "procedencia": {"type": "string"},
-                    "categoria": {"type": "string"},
-                    "comentarios": {"type": "string"},
-                    "isbn": {"type": "string"},
-                },
-                "required": ["titulo"],
+                "anyOf": [
+                    {
+                        "type": "object",
+                        "additionalProperties": False,
+                        "properties": {
+                            "titulo": {"type": "string"},
+                            "autor": {"type": ["string", "null"]},
+                            "editorial": {"type": ["string", "null"]},
+                            "ano": {"type": ["string", "null"]},
+                            "columna": {"type": ["integer", "null"]},
+                            "fila": {"type": ["integer", "null"]},
+                            "procedencia": {"type": ["string", "null"]},
+                            "categoria": {"type": ["string", "null"]},
+                            "comentarios": {"type": ["string", "null"]},
+                            "isbn": {"type": ["string", "null"]},
+                        },
+                        "required": [
+                            "titulo", "autor", "editorial", "ano", "columna", "fila",
+                            "procedencia", "categoria", "comentarios", "isbn",
+                        ],
+                    },
+                    {"type": "null"},
+                ]
             },
 
             # ---------- get ----------
-            "id": {"type": "string"},
+            "id": {"type": ["string", "null"]},
 
             # ---------- find ----------
             "query": {
-                "type": "object",
-                "additionalProperties": False,
-                "properties": {
-                    "titulo": {"type": "string"},
-                    "autor": {"type": "string"},
-                    "editorial": {"type": "string"},
-                    "ano": {"type": "string"},
-                    "procedencia": {"type": "string"},
-                    "categoria": {"type": "string"},
-                    "f_revision": {"type": "string"},
-                    "isbn": {"type": "string"},
-                    "id": {"type": "string"},
-                },
-                "required": [],
+                "anyOf": [
+                    {
+                        "type": "object",
+                        "additionalProperties": False,
+                        "properties": {
+                            "titulo": {"type": ["string", "null"]},
+                            "autor": {"type": ["string", "null"]},
+                            "editorial": {"type": ["string", "null"]},
+                            "ano": {"type": ["string", "null"]},
+                            "procedencia": {"type": ["string", "null"]},
+                            "categoria": {"type": ["string", "null"]},
+                            "f_revision": {"type": ["string", "null"]},
+                            "isbn": {"type": ["string", "null"]},
+                            "id": {"type": ["string", "null"]},
+                        },
+                        "required": [
+                            "titulo", "autor", "editorial", "ano", "procedencia",
+                            "categoria", "f_revision", "isbn", "id",
+                        ],
+                    },
+                    {"type": "null"},
+                ]
             },
 
             # ---------- last ----------
-            "n": {"type": "integer"},
+            "n": {"type": ["integer", "null"]},
 
             # ---------- referencias ----------
             "ref": {
-                "type": "object",
-                "additionalProperties": False,
-                "properties": {
-                    "type": {
-                        "type": "string",
-                        "enum": ["id", "ano", "titulo", "autor", "editorial", "isbn"]
+                "anyOf": [
+                    {
+                        "type": "object",
+                        "additionalProperties": False,
+                        "properties": {
+                            "type": {
+                                "type": "string",
+                                "enum": ["id", "ano", "titulo", "autor", "editorial", "isbn"]
+                            },
+                            "value": {"type": "string"},
+                        },
+                        "required": ["type", "value"],
+                    },
+                    {"type": "null"},
+                ]
+            },
+
+            # ---------- set_pos ----------
+            "pos": {
+                "anyOf": [
+                    {
+                        "type": "object",
+                        "additionalProperties": False,
+                        "properties": {
+                            "fila": {"type": "integer"},
+                            "columna": {"type": "integer"},
+                        },
+                        "required": ["fila", "columna"],
                     },
-                    "value": {"type": "string"},
-                },
-                "required": ["type", "value"],
+                    {"type": "null"},
+                ]
             },
 
+            # ---------- set_isbn ----------
+            "isbn": {"type": ["string", "null"]},
+
             # ---------- update ----------
             "changes": {
-            "type": "object",
-            "additionalProperties": False,
-            "properties": {
-                "titulo": {"type": ["string", "null"]},
-                "autor": {"type": ["string", "null"]},
-                "editorial": {"type": ["string", "null"]},
-                "ano": {"type": ["string", "null"]},
-                "procedencia": {"type": ["string", "null"]},
-                "categoria": {"type": ["string", "null"]},
-                "f_revision": {"type": ["string", "null"]},
-                "comentarios": {"type": ["string", "null"]},
-                "fila": {"type": ["integer", "null"]},
-                "columna": {"type": ["integer", "null"]},
-                "isbn": {"type": ["string", "null"]},
-            },
-            "required": []
+                "anyOf": [
+                    {
+                        "type": "object",
+                        "additionalProperties": False,
+                        "properties": {
+                            "titulo": {"type": ["string", "null"]},
+                            "autor": {"type": ["string", "null"]},
+                            "editorial": {"type": ["string", "null"]},
+                            "ano": {"type": ["string", "null"]},
+                            "procedencia": {"type": ["string", "null"]},
+                            "categoria": {"type": ["string", "null"]},
+                            "f_revision": {"type": ["string", "null"]},
+                            "comentarios": {"type": ["string", "null"]},
+                            "fila": _CLEARABLE_INT,
+                            "columna": _CLEARABLE_INT,
+                            "isbn": {"type": ["string", "null"]},
+                        },
+                        "required": [
+                            "titulo", "autor", "editorial", "ano", "procedencia", "categoria",
+                            "f_revision", "comentarios", "fila", "columna", "isbn",
+                        ],
+                    },
+                    {"type": "null"},
+                ]
             },
 
             # ---------- chat ----------
-            "message": {"type": "string"},
-            
+            "message": {"type": ["string", "null"]},
         },
 
-        "required": ["op"],
-
-        "oneOf": [
-            {
-                "properties": {"op": {"const": "add"}, "book": {}},
-                "required": ["op", "book"]
-            },
-            {
-                "properties": {"op": {"const": "get"}, "id": {}},
-                "required": ["op", "id"]
-            },
-            {
-                "properties": {"op": {"const": "find"}, "query": {}},
-                "required": ["op", "query"]
-            },
-            {
-                "properties": {"op": {"const": "last"}, "n": {}},
-                "required": ["op", "n"]
-            },
-            {
-                "properties": {"op": {"const": "set_pos"}, "ref": {}, "pos": {}},
-                "required": ["op", "ref", "pos"]
-            },
-            {
-                "properties": {"op": {"const": "set_isbn"}, "ref": {}, "isbn": {}},
-                "required": ["op", "ref", "isbn"]
-            },
-            {
-                "properties": {"op": {"const": "update"}, "ref": {}, "changes": {}},
-                "required": ["op", "ref", "changes"]
-            },
-            {
-                "properties": {"op": {"const": "delete"}, "ref": {}}, "required": ["op", "ref"]
-            },
-            {   "properties": {"op": {"const": "get"}, "id": {}}, "required": ["op", "id"]
-            },
-            {   "properties": {"op": {"const": "get"}, "ref": {}}, "required": ["op", "ref"]
-            },
-            {
-                "properties": {"op": {"const": "chat"}, "message": {}},
-                "required": ["op", "message"]
-            },
+        "required": [
+            "op", "book", "id", "query", "n", "ref", "pos", "isbn", "changes", "message",
         ],
     },
 }
 
+# Claves (sin null) que necesita cada op; get lleva id o ref
+OP_REQUIRED: dict[str, tuple[str, ...]] = {
+    "add": ("book",),
+    "get": (),
+    "find": ("query",),
+    "last": ("n",),
+    "set_pos": ("ref", "pos"),
+    "set_isbn": ("ref", "isbn"),
+    "update": ("ref", "changes"),
+    "delete": ("ref",),
+    "chat": ("message",),
+}
 
+# Lote: {"actions": [acción, ...]} con el mismo schema por acción
+BATCH_SCHEMA: Dict[str, Any] = {
+    "name": "excel_actions",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "additionalProperties": False,
+        "properties": {
+            "actions": {"type": "array", "items": ACTION_SCHEMA["schema"]},
+        },
+        "required": ["actions"],
+    },
+}
 
-SYSTEM = """Eres un transformador de lenguaje natural a acciones para un bot de Telegram que edita un Excel de catálogo de libros en una biblioteca. Tu tono es el de un filósofo neoplatónico griego antiguo y bibliotecario.
 
-Columnas del Excel: id, Título, Autor, Procedencia, Categoría, Editorial, Año, Columna, Fila, ISBN, F_Revision, Comentarios.
 
-Devuelve SOLO una acción JSON conforme al schema. 
+# Prompt completo; por mensaje se manda solo el módulo de su intención (prompts.py)
+SYSTEM = FULL_PROMPT
 
-Si el mensaje del usuario no tiene sentido, no tiene que ver con tus tareas,
-o no es posible inferir una acción válida, devuelve:
+BATCH_RULES = """
 
-{
-  "op": "chat",
-  "message": "<respóndele a su pregunta igualmente con la extensión que consideres pero con cierta comedia, 
-               pero finaliza tu respuesta educadamente explicando,
-               que tu SOLO eres un bot en honor al daimon de 📜 Zenódoto de Alejandría 🏺, 
-               finalmente, acaba diciendo tus funciones y capacidades que son las de gestionar el Excel de libros
-               de la biblioteca, y explica en qué consisten. Utiliza /help para más información.>"
-}
+MODO LOTE:
+- Recibirás una lista JSON de mensajes independientes del usuario, en orden.
+- Devuelve SOLO un objeto JSON {"actions": [...]} con exactamente una acción por mensaje y en el mismo orden.
+- Cada acción sigue las mismas reglas y el mismo schema que si el mensaje llegara solo.
+"""
 
-Si uno de los campos ves que es ilógico (por ejemplo, un año de publicación 3024 o una fila -5), devuelve:
-{
-  "op": "chat",
-  "message": "<Educadamente explica por qué uno de los campos es ilógico o imposible y pide que lo corrija.>"
-}
+# Mensajes por petición en to_actions (el resto va en otra petición)
+MAX_BATCH = 25
+
+# Versión del prompt para la caché: cambia sola si se toca algún módulo o el schema
+PROMPT_VERSION = hashlib.sha1(
+    ("".join(build_prompt([m]) for m in MODULES) + SYSTEM + json.dumps(ACTION_SCHEMA, sort_keys=True)).encode("utf-8")
+).hexdigest()[:12]
 
-Reglas:
-- Si dice "añade/registro/alta libro" => op=add.
-- Si menciona el id => ref.type="id".
-- Si dice "libro 1563" suele ser el id => ref.type="id".
-- Si menciona título, autor, editorial => ref.type="titulo"/"autor"/"editorial".
-- Si dice se llama/titula/nombre "..." es porque se refiere al titulo => ref.type="titulo". Hay libros que se llaman como años. Cuidado
-- Si menciona CORRECTAMENTE un año de publicación => ref.type="ano".
-- Si el usuario dice "actualiza", "cambia", "modifica", "pon", "establece", "corrige" un campo (autor/editorial/año/título/isbn/fila/columna) => op=update. Preferentemente el número es el id del libro. Ej: "pon el 3 a año 2020". O "pon el título X al libro 1234".
-- En update SIEMPRE devuelve: { "op":"update", "ref":{...}, "changes":{...} }
-- En "ref" SIEMPRE usa exactamente las claves: {"type": "...", "value": "..."}.
-- NO uses {"id": ...} dentro de ref. El valor siempre va en "value" como string.
-- Si el usuario pide "consulta/muéstrame/dame/enseñame/dime los datos" => op=get. Evidentemente.
-- El ISBN se trata como string.
-- Prioridad de referencia: si hay id (1623) => ref.type="id". Si no, si hay ISBN => ref.type="isbn". Si no, título. Si no autor. Si no editorial. Si no año. En este orden de preferencia.
-- Si dice "por título ..." => ref.type="titulo". Si dice "por autor ..." => ref.type="autor".
-- Cuando el usuario dice "pon/cambia/modifica fila/columna" Es posible que diga columna/fila o fila/columna en otro orden. Por lo que las posiciones deben ser en el orden RESPECTIVAMENTE como las dice el usuario.
-- En changes solo incluye los campos que el usuario quiere cambiar (los demás omítelos). Si un campo se quiere borrar, usa "" para strings o null para enteros.
-- Los objetos DEBEN usar SOLO claves internas:
-  titulo, autor, editorial, ano, fila, columna, isbn. NO uses nombres de columnas del Excel como "Título", "Año", etc.
-- Para set_pos y set_isbn puedes seguir usándolos, pero si el usuario pide varios cambios a la vez, usa update.
-- Si el usuario dice borra/elimina/quita el número X / el libro X” ⇒ op="delete", ref.type="id", ref.value="X" acordemente según diga su id o título.
-- Usa "" en strings si faltan y null en enteros si no se sabe.
-- Si el usuario dice un número más arbitrario, asume que es el id del libro. => ref.type="id".
-- Si el usuario dice "busca", "buscar", "encuentra", "lista", "muéstrame todos", "dame todos" => op="find".
-- Si el usuario dice "consulta", "muéstrame", "dame los datos", "enséñame" y da un id/isbn => op="get".
-- op="get" debe usarse cuando el usuario quiere UN libro concreto (normalmente por id o isbn).
-- Si el usuario dice de "busca", "buscar", "encuentra", "lista", "muéstrame todos", "dame todos"  "por autor X" => query.autor="X" (op=find).
-- Si el usuario dice de "busca", "buscar", "encuentra", "lista", "muéstrame todos", "dame todos"  "por título X" => query.titulo="X" (op=find).
-- Si el usuario dice de "busca", "buscar", "encuentra", "lista", "muéstrame todos", "dame todos"  "por editorial X" => query.editorial="X" (op=find). Etcétera para los demás campos.
-- No cambies autor por editorial ni inventes el campo.
-
-DESAMBIGUACIÓN:
-- Si el texto contiene un número corto seguido inmediatamente de un ISBN (ej: "2A-978-..."):
-  - El número corto es el id del libro.
-  - El número largo (978/979...) es el ISBN.
-
-ISBN — REGLAS ESTRICTAS:
-
-- Un ISBN es un identificador estándar de libros.
-- Un ISBN tiene 10 o 13 dígitos.
-- Un ISBN-13 empieza SIEMPRE por 978 o 979.
-- Un ISBN puede contener guiones.
-- Un ISBN-10 puede terminar en la letra X.
-- Si una cadena numérica tiene 10 o más dígitos y empieza por 978 o 979, TRÁTALA COMO ISBN aunque el usuario no diga la palabra "ISBN".
-- Si el usuario menciona explícitamente la palabra "ISBN", el valor mencionado ES un ISBN sin excepción.
-
-NO CONFUNDIR:
-- Un ISBN NO es un id interno.
-- Un ISBN NO es un año.
-- Un ISBN NO es fila ni columna.
-- Un número corto (ej: 1, 3, 1563) NUNCA es ISBN.
-
-DESAMBIGUACIÓN:
-- Si el texto contiene un número corto seguido de un ISBN (ej: "2A-978-4-19-148410-4"):
-  - El número corto es la referencia del libro (ref.type="id").
-  - El número largo que empieza por 978/979 es el ISBN.
-- En ese caso, separa correctamente ref y changes.isbn.
-
-CAMPOS ADICIONALES:
-
-- procedencia: origen del libro (ciudad, pais, donación, compra, legado, etc.)
-- categoria: clasificación temática del libro
-- f_revision: fecha de revisión en formato dd/mm/yyyy
-- comentarios: texto libre adicional
-
-REVISIÓN:
-- Si el usuario indica una fecha explícita, úsala. En este caso no lo consideres ilógico. Aunque sea futura. O muy pasada.
-- Cuando el usuario te diga de desmarcar un libro como revisado (o te dice actualizar/cambiar/ponerlo a no revisado o vacío), pon changes.f_revision=EMPTY. 
-- Si el usuario dice "revisado", "validado", "comprobado":
-  - usa op=update
-  - incluye changes.f_revision
-  - si NO indica fecha, deja changes.f_revision vacío ("") para que el sistema ponga la fecha actual.
-
-COMENTARIOS:
-- Si el usuario dice "añade comentario", "nota", "observación":
-  - usa changes.comentarios con el texto indicado.
 
+_JSON_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "object": dict,
+    "array": list,
+    "null": type(None),
+}
 
 
-"""
+def _check(value: Any, schema: dict[str, Any], path: str, errors: list[str]) -> None:
+    """
+    Subconjunto de JSON Schema que usa ACTION_SCHEMA: type, enum, const,
+    anyOf, properties, required. Una clave nullable que falta cuenta como null
+    (las acciones ya pasadas por drop_nulls, las de caché y las de
+    command_parser no traen los null).
+    """
+    if "anyOf" in schema:
+        for branch in schema["anyOf"]:
+            sub: list[str] = []
+            _check(value, branch, path, sub)
+            if not sub:
+                return
+        errors.append(f"{path}: no encaja con ninguna opción")
+        return
+
+    types = schema.get("type")
+    if types is not None:
+        types = [types] if isinstance(types, str) else types
+        ok = any(
+            isinstance(value, _JSON_TYPES[t]) and not (t in ("integer", "number") and isinstance(value, bool))
+            for t in types
+        )
+        if not ok:
+            errors.append(f"{path}: se esperaba {'/'.join(types)}")
+            return
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: valor no permitido {value!r}")
+    if "const" in schema and value != schema["const"]:
+        errors.append(f"{path}: se esperaba {schema['const']!r}")
+    if isinstance(value, dict):
+        props = schema.get("properties", {})
+        for k in schema.get("required", []):
+            if k not in value and not _nullable(props.get(k, {})):
+                errors.append(f"{path}.{k}: falta")
+        for k, v in value.items():
+            if k in props:
+                _check(v, props[k], f"{path}.{k}", errors)
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{path}.{k}: clave no permitida")
+
+
+def _nullable(schema: dict[str, Any]) -> bool:
+    types = schema.get("type")
+    if types == "null" or (isinstance(types, list) and "null" in types):
+        return True
+    return any(_nullable(b) for b in schema.get("anyOf", []))
+
+
+def drop_nulls(value: Any) -> Any:
+    """Quita las claves a null (lo que la op no usa) de los objetos, a cualquier nivel."""
+    if isinstance(value, dict):
+        return {k: drop_nulls(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [drop_nulls(v) for v in value]
+    return value
+
+
+def validate_action(action: Any) -> list[str]:
+    """
+    Errores de `action` frente a ACTION_SCHEMA (lista vacía = válida), más
+    las claves que necesita su op (OP_REQUIRED). Vale con o sin los null.
+    """
+    if not isinstance(action, dict):
+        return ["la acción no es un objeto"]
+
+    errors: list[str] = []
+    _check(action, ACTION_SCHEMA["schema"], "$", errors)
+    if errors:
+        return errors
+
+    op = action["op"]
+    missing = [k for k in OP_REQUIRED[op] if action.get(k) is None]
+    if op == "get" and action.get("id") is None and action.get("ref") is None:
+        missing.append("id|ref")
+    if missing:
+        return [f"$: faltan claves para op={op} ({', '.join(missing)})"]
+    return []
+
+
+def _log_cache_write(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        log.warning("No se pudo guardar la caché del LLM: %s", task.exception())
 
 
 class LLMTransformer:
-    def __init__(self, api_key: str, model: str):
-        self.client = OpenAI(api_key=api_key)
+    """
+    Texto libre -> acción JSON, con cliente async para no bloquear el bot.
+
+    - Como mucho `max_concurrency` llamadas en vuelo; el resto espera turno.
+    - `timeout` segundos por llamada (sin contar la espera de turno).
+    - Si se cancela la tarea que llama (update abandonado, apagado del bot),
+      la petición HTTP se cancela con ella.
+    - Con `cache`, las frases repetidas no llegan al LLM (ver ActionCache).
+    - Con `routing`, cada mensaje lleva solo el módulo del prompt de su
+      intención (ver prompts.py); si el módulo no basta y sale "chat", se
+      repite con el prompt completo.
+    - `usage` acumula por módulo llamadas, tokens y segundos de respuesta;
+      lo mismo va a metrics.REGISTRY para /stats.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        max_concurrency: int = 4,
+        timeout: float = 30.0,
+        base_url: str | None = None,
+        cache: Optional[ActionCache] = None,
+        routing: bool = True,
+    ):
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url)
         self.model = model
-
-    def to_action(self, user_text: str) -> dict[str, Any]:
+        self.timeout = timeout
+        self.cache = cache
+        self.routing = routing
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._cache_write: Optional[asyncio.Task] = None
+        # módulo -> {"calls", "prompt_tokens", "completion_tokens", "seconds"}
+        self.usage: dict[str, dict[str, float]] = {}
+
+    async def to_action(self, user_text: str) -> dict[str, Any]:
+        if self.cache is None:
+            with REGISTRY.timer("llm_to_action_seconds", source="llm"), span("llm", source="llm"):
+                return await self._call(user_text)
+
+        t0 = time.perf_counter()
+        key = ActionCache.key(user_text, self.model, PROMPT_VERSION)
+        action = self.cache.get(key)
+        if action is not None:
+            REGISTRY.observe("llm_to_action_seconds", 0.0, source="cache")
+            add_span("llm", t0, time.perf_counter() - t0, source="cache")
+            return action
+        with REGISTRY.timer("llm_to_action_seconds", source="llm"), span("llm", source="llm"):
+            action = await self._call(user_text)
+        if self.cache.put(key, action):
+            self._save_cache()
+        return action
+
+    async def to_actions(self, lines: list[str]) -> list[dict[str, Any] | Exception]:
+        """
+        Varias líneas con una sola petición (por cada MAX_BATCH). Devuelve
+        una acción por línea y en orden; las que el lote no devuelve bien
+        (falta, sobra, no pasa validate_action o es un "chat" para una línea
+        de otro módulo) se piden de nuevo una a una.
+        Si esa llamada también falla, en su lugar va la excepción.
+        """
+        out: list[Any] = [None] * len(lines)
+        keys = [ActionCache.key(ln, self.model, PROMPT_VERSION) for ln in lines]
+
+        pending = []
+        for i, key in enumerate(keys):
+            cached = self.cache.get(key) if self.cache is not None else None
+            if cached is None:
+                pending.append(i)
+            else:
+                out[i] = cached
+
+        chunks = [pending[i:i + MAX_BATCH] for i in range(0, len(pending), MAX_BATCH)]
+        with span("llm", source="lote", lines=len(pending)):
+            results = await asyncio.gather(*(self._call_batch([lines[i] for i in c]) for c in chunks), return_exceptions=True)
+
+        retry = []
+        for chunk, actions in zip(chunks, results):
+            if isinstance(actions, Exception) or len(actions) != len(chunk):
+                # sin lote válido no se sabe qué acción es de qué línea
+                retry.extend(chunk)
+                continue
+            for i, action in zip(chunk, actions):
+                # como en _call: "chat" de un módulo que no es el de chat no vale
+                intent = classify_intent(lines[i]) if self.routing else None
+                if validate_action(action) or (intent not in (None, "chat") and action.get("op") == "chat"):
+                    retry.append(i)
+                else:
+                    out[i] = action
+                    if self.cache is not None and self.cache.put(keys[i], action):
+                        self._save_cache()
+
+        singles = await asyncio.gather(*(self.to_action(lines[i]) for i in retry), return_exceptions=True)
+        for i, action in zip(retry, singles):
+            out[i] = action
+        return out
+
+    def _save_cache(self) -> None:
+        """Si toca, vuelca la caché a disco en un hilo, sin parar el bucle de eventos."""
+        if self._cache_write is not None and not self._cache_write.done():
+            return
+        if not self.cache.due():
+            return
+        entries = self.cache.dump()
+        self._cache_write = asyncio.create_task(asyncio.to_thread(self.cache.write, entries))
+        self._cache_write.add_done_callback(_log_cache_write)
+
+    def close(self) -> None:
+        if self.cache is not None:
+            self.cache.save()
+
+    async def _call(self, user_text: str) -> dict[str, Any]:
+        """
+        Una acción que pasa validate_action: el modo estricto deja null en
+        claves que la op necesita (isbn, n...), y sin ellas el bot no sabe
+        qué hacer. Si el módulo no da acción válida (o da "chat"), se
+        repite con el prompt completo; si ese tampoco, RuntimeError.
+        """
+        intent = classify_intent(user_text) if self.routing else None
+        if intent is not None:
+            action = drop_nulls(await self._complete_json(build_prompt([intent]), user_text, ACTION_SCHEMA, intent))
+            errors = validate_action(action)
+            if not errors and (intent == "chat" or action.get("op") != "chat"):
+                return action
+            log.info("Módulo %s sin acción válida (%s); se repite con el prompt completo", intent, "; ".join(errors) or "chat")
+
+        action = drop_nulls(await self._complete_json(SYSTEM, user_text, ACTION_SCHEMA, "full"))
+        errors = validate_action(action)
+        if errors:
+            REGISTRY.inc("llm_errors_total", reason="invalid")
+            raise RuntimeError(f"El LLM devolvió una acción incompleta: {'; '.join(errors)}")
+        return action
+
+    async def _call_batch(self, lines: list[str]) -> list[Any]:
+        intents = [classify_intent(ln) for ln in lines] if self.routing else [None]
+        system = build_prompt(intents) + BATCH_RULES
+        route = "lote:" + ("+".join(sorted(set(intents))) if None not in intents else "full")
+        data = await self._complete_json(system, json.dumps(lines, ensure_ascii=False), BATCH_SCHEMA, route)
+        actions = data.get("actions") if isinstance(data, dict) else data
+        if not isinstance(actions, list):
+            raise RuntimeError("El LLM no devolvió una lista de acciones")
+        return [drop_nulls(a) for a in actions]
+
+    def _record(self, route: str, resp: Any, seconds: float) -> None:
+        u = self.usage.setdefault(route, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0})
+        usage = getattr(resp, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        u["calls"] += 1
+        u["prompt_tokens"] += prompt_tokens
+        u["completion_tokens"] += completion_tokens
+        u["seconds"] += seconds
+        REGISTRY.inc("llm_requests_total", route=route)
+        REGISTRY.observe("llm_request_seconds", seconds, route=route)
+        REGISTRY.inc("llm_tokens_total", prompt_tokens, route=route, kind="prompt")
+        REGISTRY.inc("llm_tokens_total", completion_tokens, route=route, kind="completion")
+        add_span(
+            "llm_api", time.perf_counter() - seconds, seconds,
+            route=route, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+        )
+        log.info("LLM %s: %d+%d tokens, %.0f ms", route, prompt_tokens, completion_tokens, seconds * 1000)
+
+    async def _complete_json(self, system: str, user_text: str, schema: dict[str, Any], route: str) -> Any:
+        out = None
         try:
-            resp = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": SYSTEM},
-                    {"role": "user", "content": user_text},
-                ],
-                temperature=0,
-            )
-
-            out = resp.choices[0].message.content
-            return json.loads(out)
+            async with self._slots:
+                t0 = time.perf_counter()
+                resp = await asyncio.wait_for(
+                    self.client.chat.completions.create(
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": system},
+                            {"role": "user", "content": user_text},
+                        ],
+                        temperature=0,
+                        response_format={"type": "json_schema", "json_schema": schema},
+                    ),
+                    timeout=self.timeout,
+                )
+                self._record(route, resp, time.perf_counter() - t0)
+
+            msg = resp.choices[0].message
+            if getattr(msg, "refusal", None):
+                raise LLMRefusal(f"El LLM rechazó la petición: {msg.refusal}")
+            out = msg.content
+            return json.loads(out or "")
 
         except json.JSONDecodeError as e:
+            REGISTRY.inc("llm_errors_total", reason="json")
             raise RuntimeError(f"El LLM no devolvió JSON válido: {out}") from e
 
+        except LLMRefusal:
+            REGISTRY.inc("llm_errors_total", reason="refusal")
+            raise
+
+        except asyncio.TimeoutError as e:
+            REGISTRY.inc("llm_errors_total", reason="timeout")
+            raise RuntimeError(f"El LLM no respondió en {self.timeout:g} s") from e
+
         except Exception as e:
+            REGISTRY.inc("llm_errors_total", reason="api")
             raise RuntimeError(f"Error llamando al LLM: {e}") from e
-
@@ -0,0 +1,301 @@
+"""
+Métricas en memoria del proceso: contadores e histogramas con etiquetas.
+
+Un único registro, REGISTRY, al que escriben el LLM, la transcripción, los
+stores y los handlers:
+
+    REGISTRY.inc("nl_actions_total", op="find", source="parser")
+    with REGISTRY.timer("stt_seconds"):
+        ...
+
+/stats lo resume para el admin (summary()), y con METRICS_PORT se sirve en
+formato de texto de Prometheus en http://METRICS_LISTEN:METRICS_PORT/metrics
+(render_prometheus()).
+
+Para los stores, store_op() separa el tiempo de cada operación en espera
+del lock (lo que RWFileLock apunta con lock_waited()) y trabajo (el resto).
+"""
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Iterator, Optional
+
+# Límites superiores (s) de los histogramas de latencia
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        i = 0
+        while i < len(BUCKETS) and value > BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Aproximado, interpolando dentro del bucket (como histogram_quantile)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                if i == len(BUCKETS):
+                    # por encima del último límite no hay con qué interpolar
+                    return BUCKETS[-1]
+                lo = BUCKETS[i - 1] if i else 0.0
+                return lo + (BUCKETS[i] - lo) * (rank - seen) / c
+            seen += c
+        return BUCKETS[-1]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[Labels, float]] = {}
+        self._histograms: dict[str, dict[Labels, Histogram]] = {}
+        self._help: dict[str, str] = {}
+
+    def describe(self, name: str, text: str) -> None:
+        self._help[name] = text
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            h = series.get(key)
+            if h is None:
+                h = series[key] = Histogram()
+            h.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """Observa en `name` lo que tarda el bloque (también si lanza)."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def counters(self, name: str) -> dict[Labels, float]:
+        with self._lock:
+            return dict(self._counters.get(name, {}))
+
+    def histograms(self, name: str) -> dict[Labels, Histogram]:
+        with self._lock:
+            return dict(self._histograms.get(name, {}))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    # ---------- salida ----------
+
+    def render_prometheus(self) -> str:
+        """Formato de texto 0.0.4 de Prometheus."""
+        def fmt(labels: Labels, extra: Labels = ()) -> str:
+            items = labels + extra
+            if not items:
+                return ""
+            body = ",".join(f'{k}="{_escape(v)}"' for k, v in items)
+            return "{" + body + "}"
+
+        out: list[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    out.append(f"# HELP {name} {self._help[name]}")
+                out.append(f"# TYPE {name} counter")
+                for labels, v in sorted(series.items()):
+                    out.append(f"{name}{fmt(labels)} {v:g}")
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    out.append(f"# HELP {name} {self._help[name]}")
+                out.append(f"# TYPE {name} histogram")
+                for labels, h in sorted(series.items()):
+                    seen = 0
+                    for le, c in zip(BUCKETS, h.counts):
+                        seen += c
+                        out.append(f"{name}_bucket{fmt(labels, (('le', f'{le:g}'),))} {seen}")
+                    out.append(f"{name}_bucket{fmt(labels, (('le', '+Inf'),))} {h.count}")
+                    out.append(f"{name}_sum{fmt(labels)} {h.sum:.6f}")
+                    out.append(f"{name}_count{fmt(labels)} {h.count}")
+        return "\n".join(out) + "\n"
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = Registry()
+
+REGISTRY.describe("llm_requests_total", "Peticiones al API del LLM por módulo de prompt")
+REGISTRY.describe("llm_request_seconds", "Tiempo de respuesta del API del LLM")
+REGISTRY.describe("llm_tokens_total", "Tokens facturados por el LLM (prompt/completion)")
+REGISTRY.describe("llm_errors_total", "Llamadas al LLM fallidas")
+REGISTRY.describe("llm_to_action_seconds", "to_action de punta a punta (caché o LLM)")
+REGISTRY.describe("stt_seconds", "Speech2Text.transcribe_file")
+REGISTRY.describe("stt_requests_total", "Transcripciones por resultado")
+REGISTRY.describe("stt_tokens_total", "Tokens de la transcripción (input/output), si el API los da")
+REGISTRY.describe("store_ops_total", "Operaciones del store por resultado")
+REGISTRY.describe("store_lock_wait_seconds", "Espera del lock del catálogo por operación")
+REGISTRY.describe("store_work_seconds", "Trabajo de la operación sin la espera del lock")
+REGISTRY.describe("nl_actions_total", "Acciones ejecutadas por op y origen (parser/llm/lote)")
+REGISTRY.describe("nl_seconds", "process_natural_language por op")
+
+
+# ---------- store: espera del lock frente a trabajo ----------
+
+_op = threading.local()
+
+
+def lock_waited(seconds: float) -> None:
+    """Lo llama el lock al conseguirse: se suma a la operación en curso del hilo."""
+    if getattr(_op, "wait", None) is not None:
+        _op.wait += seconds
+
+
+@contextmanager
+def measure_store_op(op: str, registry: Registry = REGISTRY) -> Iterator[None]:
+    """
+    Cuenta `op` y parte su tiempo en espera del lock y trabajo. Anidadas
+    (add -> session, find -> session) solo cuenta la de fuera.
+    """
+    if getattr(_op, "wait", None) is not None:
+        yield
+        return
+
+    _op.wait = 0.0
+    t0 = time.perf_counter()
+    result = "error"
+    try:
+        yield
+        result = "ok"
+    finally:
+        total = time.perf_counter() - t0
+        wait = min(_op.wait, total)
+        _op.wait = None
+        registry.inc("store_ops_total", op=op, result=result)
+        registry.observe("store_lock_wait_seconds", wait, op=op)
+        registry.observe("store_work_seconds", total - wait, op=op)
+
+
+def store_op(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Decorador de los métodos públicos de los stores (ver measure_store_op)."""
+    @wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with measure_store_op(fn.__name__):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+# ---------- /stats ----------
+
+def _ms(v: float) -> str:
+    return f"{v * 1000:.1f}" if v < 0.01 else f"{v * 1000:.0f}"
+
+
+def summary(registry: Registry = REGISTRY, cache_stats: Optional[dict[str, Any]] = None) -> str:
+    """Resumen en texto plano para /stats."""
+    lines: list[str] = []
+
+    llm = registry.histograms("llm_request_seconds")
+    tokens = registry.counters("llm_tokens_total")
+    if llm:
+        lines.append("🧠 LLM (llamadas · p50/p95 ms · tokens prompt+compl.)")
+        for labels, h in sorted(llm.items()):
+            route = dict(labels).get("route", "")
+            p = tokens.get(_labels({"route": route, "kind": "prompt"}), 0)
+            c = tokens.get(_labels({"route": route, "kind": "completion"}), 0)
+            lines.append(f"  {route}: {h.count} · {_ms(h.quantile(0.5))}/{_ms(h.quantile(0.95))} · {p:g}+{c:g}")
+    errors = sum(registry.counters("llm_errors_total").values())
+    if errors:
+        lines.append(f"  errores: {errors:g}")
+    if cache_stats:
+        lines.append(
+            f"  caché: {cache_stats.get('entries', 0)} frases, {cache_stats.get('hits', 0)} aciertos, "
+            f"{cache_stats.get('misses', 0)} fallos ({cache_stats.get('hit_rate', 0.0):.0%})"
+        )
+
+    stt = registry.histograms("stt_seconds")
+    if stt:
+        h = next(iter(stt.values())) if len(stt) == 1 else None
+        total = sum(x.count for x in stt.values())
+        lines.append(f"🎙️ Transcripción: {total}" + (f" · p50/p95 {_ms(h.quantile(0.5))}/{_ms(h.quantile(0.95))} ms" if h else ""))
+
+    work = registry.histograms("store_work_seconds")
+    wait = registry.histograms("store_lock_wait_seconds")
+    if work:
+        lines.append("📚 Store (ops · trabajo p50/p95 ms · espera lock p50/p95 ms)")
+        for labels, h in sorted(work.items(), key=lambda kv: -kv[1].count):
+            w = wait.get(labels) or Histogram()
+            op = dict(labels).get("op", "")
+            lines.append(
+                f"  {op}: {h.count} · {_ms(h.quantile(0.5))}/{_ms(h.quantile(0.95))} · "
+                f"{_ms(w.quantile(0.5))}/{_ms(w.quantile(0.95))}"
+            )
+    store_errors = sum(v for k, v in registry.counters("store_ops_total").items() if ("result", "error") in k)
+    if store_errors:
+        lines.append(f"  errores: {store_errors:g}")
+
+    actions = registry.counters("nl_actions_total")
+    if actions:
+        per_op: dict[str, dict[str, float]] = {}
+        for labels, v in actions.items():
+            d = dict(labels)
+            per_op.setdefault(d.get("op", ""), {})[d.get("source", "")] = v
+        lines.append("💬 Acciones (op: total · sin LLM)")
+        for op, by_src in sorted(per_op.items(), key=lambda kv: -sum(kv[1].values())):
+            lines.append(f"  {op}: {sum(by_src.values()):g} · {by_src.get('parser', 0):g}")
+
+    return "\n".join(lines) if lines else "Sin datos todavía."
+
+
+# ---------- endpoint Prometheus ----------
+
+def start_http_server(host: str, port: int, registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    """GET /metrics en un hilo aparte; devuelve el servidor (shutdown() para pararlo)."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+
+    server = Server((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
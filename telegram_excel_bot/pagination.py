@@ -0,0 +1,98 @@
+"""
+Paginación de resultados con botones ◀️ / ▶️.
+
+Una búsqueda guarda la lista completa de ids, ya ordenada, bajo un token
+(cursor) de su chat. Los botones llevan "pg:<token>:<página>" y cada
+página se sirve de esa lista: ni LLM ni búsqueda otra vez, solo las filas
+de la página por id.
+
+Los cursores caducan a los `ttl` segundos del último uso, y cada chat
+guarda como mucho `per_chat` (se descarta el menos usado). Tras un
+/compact los ids de la lista ya no son los mismos libros: clear() los tira
+todos.
+"""
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+CALLBACK_PREFIX = "pg:"
+
+
+@dataclass
+class Cursor:
+    token: str
+    ids: list[Any]
+    title: str
+    expires: float = 0.0
+
+
+class ResultPages:
+    def __init__(self, page_size: int = 10, ttl: float = 30 * 60, per_chat: int = 5):
+        self.page_size = page_size
+        self.ttl = ttl
+        self.per_chat = per_chat
+        # chat_id -> token -> cursor; el final es lo más reciente
+        self._chats: dict[int, OrderedDict[str, Cursor]] = {}
+
+    def pages(self, cursor: Cursor) -> int:
+        return max(1, -(-len(cursor.ids) // self.page_size))
+
+    def page_ids(self, cursor: Cursor, page: int) -> list[Any]:
+        start = page * self.page_size
+        return cursor.ids[start:start + self.page_size]
+
+    def put(self, chat_id: int, ids: list[Any], title: str) -> Cursor:
+        self.evict()
+        cursors = self._chats.setdefault(chat_id, OrderedDict())
+        cursor = Cursor(secrets.token_urlsafe(6), list(ids), title, time.monotonic() + self.ttl)
+        cursors[cursor.token] = cursor
+        while len(cursors) > self.per_chat:
+            cursors.popitem(last=False)
+        return cursor
+
+    def get(self, chat_id: int, token: str) -> Optional[Cursor]:
+        """Cursor vivo de ese chat (un token de otro chat no vale); renueva el TTL."""
+        cursors = self._chats.get(chat_id)
+        cursor = cursors.get(token) if cursors else None
+        if cursor is None:
+            return None
+        now = time.monotonic()
+        if cursor.expires <= now:
+            del cursors[token]
+            return None
+        cursor.expires = now + self.ttl
+        cursors.move_to_end(token)
+        return cursor
+
+    def evict(self) -> None:
+        """Quita los cursores caducados de todos los chats."""
+        now = time.monotonic()
+        for chat_id in list(self._chats):
+            cursors = self._chats[chat_id]
+            for token in [t for t, c in cursors.items() if c.expires <= now]:
+                del cursors[token]
+            if not cursors:
+                del self._chats[chat_id]
+
+    def clear(self) -> None:
+        """Olvida todos los cursores (los ids guardados ya no valen)."""
+        self._chats.clear()
+
+    def __len__(self) -> int:
+        return sum(len(c) for c in self._chats.values())
+
+
+def callback_data(token: str, page: int) -> str:
+    return f"{CALLBACK_PREFIX}{token}:{page}"
+
+
+def parse_callback(data: str) -> Optional[tuple[str, int]]:
+    """"pg:<token>:<página>" -> (token, página); None si no encaja."""
+    if not data or not data.startswith(CALLBACK_PREFIX):
+        return None
+    token, _, page = data[len(CALLBACK_PREFIX):].rpartition(":")
+    if not token or not page.isdigit():
+        return None
+    return token, int(page)
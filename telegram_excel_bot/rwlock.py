@@ -0,0 +1,86 @@
+"""
+Lock de lectores/escritor sobre un fichero, entre hilos y entre procesos.
+
+En POSIX usa flock(): LOCK_SH para lecturas, LOCK_EX para escrituras. Cada
+adquisición abre su propio descriptor, así que dos hilos del mismo proceso
+se excluyen igual que dos procesos (flock va por descriptor abierto, no por
+proceso). El fichero de lock es el mismo que usa FileLock, de modo que un
+proceso con la versión anterior del bot sigue excluyéndose con este.
+
+Para que un goteo continuo de lecturas no deje esperando para siempre a una
+escritura, hay un segundo fichero (`<lock>.gate`) que hace de turno: el
+escritor lo coge antes de esperar su LOCK_EX y los lectores nuevos pasan
+por él antes de su LOCK_SH, así que se quedan detrás del escritor.
+
+Sin fcntl (Windows) se recurre a FileLock: lecturas y escrituras exclusivas,
+como antes.
+
+Lo que se tarda en conseguir el lock se apunta en metrics (lock_waited) a
+la operación del store en curso, y como span "lock" en su traza.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import ContextManager, Iterator
+
+from filelock import FileLock
+
+from telegram_excel_bot.metrics import lock_waited
+from telegram_excel_bot.tracing import add_span
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class RWFileLock:
+    def __init__(self, path: str):
+        self.path = path
+        self.gate_path = path + ".gate"
+
+    @contextmanager
+    def _flock(self, path: str, mode: int) -> Iterator[None]:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def _acquire(self, mode: int) -> Iterator[None]:
+        t0 = time.perf_counter()
+        if fcntl is None:
+            with FileLock(self.path):
+                lock_waited(time.perf_counter() - t0)
+                add_span("lock", t0, time.perf_counter() - t0)
+                yield
+            return
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # turno: un lector nuevo entra detrás de un escritor que espera, y
+            # el escritor solo espera a los lectores que ya estaban dentro
+            with self._flock(self.gate_path, fcntl.LOCK_EX):
+                fcntl.flock(fd, mode)
+            waited = time.perf_counter() - t0
+            lock_waited(waited)
+            add_span("lock", t0, waited, mode="exclusive" if mode == fcntl.LOCK_EX else "shared")
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def shared(self) -> ContextManager[None]:
+        """Varios lectores a la vez; ningún escritor mientras tanto."""
+        return self._acquire(fcntl.LOCK_SH if fcntl else 0)
+
+    def exclusive(self) -> ContextManager[None]:
+        """Un único escritor, sin lectores."""
+        return self._acquire(fcntl.LOCK_EX if fcntl else 0)
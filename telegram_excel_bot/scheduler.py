@@ -0,0 +1,215 @@
+"""
+Reparto de updates entre chats para python-telegram-bot.
+
+FairUpdateProcessor sustituye al procesado de uno en uno:
+
+- Orden estricto por chat: de cada chat hay como mucho un update en curso,
+  y los suyos salen en el orden de llegada (las ediciones en varias líneas
+  dependen de eso).
+- Chats distintos van a la vez, hasta `workers` updates en paralelo.
+- Turno rotatorio: los chats con trabajo pendiente forman una rueda y cada
+  uno procesa un update antes de volver al final, así que un chat con
+  veinte mensajes en cola no deja esperando a los demás.
+- Cubo de fichas por chat para el trabajo que va al LLM: `cost(update)`
+  dice cuántas fichas gasta (0 para lo que no llama al LLM). Se recargan a
+  `rate` por segundo hasta `burst`. Un chat sin fichas se aparta de la rueda
+  hasta que le toquen, sin ocupar ningún worker mientras espera.
+
+PTB limita con su propio semáforo los updates "en proceso"; aquí ese
+límite es `max_pending` (en cola + en curso) y el paralelismo real lo
+decide `workers`.
+
+Cada update se procesa dentro de su traza (tracing.trace), que empieza al
+llegar: el span "queue" es lo que esperó su turno.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from telegram_excel_bot.tracing import trace
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_for(self, cost: float) -> float:
+        """Segundos hasta tener `cost` fichas (0 = ya las hay)."""
+        self._refill()
+        cost = min(cost, self.burst)
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, cost: float) -> None:
+        self._refill()
+        self.tokens -= min(cost, self.burst)
+
+
+class _Job:
+    __slots__ = ("coroutine", "future", "cost", "attrs", "queued_at")
+
+    def __init__(self, coroutine: Awaitable[Any], future: asyncio.Future, cost: float, attrs: dict[str, Any]):
+        self.coroutine = coroutine
+        self.future = future
+        self.cost = cost
+        self.attrs = attrs
+        self.queued_at = time.perf_counter()
+
+
+def _trace_attrs(update: object) -> dict[str, Any]:
+    """Qué update es, para la traza (sin el texto del mensaje)."""
+    if not isinstance(update, Update):
+        return {}
+    attrs: dict[str, Any] = {"update_id": update.update_id}
+    if update.effective_chat is not None:
+        attrs["chat_id"] = update.effective_chat.id
+    msg = update.effective_message
+    if update.callback_query is not None:
+        attrs["kind"] = "callback"
+    elif msg is not None and (msg.voice or msg.audio):
+        attrs["kind"] = "audio"
+    elif msg is not None and msg.document:
+        attrs["kind"] = "document"
+    elif msg is not None and msg.text and msg.text.startswith("/"):
+        attrs["kind"] = "command"
+    elif msg is not None and msg.text:
+        attrs["kind"] = "text"
+    return attrs
+
+
+class FairUpdateProcessor(BaseUpdateProcessor):
+    def __init__(
+        self,
+        workers: int = 4,
+        max_pending: int = 256,
+        rate: float = 0.5,
+        burst: float = 10.0,
+        cost: Optional[Callable[[object], float]] = None,
+    ):
+        super().__init__(max_concurrent_updates=max(max_pending, 2))
+        self.workers = workers
+        self.rate = rate
+        self.burst = burst
+        self.cost = cost or (lambda update: 0.0)
+
+        # chat -> updates pendientes, en orden de llegada
+        self._queues: dict[Hashable, deque[_Job]] = {}
+        # chats con algo pendiente y sin nada en curso: el turno rotatorio
+        self._ring: deque[Hashable] = deque()
+        # chats con un update en curso o esperando fichas (fuera de la rueda)
+        self._busy: set[Hashable] = set()
+        self._buckets: dict[Hashable, TokenBucket] = {}
+        self._running = 0
+
+    @staticmethod
+    def chat_key(update: object) -> Hashable:
+        if isinstance(update, Update) and update.effective_chat is not None:
+            return update.effective_chat.id
+        # sin chat (p. ej. inline queries): sin orden que respetar
+        return object()
+
+    # ---------- BaseUpdateProcessor ----------
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self.chat_key(update)
+        cost = self.cost(update) if self.rate > 0 else 0.0
+        job = _Job(coroutine, asyncio.get_running_loop().create_future(), cost, _trace_attrs(update))
+
+        queue = self._queues.setdefault(key, deque())
+        queue.append(job)
+        if key not in self._busy and len(queue) == 1:
+            self._ring.append(key)
+        self._dispatch()
+        await job.future
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        """Descarta lo que aún no ha empezado."""
+        for queue in self._queues.values():
+            for job in queue:
+                job.coroutine.close()
+                if not job.future.done():
+                    job.future.cancel()
+        self._queues.clear()
+        self._ring.clear()
+
+    # ---------- reparto ----------
+
+    def _bucket(self, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._running < self.workers and self._ring:
+            key = self._ring.popleft()
+            queue = self._queues[key]
+            job = queue[0]
+
+            if job.cost > 0:
+                bucket = self._bucket(key)
+                wait = bucket.wait_for(job.cost)
+                if wait > 0:
+                    # fuera de la rueda hasta que tenga fichas; sus siguientes, detrás
+                    self._busy.add(key)
+                    loop.call_later(wait, self._requeue, key)
+                    continue
+                bucket.take(job.cost)
+
+            queue.popleft()
+            self._busy.add(key)
+            self._running += 1
+            task = loop.create_task(self._run(job))
+            task.add_done_callback(lambda _t, key=key: self._done(key))
+
+    async def _run(self, job: _Job) -> None:
+        try:
+            with trace("update", start=job.queued_at, **job.attrs) as t:
+                t.add("queue", job.queued_at, time.perf_counter() - job.queued_at)
+                await job.coroutine
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except BaseException as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(None)
+
+    def _done(self, key: Hashable) -> None:
+        self._running -= 1
+        self._requeue(key)
+
+    def _requeue(self, key: Hashable) -> None:
+        self._busy.discard(key)
+        queue = self._queues.get(key)
+        if queue:
+            self._ring.append(key)
+        elif queue is not None:
+            del self._queues[key]
+            self._gc_bucket(key)
+        self._dispatch()
+
+    def _gc_bucket(self, key: Hashable) -> None:
+        # un cubo lleno es igual que uno nuevo: no hace falta guardarlo
+        bucket = self._buckets.get(key)
+        if bucket is not None and bucket.wait_for(bucket.burst) == 0:
+            del self._buckets[key]
@@ -1,6 +1,8 @@
 import os
 from openai import OpenAI
 
+from telegram_excel_bot.metrics import REGISTRY
+
 class Speech2Text:
     def __init__(self, api_key: str, model: str = "gpt-4o-mini-transcribe"):
         self.client = OpenAI(api_key=api_key)
@@ -8,10 +10,22 @@ class Speech2Text:
 
     def transcribe_file(self, path: str, language: str | None = None) -> str:
         # language opcional: "es" si quieres forzar español
-        with open(path, "rb") as f:
-            resp = self.client.audio.transcriptions.create(
-                model=self.model,
-                file=f,
-                language=language,
-            )
+        result = "error"
+        try:
+            with REGISTRY.timer("stt_seconds", model=self.model), open(path, "rb") as f:
+                resp = self.client.audio.transcriptions.create(
+                    model=self.model,
+                    file=f,
+                    language=language,
+                )
+            result = "ok"
+        finally:
+            REGISTRY.inc("stt_requests_total", result=result)
+
+        # tokens de audio/texto si el API los devuelve (modelos *-transcribe)
+        usage = getattr(resp, "usage", None)
+        for kind in ("input_tokens", "output_tokens"):
+            n = getattr(usage, kind, None)
+            if isinstance(n, int):
+                REGISTRY.inc("stt_tokens_total", n, kind=kind.split("_")[0])
         return resp.text
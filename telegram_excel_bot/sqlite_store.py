@@ -0,0 +1,651 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+from typing import Any, Iterator, Optional
+
+from openpyxl import Workbook
+
+from telegram_excel_bot.excel_store import (
+    FIELD_TO_HEADER,
+    FIND_MAX_IDS,
+    FIND_MAX_ROWS,
+    FUZZY_MIN_SCORE,
+    HEADERS,
+    INT_FIELDS,
+    TOMBSTONE_HEADER,
+    ExcelStore,
+    _coerce_changes,
+    _fold,
+    _id_key,
+    _isbn_key,
+    _trigrams,
+    resolve_ref,
+)
+from telegram_excel_bot.exports import write_rows
+from telegram_excel_bot.metrics import lock_waited, measure_store_op, store_op
+from telegram_excel_bot.tracing import add_span, span
+
+
+# Cabecera canónica -> columna SQL
+COLUMNS = {
+    "id": "id",
+    "Título": "titulo",
+    "Autor": "autor",
+    "Procedencia": "procedencia",
+    "Categoría": "categoria",
+    "Editorial": "editorial",
+    "Año": "ano",
+    "Columna": "columna",
+    "Fila": "fila",
+    "ISBN": "isbn",
+    "F_revision": "f_revision",
+    "Comentarios": "comentarios",
+}
+
+# Columnas de texto con copia normalizada (_fold, con espacios de borde) en FTS5
+TEXT_COLUMNS = ("titulo", "autor", "editorial")
+
+# Claves de find() -> columna SQL
+KEY_TO_COLUMN = {
+    "titulo": "titulo",
+    "autor": "autor",
+    "editorial": "editorial",
+    "ano": "ano",
+    "isbn": "isbn",
+    "fila": "fila",
+    "columna": "columna",
+    "id": "id",
+}
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id          INTEGER PRIMARY KEY,
+    titulo      TEXT,
+    autor       TEXT,
+    procedencia TEXT,
+    categoria   TEXT,
+    editorial   TEXT,
+    ano,
+    columna     INTEGER,
+    fila        INTEGER,
+    isbn        TEXT,
+    f_revision  TEXT,
+    comentarios TEXT,
+    -- derivadas: se recalculan en cada escritura
+    isbn_key    TEXT,
+    titulo_f    TEXT NOT NULL DEFAULT '',
+    autor_f     TEXT NOT NULL DEFAULT '',
+    editorial_f TEXT NOT NULL DEFAULT ''
+);
+
+-- ids de libros borrados con delete(): no se reutilizan hasta compact_ids()
+CREATE TABLE IF NOT EXISTS tombstones (
+    id      INTEGER PRIMARY KEY,
+    borrado TEXT
+);
+
+-- versión del catálogo (exportaciones en caché): +1 con cada cambio
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+
+CREATE INDEX IF NOT EXISTS ix_books_isbn ON books(isbn_key);
+CREATE INDEX IF NOT EXISTS ix_books_autor ON books(autor_f);
+CREATE INDEX IF NOT EXISTS ix_books_ano ON books(ano);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+    titulo_f, autor_f, editorial_f,
+    content='books', content_rowid='id', tokenize='trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS books_ai AFTER INSERT ON books BEGIN
+    INSERT INTO books_fts(rowid, titulo_f, autor_f, editorial_f)
+    VALUES (new.id, new.titulo_f, new.autor_f, new.editorial_f);
+END;
+
+CREATE TRIGGER IF NOT EXISTS books_ad AFTER DELETE ON books BEGIN
+    INSERT INTO books_fts(books_fts, rowid, titulo_f, autor_f, editorial_f)
+    VALUES ('delete', old.id, old.titulo_f, old.autor_f, old.editorial_f);
+END;
+
+CREATE TRIGGER IF NOT EXISTS books_au AFTER UPDATE ON books BEGIN
+    INSERT INTO books_fts(books_fts, rowid, titulo_f, autor_f, editorial_f)
+    VALUES ('delete', old.id, old.titulo_f, old.autor_f, old.editorial_f);
+    INSERT INTO books_fts(rowid, titulo_f, autor_f, editorial_f)
+    VALUES (new.id, new.titulo_f, new.autor_f, new.editorial_f);
+END;
+
+CREATE TRIGGER IF NOT EXISTS books_version_ai AFTER INSERT ON books BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'version';
+END;
+CREATE TRIGGER IF NOT EXISTS books_version_ad AFTER DELETE ON books BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'version';
+END;
+CREATE TRIGGER IF NOT EXISTS books_version_au AFTER UPDATE ON books BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'version';
+END;
+"""
+
+
+def _fts_phrase(column: str, text: str) -> str:
+    """Consulta FTS5 de subcadena exacta limitada a una columna."""
+    return '{%s} : "%s"' % (column, text.replace('"', '""'))
+
+
+class SQLiteStore:
+    """
+    Catálogo en SQLite con la misma API pública que ExcelStore.
+
+    - WAL: los lectores no esperan a los escritores.
+    - Índices por id (clave primaria), ISBN normalizado, autor y año.
+    - FTS5 con tokenizer trigram sobre Título/Autor/Editorial normalizados,
+      para subcadenas sin tildes y el mismo ranking que ExcelStore.find.
+    - El orden de hoja es el orden de id (id = fila_excel - 1).
+    - delete() quita la fila y apunta su id en `tombstones`, para que no
+      lo herede un libro nuevo; compact_ids() cierra los huecos.
+
+    Una conexión por hilo (sqlite3 no comparte conexiones entre hilos).
+    """
+
+    def __init__(self, path: str, sheet: str = "Catalogo"):
+        self.path = path
+        # nombre de hoja al exportar a .xlsx
+        self.sheet = sheet
+        self._local = threading.local()
+        self._conns: list[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+
+    # ---------- conexión ----------
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    def close(self) -> None:
+        with self._conns_lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns.clear()
+        self._local = threading.local()
+
+    # ---------- utilidades ----------
+
+    @staticmethod
+    def _derived(values: dict[str, Any]) -> dict[str, Any]:
+        """Columnas derivadas a partir de las de usuario (claves SQL)."""
+        out = {"isbn_key": _isbn_key(values.get("isbn"))}
+        for col in TEXT_COLUMNS:
+            out[f"{col}_f"] = f" {_fold(values.get(col))} "
+        return out
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> dict[str, Any]:
+        return {h: row[col] for h, col in COLUMNS.items()}
+
+    def _insert(self, conn: sqlite3.Connection, rowd: dict[str, Any]) -> None:
+        values = {COLUMNS[h]: rowd.get(h) for h in HEADERS}
+        values.update(self._derived(values))
+        cols = ", ".join(values)
+        marks = ", ".join(f":{c}" for c in values)
+        conn.execute(f"INSERT INTO books ({cols}) VALUES ({marks})", values)
+
+    # ---------- importar / exportar ----------
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM books").fetchone()[0]
+
+    @store_op
+    def import_xlsx(self, xlsx_path: str, sheet: str) -> int:
+        """
+        Carga única desde el Excel (con su diario ya volcado). Sustituye todo
+        el contenido de la tabla. Devuelve el número de filas importadas.
+        """
+        excel = ExcelStore(xlsx_path, sheet)
+        try:
+            excel.compact_journal()
+            rows = excel.all_rows()
+            deleted = excel.deleted_ids()
+        finally:
+            excel.close()
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM books")
+            conn.execute("DELETE FROM tombstones")
+            for rowd in rows:
+                if _id_key(rowd.get("id")) is None:
+                    continue
+                self._insert(conn, rowd)
+            for book_id in deleted:
+                k = _int_id(book_id)
+                if k is not None:
+                    conn.execute("INSERT OR IGNORE INTO tombstones (id) VALUES (?)", (k,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self.count()
+
+    @staticmethod
+    def _version(conn: sqlite3.Connection) -> str:
+        return "sqlite:%d" % conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    @store_op
+    def version(self) -> str:
+        """Versión del catálogo: contador que suben los triggers con cada cambio."""
+        return self._version(self._conn())
+
+    @store_op
+    def export(self, dest: str, fmt: str = "xlsx") -> str:
+        """
+        Como ExcelStore.export: filas no borradas en .xlsx, o "csv"/"jsonl"
+        comprimidos, leídas en una sola transacción. Devuelve la versión de
+        lo escrito.
+        """
+        with self.session(write=False) as s:
+            version = self._version(s._conn)
+            rows = s._conn.execute("SELECT * FROM books ORDER BY id")
+            write_rows(dest, fmt, (self._row_to_dict(r) for r in rows), HEADERS, self.sheet)
+        return version
+
+    @store_op
+    def export_xlsx(self, dest: str) -> None:
+        """Escribe el catálogo completo (borrados incluidos) en un .xlsx nuevo."""
+        with self.session(write=False) as s:
+            self._write_xlsx(s._conn, dest)
+
+    def _write_xlsx(self, conn: sqlite3.Connection, dest: str) -> None:
+        """
+        Los ids borrados salen como filas vacías con la fecha en Borrado,
+        igual que en el Excel, para que id = fila_excel - 1 siga valiendo.
+        """
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(self.sheet)
+        ws.append(HEADERS + [TOMBSTONE_HEADER])
+        cols = ", ".join(COLUMNS.values())
+        blanks = ", ".join(["NULL"] * (len(COLUMNS) - 1))
+        sql = (
+            f"SELECT {cols}, NULL FROM books "
+            f"UNION ALL SELECT id, {blanks}, COALESCE(borrado, '-') FROM tombstones ORDER BY 1"
+        )
+        for row in conn.execute(sql):
+            ws.append(list(row))
+        wb.save(dest)
+
+    # ---------- operaciones públicas ----------
+
+    @contextmanager
+    def session(self, write: bool = True) -> Iterator["SQLiteSession"]:
+        """
+        Unidad de trabajo en una transacción, como ExcelStore.session.
+        Escritura: BEGIN IMMEDIATE. Lectura: BEGIN diferido (con WAL no
+        bloquea a nadie y ve una foto coherente).
+        """
+        with measure_store_op("session_write" if write else "session_read"):
+            conn = self._conn()
+            # BEGIN IMMEDIATE espera a que acabe otra escritura: es la espera del lock
+            t0 = time.perf_counter()
+            conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            lock_waited(time.perf_counter() - t0)
+            add_span("lock", t0, time.perf_counter() - t0, mode="exclusive" if write else "shared")
+            try:
+                yield SQLiteSession(self, conn)
+                with span("save"):
+                    conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _view(self) -> "SQLiteSession":
+        """Lecturas sueltas: sin transacción explícita (WAL)."""
+        return SQLiteSession(self, self._conn())
+
+    @store_op
+    def add(self, book: dict[str, Any]) -> int:
+        """
+        Append puro, mismo contrato que ExcelStore.add: id = último + 1.
+        book keys (internos): titulo, autor, editorial, ano, columna, fila, isbn
+        """
+        with self.session() as s:
+            return s.add(book)["id"]
+
+    @store_op
+    def add_many(self, books: list[dict[str, Any]]) -> list[int]:
+        """Alta en bloque en una sola transacción, como ExcelStore.add_many."""
+        if not books:
+            return []
+
+        with self.session() as s:
+            first_id = s._next_id()
+            for i, book in enumerate(books):
+                row = {h: "" for h in HEADERS}
+                row["id"] = first_id + i
+                for k, h in FIELD_TO_HEADER.items():
+                    v = book.get(k)
+                    row[h] = v if k in INT_FIELDS else (v or "")
+                self._insert(s._conn, row)
+        return [first_id + i for i in range(len(books))]
+
+    @store_op
+    def get_by_id(self, book_id: str) -> Optional[dict[str, Any]]:
+        return self._view().get_by_id(book_id)
+
+    @store_op
+    def all_rows(self) -> list[dict[str, Any]]:
+        """Todas las filas, en orden de id."""
+        return [self._row_to_dict(r) for r in self._conn().execute("SELECT * FROM books ORDER BY id")]
+
+    @store_op
+    def find_by_isbn(self, isbn: str) -> list[dict[str, Any]]:
+        """Coincidencia exacta de ISBN ignorando guiones, espacios y mayúsculas."""
+        return self._view().find_by_isbn(isbn)
+
+    @store_op
+    def find(self, criteria: dict[str, str], limit: int = 20, fuzzy: bool = True) -> list[dict[str, Any]]:
+        """
+        Misma semántica que ExcelStore.find: subcadena sin tildes ni
+        mayúsculas ordenada por ajuste al campo y, si no hay nada y `fuzzy`,
+        parecido por trigramas en las columnas de texto.
+        """
+        return self._view().find(criteria, limit=limit, fuzzy=fuzzy)
+
+    @store_op
+    def find_ids(self, criteria: dict[str, str], limit: int = FIND_MAX_IDS, fuzzy: bool = True) -> list[Any]:
+        """Ids de find() en el mismo orden, sin el tope de 50 (para paginar)."""
+        return self._view().find_ids(criteria, limit=limit, fuzzy=fuzzy)
+
+    @store_op
+    def get_many(self, ids: list[Any]) -> list[dict[str, Any]]:
+        """Filas de `ids` en ese orden; las que ya no existen se saltan."""
+        return self._view().get_many(ids)
+
+    @store_op
+    def last(self, n: int = 10) -> list[dict[str, Any]]:
+        return self._view().last(n)
+
+    @store_op
+    def update_fields(self, book_id: str, changes: dict[str, Any]) -> Optional[dict[str, Any]]:
+        """
+        changes usa keys internas: titulo, autor, editorial, ano, fila, columna, isbn
+        - strings: "" para vaciar
+        - ints: null para vaciar
+        Devuelve la fila ya actualizada, o None si no existe el libro.
+        """
+        with self.session() as s:
+            return s.update_fields(book_id, changes)
+
+    @store_op
+    def delete(self, book_id: Any) -> bool:
+        """Borrado sin mover ids, como ExcelStore.delete."""
+        with self.session() as s:
+            return s.delete(book_id)
+
+    @store_op
+    def compact_ids(self) -> int:
+        """
+        Renumera los ids a 1..n en orden y olvida los borrados, como
+        ExcelStore.compact_ids. Devuelve cuántos ids borrados había.
+        """
+        with self.session() as s:
+            conn = s._conn
+            n = conn.execute("SELECT COUNT(*) FROM tombstones").fetchone()[0]
+            if not n:
+                return 0
+            conn.execute("CREATE TEMP TABLE renumber (old INTEGER PRIMARY KEY, new INTEGER)")
+            try:
+                conn.execute(
+                    "INSERT INTO renumber SELECT id, ROW_NUMBER() OVER (ORDER BY id) FROM books"
+                )
+                # en dos pasos (negativos) para no chocar con la clave primaria
+                conn.execute(
+                    "UPDATE books SET id = -(SELECT new FROM renumber WHERE old = books.id) "
+                    "WHERE id IN (SELECT old FROM renumber WHERE old != new)"
+                )
+                conn.execute("UPDATE books SET id = -id WHERE id < 0")
+                conn.execute("DELETE FROM tombstones")
+            finally:
+                conn.execute("DROP TABLE temp.renumber")
+            return n
+
+    @store_op
+    def delete_and_compact(self, book_id: int) -> bool:
+        """
+        Borra el libro y desplaza los ids posteriores para mantener
+        id = (fila_excel - 1), como ExcelStore.
+        """
+        with self.session() as s:
+            return s.delete_and_compact(book_id)
+
+
+def _int_id(book_id: Any) -> Optional[int]:
+    k = _id_key(book_id)
+    if k is None or not k.lstrip("-").isdigit():
+        return None
+    return int(k)
+
+
+class SQLiteSession:
+    """Operaciones sobre una conexión de SQLiteStore; misma API que ExcelSession."""
+
+    def __init__(self, store: SQLiteStore, conn: sqlite3.Connection):
+        self._store = store
+        self._conn = conn
+
+    def _next_id(self) -> int:
+        # los ids borrados tampoco se reutilizan
+        return self._conn.execute(
+            "SELECT MAX(COALESCE((SELECT MAX(id) FROM books), 0),"
+            " COALESCE((SELECT MAX(id) FROM tombstones), 0)) + 1"
+        ).fetchone()[0]
+
+    # ---------- lecturas ----------
+
+    def get_by_id(self, book_id: Any) -> Optional[dict[str, Any]]:
+        k = _int_id(book_id)
+        if k is None:
+            return None
+        row = self._conn.execute("SELECT * FROM books WHERE id = ?", (k,)).fetchone()
+        return None if row is None else SQLiteStore._row_to_dict(row)
+
+    def find_by_isbn(self, isbn: str) -> list[dict[str, Any]]:
+        k = _isbn_key(isbn)
+        if k is None:
+            return []
+        rows = self._conn.execute("SELECT * FROM books WHERE isbn_key = ? ORDER BY id", (k,))
+        return [SQLiteStore._row_to_dict(r) for r in rows]
+
+    def get_many(self, ids: list[Any]) -> list[dict[str, Any]]:
+        keys = [k for k in (_int_id(book_id) for book_id in ids) if k is not None]
+        if not keys:
+            return []
+        marks = ", ".join("?" * len(keys))
+        rows = self._conn.execute(f"SELECT * FROM books WHERE id IN ({marks})", keys)
+        by_id = {r["id"]: SQLiteStore._row_to_dict(r) for r in rows}
+        return [by_id[k] for k in keys if k in by_id]
+
+    def find(self, criteria: dict[str, str], limit: int = 20, fuzzy: bool = True) -> list[dict[str, Any]]:
+        return self._find(criteria, max(1, min(int(limit), FIND_MAX_ROWS)), fuzzy)
+
+    def find_ids(self, criteria: dict[str, str], limit: int = FIND_MAX_IDS, fuzzy: bool = True) -> list[Any]:
+        rows = self._find(criteria, max(1, min(int(limit), FIND_MAX_IDS)), fuzzy)
+        return [r["id"] for r in rows]
+
+    def _find(self, criteria: dict[str, str], limit: int, fuzzy: bool) -> list[dict[str, Any]]:
+        crit = {k: _fold(v.strip()) for k, v in criteria.items() if v and v.strip()}
+        if not crit:
+            return []
+        if any(k not in KEY_TO_COLUMN for k in crit):
+            return []
+
+        text_crit = {KEY_TO_COLUMN[k]: n for k, n in crit.items() if KEY_TO_COLUMN[k] in TEXT_COLUMNS}
+        filters = {KEY_TO_COLUMN[k]: n for k, n in crit.items() if KEY_TO_COLUMN[k] not in TEXT_COLUMNS}
+
+        where: list[str] = []
+        params: list[Any] = []
+        for col, needle in filters.items():
+            where.append(f"instr(lower(CAST(b.{col} AS TEXT)), ?) > 0")
+            params.append(needle)
+        filter_sql = " AND ".join(where) or "1"
+        filter_params = list(params)
+
+        # 1) subcadena: FTS5 si la consulta tiene trigramas, instr si es corta
+        match = [_fts_phrase(f"{col}_f", n) for col, n in text_crit.items() if len(n) >= 3]
+        if match:
+            where.append("b.id IN (SELECT rowid FROM books_fts WHERE books_fts MATCH ?)")
+            params.append(" AND ".join(match))
+        for col, needle in text_crit.items():
+            where.append(f"instr(b.{col}_f, ?) > 0")
+            params.append(needle)
+
+        order = "b.id"
+        if text_crit:
+            tight = " + ".join(
+                f"{len(n)} * 1.0 / max(length(trim(b.{col}_f)), 1)" for col, n in text_crit.items()
+            )
+            order = f"{tight} DESC, b.id"
+
+        sql = f"SELECT b.* FROM books b WHERE {' AND '.join(where) or '1'} ORDER BY {order} LIMIT ?"
+        params.append(limit)
+
+        conn = self._conn
+        rows = conn.execute(sql, params).fetchall()
+        if rows or not fuzzy or not text_crit:
+            return [SQLiteStore._row_to_dict(r) for r in rows]
+
+        # 2) aproximadas: fracción de trigramas de " consulta " por fila
+        scores: Optional[dict[int, float]] = None
+        for col, needle in text_crit.items():
+            grams = _trigrams(f" {needle} ")
+            if not grams:
+                return []
+            hits: dict[int, int] = {}
+            for g in grams:
+                q = _fts_phrase(f"{col}_f", g)
+                for (rid,) in conn.execute("SELECT rowid FROM books_fts WHERE books_fts MATCH ?", (q,)):
+                    hits[rid] = hits.get(rid, 0) + 1
+            sc = {rid: n / len(grams) for rid, n in hits.items() if n / len(grams) >= FUZZY_MIN_SCORE}
+            scores = sc if scores is None else {r: v + scores[r] for r, v in sc.items() if r in scores}
+            if not scores:
+                return []
+
+        ranked = sorted(scores, key=lambda rid: (-scores[rid], rid))
+        out: list[dict[str, Any]] = []
+        for rid in ranked:
+            row = conn.execute(
+                f"SELECT * FROM books b WHERE b.id = ? AND {filter_sql}", [rid, *filter_params]
+            ).fetchone()
+            if row is not None:
+                out.append(SQLiteStore._row_to_dict(row))
+                if len(out) >= limit:
+                    break
+        return out
+
+    def last(self, n: int = 10) -> list[dict[str, Any]]:
+        n = max(1, min(int(n), 200))
+        rows = self._conn.execute("SELECT * FROM books ORDER BY id DESC LIMIT ?", (n,)).fetchall()
+        return [SQLiteStore._row_to_dict(r) for r in reversed(rows)]
+
+    def resolve_ref(self, ref: Any) -> Optional[Any]:
+        with span("ref"):
+            return resolve_ref(self, ref)
+
+    # ---------- escrituras (dentro de SQLiteStore.session) ----------
+
+    def add(self, book: dict[str, Any]) -> dict[str, Any]:
+        new_id = self._next_id()
+
+        row = {h: "" for h in HEADERS}
+        row["id"] = new_id
+        row["Título"] = book.get("titulo", "") or ""
+        row["Autor"] = book.get("autor", "") or ""
+        row["Editorial"] = book.get("editorial", "") or ""
+        row["Año"] = book.get("ano", None)
+        row["Columna"] = book.get("columna", None)
+        row["Fila"] = book.get("fila", None)
+        row["ISBN"] = book.get("isbn", "") or ""
+
+        self._store._insert(self._conn, row)
+        return self.get_by_id(new_id)
+
+    def update_fields(self, book_id: Any, changes: dict[str, Any]) -> Optional[dict[str, Any]]:
+        k = _int_id(book_id)
+        if k is None:
+            return None
+
+        values = {COLUMNS[h]: v for h, v in _coerce_changes(changes).items()}
+
+        row = self._conn.execute("SELECT * FROM books WHERE id = ?", (k,)).fetchone()
+        if row is None:
+            return None
+
+        if values:
+            merged = {col: row[col] for col in COLUMNS.values()}
+            merged.update(values)
+            values.update(SQLiteStore._derived(merged))
+            sets = ", ".join(f"{c} = :{c}" for c in values)
+            self._conn.execute(f"UPDATE books SET {sets} WHERE id = :_id", {**values, "_id": k})
+        return self.get_by_id(k)
+
+    def delete(self, book_id: Any) -> bool:
+        k = _int_id(book_id)
+        if k is None:
+            return False
+
+        cur = self._conn.execute("DELETE FROM books WHERE id = ?", (k,))
+        if cur.rowcount == 0:
+            return False
+        self._conn.execute(
+            "INSERT OR REPLACE INTO tombstones (id, borrado) VALUES (?, ?)",
+            (k, date.today().strftime("%d/%m/%Y")),
+        )
+        return True
+
+    def delete_and_compact(self, book_id: Any) -> bool:
+        k = _int_id(book_id)
+        if k is None:
+            return False
+
+        cur = self._conn.execute("DELETE FROM books WHERE id = ?", (k,))
+        if cur.rowcount == 0:
+            return False
+        # en dos pasos para no chocar con la clave primaria a mitad del UPDATE
+        for table in ("books", "tombstones"):
+            self._conn.execute(f"UPDATE {table} SET id = -(id - 1) WHERE id > ?", (k,))
+            self._conn.execute(f"UPDATE {table} SET id = -id WHERE id < 0")
+        return True
+
+
+if __name__ == "__main__":
+    # Uso:
+    #   python -m telegram_excel_bot.sqlite_store import catalogo.xlsx Hoja1 catalogo.sqlite3
+    #   python -m telegram_excel_bot.sqlite_store export catalogo.sqlite3 salida.xlsx
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "import" and len(sys.argv) == 5:
+        n = SQLiteStore(sys.argv[4]).import_xlsx(sys.argv[2], sys.argv[3])
+        print(f"Importados {n} libros en {sys.argv[4]}")
+    elif cmd == "export" and len(sys.argv) == 4:
+        SQLiteStore(sys.argv[2]).export_xlsx(sys.argv[3])
+        print(f"Exportado a {sys.argv[3]}")
+    else:
+        print("Uso: import <xlsx> <hoja> <db> | export <db> <xlsx>")
+        sys.exit(2)
@@ -0,0 +1,211 @@
+"""
+Trazas por update: en qué se fue el tiempo de una petición.
+
+Cada update recibe un trace id (lo abre FairUpdateProcessor) y las etapas
+por las que pasa apuntan un span con su inicio y duración:
+
+    queue          espera en la cola de su chat antes de empezar
+    download       descarga de la nota de voz
+    transcription  nota de voz -> texto
+    llm            texto -> acción (caché o LLM); llm_api, cada petición
+                   al API con su módulo de prompt y sus tokens
+    ref            resolver la referencia a un id
+    store.<op>     operación del store, con lo que esperó en su cola
+    lock           conseguir el lock del catálogo (o BEGIN en SQLite)
+    store_open     snapshot del catálogo (recarga del Excel si cambió)
+    mutation       diario + memoria (Excel)
+    save           wb.save / COMMIT
+    reply          llamadas a la Bot API (sendMessage, sendDocument...; ver
+                   TracedRequest en bot.py)
+
+La traza va en un ContextVar, así que sigue a la tarea del update; los
+hilos del store la reciben copiando el contexto al encolar (AsyncExcelStore).
+Fuera de una traza (compactador, scripts) span() no hace nada.
+
+Las trazas que tardan más de `slow_ms` se escriben, una por línea en JSON,
+en un fichero rotativo (configure()). Para resumirlas:
+
+    python -m telegram_excel_bot.tracing report catalogo.traces.jsonl
+"""
+import json
+import logging
+import secrets
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from typing import Any, Iterator, Optional
+
+log = logging.getLogger("catalogo-bot")
+
+
+class Trace:
+    __slots__ = ("trace_id", "name", "attrs", "t0", "started", "spans")
+
+    def __init__(self, name: str, attrs: dict[str, Any], start: Optional[float] = None):
+        now = time.perf_counter()
+        self.trace_id = secrets.token_hex(6)
+        self.name = name
+        self.attrs = attrs
+        self.t0 = now if start is None else start
+        self.started = datetime.fromtimestamp(time.time() - (now - self.t0)).isoformat(timespec="milliseconds")
+        # se añade desde el loop y desde los hilos del store: list.append es atómico
+        self.spans: list[dict[str, Any]] = []
+
+    def add(self, name: str, start: float, seconds: float, **attrs: Any) -> None:
+        self.spans.append({
+            "name": name,
+            "start_ms": round((start - self.t0) * 1000, 2),
+            "ms": round(seconds * 1000, 2),
+            **attrs,
+        })
+
+    def to_dict(self, total: float) -> dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started": self.started,
+            "total_ms": round(total * 1000, 2),
+            **self.attrs,
+            "spans": sorted(self.spans, key=lambda s: s["start_ms"]),
+        }
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+# destino de las trazas lentas (configure); None = no se escriben
+_slow_ms: float = 0.0
+_writer: Optional[logging.Logger] = None
+
+
+def configure(path: str, slow_ms: float, max_bytes: int = 5 * 1024 * 1024, backups: int = 3) -> None:
+    """Trazas de más de `slow_ms` a `path` (JSONL que rota al pasar de `max_bytes`)."""
+    global _slow_ms, _writer
+    writer = logging.getLogger("catalogo-bot.traces")
+    writer.propagate = False
+    writer.setLevel(logging.INFO)
+    for h in list(writer.handlers):
+        writer.removeHandler(h)
+        h.close()
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    writer.addHandler(handler)
+    _slow_ms, _writer = slow_ms, writer
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+def current_id() -> Optional[str]:
+    t = _current.get()
+    return t.trace_id if t is not None else None
+
+
+@contextmanager
+def trace(name: str, start: Optional[float] = None, **attrs: Any) -> Iterator[Trace]:
+    """
+    Abre una traza nueva para el bloque (p. ej. un update). `start`
+    (time.perf_counter()) la hace empezar antes, p. ej. al llegar el update.
+    """
+    t = Trace(name, attrs, start)
+    token = _current.set(t)
+    try:
+        yield t
+    finally:
+        _current.reset(token)
+        _finish(t)
+
+
+def _finish(t: Trace) -> None:
+    total = time.perf_counter() - t.t0
+    if _writer is None or total * 1000 < _slow_ms:
+        return
+    log.warning("Traza lenta %s: %.0f ms", t.trace_id, total * 1000)
+    try:
+        _writer.info(json.dumps(t.to_dict(total), ensure_ascii=False, default=str))
+    except Exception:
+        log.exception("No se pudo escribir la traza %s", t.trace_id)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[None]:
+    """Mide el bloque como una etapa de la traza en curso (sin traza, nada)."""
+    t = _current.get()
+    if t is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        t.add(name, start, time.perf_counter() - start, **attrs)
+
+
+def add_span(name: str, start: float, seconds: float, **attrs: Any) -> None:
+    """Etapa ya medida (start = time.perf_counter() de su inicio)."""
+    t = _current.get()
+    if t is not None:
+        t.add(name, start, seconds, **attrs)
+
+
+def annotate(**attrs: Any) -> None:
+    """Datos de la traza en curso (op, origen de la acción...)."""
+    t = _current.get()
+    if t is not None:
+        t.attrs.update(attrs)
+
+
+# ---------- informe ----------
+
+def _pct(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def report(paths: list[str], top: int = 10) -> str:
+    """Por etapa: veces, p50/p95 y parte del total; y las trazas más lentas."""
+    traces = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            traces += [json.loads(line) for line in f if line.strip()]
+    if not traces:
+        return "Sin trazas."
+
+    per_stage: dict[str, list[float]] = {}
+    for t in traces:
+        sums: dict[str, float] = {}
+        for s in t["spans"]:
+            stage = s["name"].split(".", 1)[0]
+            sums[stage] = sums.get(stage, 0.0) + s["ms"]
+        for stage, ms in sums.items():
+            per_stage.setdefault(stage, []).append(ms)
+
+    grand = sum(t["total_ms"] for t in traces)
+    lines = [f"{len(traces)} trazas, total p50 {_pct([t['total_ms'] for t in traces], 0.5):.0f} ms, "
+             f"p95 {_pct([t['total_ms'] for t in traces], 0.95):.0f} ms", ""]
+    lines.append(f"{'etapa':14} {'trazas':>6} {'p50 ms':>8} {'p95 ms':>8} {'% total':>8}")
+    for stage, values in sorted(per_stage.items(), key=lambda kv: -sum(kv[1])):
+        lines.append(f"{stage:14} {len(values):6d} {_pct(values, 0.5):8.0f} {_pct(values, 0.95):8.0f} "
+                     f"{100 * sum(values) / grand:7.1f}%")
+
+    lines.append("(las etapas se solapan: store incluye lock, store_open, ref, mutation y save; llm incluye llm_api)")
+    lines += ["", "más lentas:"]
+    for t in sorted(traces, key=lambda t: -t["total_ms"])[:top]:
+        worst = max(t["spans"], key=lambda s: s["ms"], default=None)
+        where = f"{worst['name']} {worst['ms']:.0f} ms" if worst else "-"
+        lines.append(f"  {t['trace_id']}  {t['total_ms']:7.0f} ms  op={t.get('op', '-')}  peor: {where}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str]) -> None:
+    if len(argv) < 2 or argv[0] != "report":
+        print("uso: python -m telegram_excel_bot.tracing report trazas.jsonl [más.jsonl...]")
+        sys.exit(2)
+    print(report(argv[1:]))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
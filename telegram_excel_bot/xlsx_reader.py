@@ -0,0 +1,226 @@
+"""
+Lector rápido de una hoja .xlsx a tuplas de valores.
+
+openpyxl, incluso en modo read_only, crea y valida un objeto por celda y por
+texto enriquecido; para cargar el catálogo entero solo hacen falta los
+valores. Aquí se abre el zip y se recorre el XML de la hoja con iterparse,
+resolviendo cadenas compartidas, números, booleanos y fechas (según el
+formato de celda) igual que openpyxl.
+
+Cualquier cosa que no sepa reproducir exactamente (fórmulas, fechas ISO,
+XML inesperado) lanza UnsupportedSheet y el llamante debe usar openpyxl.
+"""
+import posixpath
+import zipfile
+from typing import Any, Iterator, Optional
+from xml.etree.ElementTree import iterparse
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel
+
+
+NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+ROW = NS + "row"
+CELL = NS + "c"
+VALUE = NS + "v"
+FORMULA = NS + "f"
+INLINE = NS + "is"
+TEXT = NS + "t"
+RUN = NS + "r"
+
+
+class UnsupportedSheet(Exception):
+    """La hoja usa algo que este lector no reproduce igual que openpyxl."""
+
+
+def _text_of(node: Any) -> str:
+    """Texto de un <si>/<is>: <t> directo + <t> de cada <r> (sin rPh)."""
+    parts = []
+    for child in node:
+        if child.tag == TEXT:
+            parts.append(child.text or "")
+        elif child.tag == RUN:
+            t = child.find(TEXT)
+            if t is not None and t.text is not None:
+                parts.append(t.text)
+    return "".join(parts)
+
+
+def _col_index(ref: str) -> int:
+    """"AB12" -> 28 (1-based)."""
+    n = 0
+    for ch in ref:
+        if "A" <= ch <= "Z":
+            n = n * 26 + ord(ch) - 64
+        else:
+            break
+    return n
+
+
+def _row_index(ref: str) -> int:
+    i = 0
+    while i < len(ref) and ref[i].isalpha():
+        i += 1
+    return int(ref[i:])
+
+
+def _cast_number(v: str) -> Any:
+    if "." in v or "E" in v or "e" in v:
+        return float(v)
+    return int(v)
+
+
+class _Book:
+    def __init__(self, zf: zipfile.ZipFile):
+        self.zf = zf
+        names = set(zf.namelist())
+
+        # hojas: nombre -> ruta dentro del zip
+        rels = {}
+        for _, el in iterparse(zf.open("xl/_rels/workbook.xml.rels")):
+            if el.tag == PKG_REL_NS + "Relationship":
+                target = el.get("Target", "")
+                if target.startswith("/"):
+                    path = target[1:]
+                else:
+                    path = posixpath.normpath(posixpath.join("xl", target))
+                rels[el.get("Id")] = path
+
+        self.sheets: dict[str, str] = {}
+        self.epoch = CALENDAR_WINDOWS_1900
+        for _, el in iterparse(zf.open("xl/workbook.xml")):
+            if el.tag == NS + "sheet":
+                self.sheets[el.get("name")] = rels.get(el.get(REL_NS + "id"), "")
+            elif el.tag == NS + "workbookPr" and el.get("date1904") in ("1", "true"):
+                self.epoch = CALENDAR_MAC_1904
+
+        self.shared: list[str] = []
+        if "xl/sharedStrings.xml" in names:
+            for _, el in iterparse(zf.open("xl/sharedStrings.xml")):
+                if el.tag == NS + "si":
+                    self.shared.append(_text_of(el).replace("x005F_", ""))
+                    el.clear()
+
+        # estilos de celda con formato de fecha / duración
+        self.date_styles: set[int] = set()
+        self.timedelta_styles: set[int] = set()
+        if "xl/styles.xml" in names:
+            custom: dict[int, str] = {}
+            xfs: list[int] = []
+            in_cell_xfs = False
+            for event, el in iterparse(zf.open("xl/styles.xml"), events=("start", "end")):
+                if el.tag == NS + "cellXfs":
+                    in_cell_xfs = event == "start"
+                elif event == "end" and el.tag == NS + "numFmt":
+                    custom[int(el.get("numFmtId"))] = el.get("formatCode", "")
+                elif event == "end" and el.tag == NS + "xf" and in_cell_xfs:
+                    xfs.append(int(el.get("numFmtId", 0)))
+            for style_id, fmt_id in enumerate(xfs):
+                code = custom.get(fmt_id, BUILTIN_FORMATS.get(fmt_id))
+                if code and is_date_format(code):
+                    self.date_styles.add(style_id)
+                    if is_timedelta_format(code):
+                        self.timedelta_styles.add(style_id)
+
+    def cell_value(self, c: Any) -> Any:
+        if c.find(FORMULA) is not None:
+            raise UnsupportedSheet("fórmulas")
+
+        t = c.get("t", "n")
+        if t == "inlineStr":
+            node = c.find(INLINE)
+            return None if node is None else _text_of(node)
+
+        v = c.findtext(VALUE) or None
+        if v is None:
+            return None
+        if t == "n":
+            value = _cast_number(v)
+            style = int(c.get("s", 0))
+            if style in self.date_styles:
+                try:
+                    return from_excel(value, self.epoch, timedelta=style in self.timedelta_styles)
+                except (OverflowError, ValueError):
+                    raise UnsupportedSheet("fecha fuera de rango")
+            return value
+        if t == "s":
+            return self.shared[int(v)]
+        if t == "b":
+            return bool(int(v))
+        if t in ("str", "e"):
+            return v
+        raise UnsupportedSheet(f"tipo de celda {t}")
+
+    def rows(self, sheet_path: str) -> Iterator[tuple]:
+        """
+        Tuplas de valores desde la fila 1 hasta la última fila con celdas,
+        con tuplas vacías para las filas que faltan (como ws.iter_rows).
+        """
+        next_row = 1
+        pending_empty = 0
+        sheet_data = None
+        for event, el in iterparse(self.zf.open(sheet_path), events=("start", "end")):
+            if event == "start":
+                if el.tag == NS + "sheetData":
+                    sheet_data = el
+                continue
+            if el.tag != ROW:
+                continue
+
+            r_attr = el.get("r")
+            r = int(r_attr) if r_attr else next_row
+            values: list[Any] = []
+            col = 0
+            for c in el.iter(CELL):
+                ref = c.get("r")
+                col = _col_index(ref) if ref else col + 1
+                if ref and _row_index(ref) != r:
+                    raise UnsupportedSheet("celda fuera de su fila")
+                if col > len(values):
+                    values.extend([None] * (col - len(values)))
+                values[col - 1] = self.cell_value(c)
+
+            if values:
+                # filas intermedias sin celdas
+                pending_empty += r - next_row
+                for _ in range(pending_empty):
+                    yield ()
+                pending_empty = 0
+                yield tuple(values)
+            else:
+                # fila sin celdas: solo cuenta si luego hay otra con celdas
+                pending_empty += r - next_row + 1
+            next_row = r + 1
+
+            if sheet_data is not None:
+                sheet_data.clear()
+
+
+def read_sheet(path: str, sheet: str) -> Optional[list[tuple]]:
+    """
+    Todas las filas de `sheet` como tuplas (fila 1 = cabecera), o None si la
+    hoja no existe. Lanza UnsupportedSheet si hay que recurrir a openpyxl.
+    """
+    try:
+        with zipfile.ZipFile(path) as zf:
+            book = _Book(zf)
+            if sheet not in book.sheets:
+                return None
+            return list(book.rows(book.sheets[sheet]))
+    except (KeyError, ValueError, zipfile.BadZipFile) as e:
+        raise UnsupportedSheet(str(e)) from e
+
+
+def defined_name(path: str, name: str) -> Optional[str]:
+    """Texto de un nombre definido del libro (no de hoja), o None si no está."""
+    try:
+        with zipfile.ZipFile(path) as zf:
+            for _, el in iterparse(zf.open("xl/workbook.xml")):
+                if el.tag == NS + "definedName" and el.get("name") == name and el.get("localSheetId") is None:
+                    return (el.text or "").strip()
+    except (KeyError, zipfile.BadZipFile):
+        return None
+    return None